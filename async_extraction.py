@@ -0,0 +1,456 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import re
+import threading
+import pandas as pd
+from data_extraction import CONFIG_PATH, DataExtractor
+from instrumentation import instrument_class
+
+# Size of the chunks the response bodies are read and decoded in
+CHUNK_SIZE = 1024 ** 2
+
+# Responses retried with exponential backoff, as by the Retry of DataExtractor._create_session
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+WHITESPACE = re.compile(r'\s*')
+
+# The event loop shared by every AsyncDataExtractor, running on its own thread
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Return the event loop shared by every HTTP source, starting it on a daemon thread on first use.
+
+    The pipeline stages run on worker threads and submit their requests to this one loop, so the
+    requests of the network-bound stages, e.g. the stores and the dates, overlap on it.
+
+    Returns:
+    asyncio.AbstractEventLoop: The running shared loop.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='http-event-loop', daemon=True).start()
+        return _loop
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine on the shared event loop and wait for its result from the calling thread.
+
+    Parameters:
+    coroutine (coroutine): The coroutine to run.
+
+    Returns:
+    object: The result of the coroutine. Its exceptions are raised in the calling thread.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+class FetchError:
+    def __init__(self, url, kind, message, status=None, attempts=1, retry_after=None):
+        """
+        Describe a request that failed after its retries, instead of a silent None or empty DataFrame.
+
+        Parameters:
+        url (str): The requested URL.
+        kind (str): 'timeout', 'connection', 'http' for an error status, or 'decode' for an invalid body.
+        message (str): The error message.
+        status (int): The HTTP status of an 'http' error. Defaults to None.
+        attempts (int): The number of attempts made. Defaults to 1.
+        retry_after (float): The seconds to wait before retrying, from the Retry-After header. Defaults to None.
+        """
+        self.url = url
+        self.kind = kind
+        self.message = message
+        self.status = status
+        self.attempts = attempts
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {'url': self.url, 'kind': self.kind, 'status': self.status, 'attempts': self.attempts, 'message': self.message}
+
+    def __repr__(self):
+        status = f' {self.status}' if self.status is not None else ''
+        return f"FetchError({self.kind}{status} {self.url} after {self.attempts} attempts: {self.message})"
+
+
+class ExtractionError(Exception):
+    def __init__(self, error):
+        """
+        Raised when a whole source could not be extracted, e.g. the number of stores or the date JSON.
+
+        Parameters:
+        error (FetchError): The failed request.
+        """
+        super().__init__(repr(error))
+        self.error = error
+
+
+class StreamingJSONDecoder:
+    def __init__(self):
+        """
+        Decode a JSON document whose top level is an object or an array as its text arrives, one member at a time.
+
+        Each member of the top-level object, e.g. one column of date_details.json, or each item of the top-level
+        array is returned as soon as its text is complete, so the whole document is never held as text and as
+        decoded values at the same time.
+        """
+        self._decoder = json.JSONDecoder()
+        self._chunks = []
+        self._size = 0
+        self._buffer = ''
+        self._container = None
+        self._state = 'start'
+        self._key = None
+        # An incomplete member is decoded again only once a closing bracket has arrived and the buffer has
+        # doubled, so large members are not re-scanned for every chunk
+        self._retry_size = 0
+
+    def feed(self, text):
+        """
+        Add text to the document.
+
+        Parameters:
+        text (str): The next part of the document.
+
+        Returns:
+        list: The members completed by the text, (key, value) pairs for an object or values for an array.
+        """
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size < self._retry_size or ('}' not in text and ']' not in text):
+            return []
+        return self._decode(final=False)
+
+    def close(self):
+        """
+        End the document.
+
+        Returns:
+        list: The remaining members.
+        """
+        members = self._decode(final=True)
+        if self._state != 'done':
+            raise ValueError('The JSON document is incomplete or its top level is not an object or an array.')
+        return members
+
+    @property
+    def container(self):
+        """
+        The type of the top-level value, dict or list, once its first character has been read.
+        """
+        return {'{': dict, '[': list}.get(self._container)
+
+    def _decode(self, final):
+        """
+        Decode the complete members in the buffer.
+        """
+        if self._chunks:
+            self._buffer += ''.join(self._chunks)
+            self._chunks = []
+        buffer = self._buffer
+        position = 0
+        members = []
+
+        while self._state != 'done':
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            char = buffer[position]
+
+            if self._state == 'start':
+                if char not in '{[':
+                    raise ValueError(f"Expected an object or an array at the top level of the JSON document, got '{char}'.")
+                self._container = char
+                self._state = 'first'
+                position += 1
+            elif self._state in ('first', 'next') and char in '}]':
+                self._state = 'done'
+                position += 1
+            elif self._state == 'next':
+                if char != ',':
+                    raise ValueError(f"Expected ',' between the members of the JSON document, got '{char}'.")
+                self._state = 'member'
+                position += 1
+            elif self._container == '{' and self._key is None:
+                if char != '"':
+                    raise ValueError(f"Expected a key in the JSON document, got '{char}'.")
+                try:
+                    key, end = self._decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                end = WHITESPACE.match(buffer, end).end()
+                if end == len(buffer):
+                    break
+                if buffer[end] != ':':
+                    raise ValueError(f"Expected ':' after the key '{key}' in the JSON document.")
+                self._key = key
+                position = end + 1
+            else:
+                try:
+                    value, end = self._decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                # A number or a literal ending the buffer may continue in the next chunk
+                if end == len(buffer) and not final and not isinstance(value, (dict, list, str)):
+                    break
+                members.append((self._key, value) if self._container == '{' else value)
+                self._key = None
+                self._state = 'next'
+                position = end
+
+        self._buffer = buffer[position:]
+        self._size = len(self._buffer)
+        self._retry_size = 2 * self._size
+        return members
+
+
+def _json_members_to_frame(container, members):
+    """
+    Build the DataFrame of a decoded JSON document, as pandas.DataFrame(json.loads(content)) would.
+    """
+    if container is dict:
+        return pd.DataFrame(dict(members))
+    return pd.DataFrame(members)
+
+
+@instrument_class
+class AsyncDataExtractor(DataExtractor):
+    def __init__(self, db_connector=None, cache=None, config_path=CONFIG_PATH, api_key=None, max_connections=20,
+                 max_connections_per_host=10, timeout=60, retries=3, backoff_factor=0.5):
+        """
+        Initialise a DataExtractor whose HTTP sources, the store API and the date JSON, are fetched with aiohttp
+        on the event loop shared by every stage. The PDF, S3 and RDS sources are extracted as by DataExtractor.
+
+        A request that fails after its retries is recorded as a FetchError in errors. A store that cannot be
+        fetched is left out, and a source that cannot be fetched at all raises ExtractionError, instead of
+        returning None or an empty DataFrame.
+
+        Parameters:
+        db_connector (DatabaseConnector): An instance of the DatabaseConnector class.
+        cache (SourceCache): Optional on-disk cache of the parsed PDF, JSON and S3 sources.
+        config_path (str): The YAML configuration file holding the API key. Defaults to config.yml.
+        api_key (str): The API key, instead of reading it from the configuration file. Defaults to None.
+        max_connections (int): The number of connections open at once over every host. Defaults to 20.
+        max_connections_per_host (int): The number of connections open at once to one host. Defaults to 10.
+        timeout (float): The total timeout of a request in seconds. Defaults to 60.
+        retries (int): The number of retries on timeouts, connection errors, 429 and 5xx responses. Defaults to 3.
+        backoff_factor (float): The exponential backoff factor between retries. Defaults to 0.5.
+        """
+        super().__init__(db_connector, cache=cache, config_path=config_path, api_key=api_key)
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.errors = []
+        self._errors_lock = threading.Lock()
+        self._session = None
+
+    def _record_error(self, error):
+        """
+        Record a failed request.
+        """
+        with self._errors_lock:
+            self.errors.append(error)
+
+    def error_summary(self):
+        """
+        Summarise the requests that failed after their retries.
+
+        Returns:
+        pandas.DataFrame: One row per failed request with its URL, kind, status, attempts and message.
+        """
+        with self._errors_lock:
+            errors = list(self.errors)
+        return pd.DataFrame([error.to_dict() for error in errors], columns=['url', 'kind', 'status', 'attempts', 'message'])
+
+    async def _get_session(self):
+        """
+        Return the aiohttp session of the extractor, creating it on the shared loop on first use. The
+        connector of the session bounds the connections open at once over every stage using the extractor.
+        """
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _request(self, url, read, headers=None):
+        """
+        Send a GET request, retrying timeouts, connection errors, 429 and 5xx responses with exponential backoff.
+
+        Parameters:
+        url (str): The URL to request.
+        read (coroutine function): Called with the response, returns the result, e.g. the decoded JSON.
+        headers (dict): The request headers. Defaults to None.
+
+        Returns:
+        tuple: The result and None, or None and the FetchError of the last attempt.
+        """
+        import aiohttp
+
+        session = await self._get_session()
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(error.retry_after if error.retry_after is not None else self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status >= 400:
+                        retry_after = response.headers.get('Retry-After', '')
+                        error = FetchError(url, 'http', response.reason or '', status=response.status, attempts=attempt + 1,
+                                           retry_after=float(retry_after) if retry_after.isdigit() else None)
+                        if response.status in RETRY_STATUSES:
+                            continue
+                        break
+                    return await read(response), None
+            except asyncio.TimeoutError:
+                error = FetchError(url, 'timeout', f'No response within {self.timeout}s.', attempts=attempt + 1)
+            except aiohttp.ClientError as e:
+                error = FetchError(url, 'connection', f'{type(e).__name__}: {e}', attempts=attempt + 1)
+            except ValueError as e:
+                # An invalid body is not retried
+                return None, FetchError(url, 'decode', f'{type(e).__name__}: {e}', attempts=attempt + 1)
+        return None, error
+
+    async def _read_json(self, response):
+        """
+        Decode a small JSON response.
+        """
+        return json.loads(await response.read())
+
+    async def _list_number_of_stores(self, store_endpoint):
+        data, error = await self._request(store_endpoint, self._read_json, headers=self.headers)
+        if error is None and not (isinstance(data, dict) and 'number_stores' in data):
+            error = FetchError(store_endpoint, 'decode', "The response has no 'number_stores'.")
+        if error is not None:
+            self._record_error(error)
+            raise ExtractionError(error)
+        return data['number_stores']
+
+    async def _retrieve_stores_data(self, store_data_endpoint, number_stores_endpoint, snapshot=None):
+        number_of_stores = await self._list_number_of_stores(number_stores_endpoint)
+        # The API numbers the stores from 0
+        store_numbers = range(number_of_stores)
+        if snapshot is not None:
+            store_numbers = snapshot.due(store_numbers)
+        urls = [store_data_endpoint.format(store_number=store_number) for store_number in store_numbers]
+
+        # gather returns the results in the order of the urls, the connector bounds the requests in flight
+        results = await asyncio.gather(*(self._request(url, self._read_json, headers=self.headers) for url in urls))
+        all_stores_data = []
+        for store_number, (store_details, error) in zip(store_numbers, results):
+            if error is None:
+                all_stores_data.append(store_details)
+                if snapshot is not None:
+                    snapshot.record(store_number, store_details)
+            else:
+                self._record_error(error)
+                if snapshot is not None:
+                    snapshot.record_failure(store_number, f"{error.kind} {error.status or ''}".strip())
+        if snapshot is not None:
+            snapshot.save()
+            return snapshot.to_frame()
+        return pd.DataFrame(all_stores_data)
+
+    async def _stream_json(self, response):
+        """
+        Decode a JSON response as its body streams in, hashing the raw bytes on the way for the cache.
+
+        Returns:
+        tuple: The DataFrame, the SHA-256 hash of the body, the ETag and the Last-Modified, or None if not modified.
+        """
+        if response.status == 304:
+            return None
+        sha256 = hashlib.sha256()
+        text_decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')()
+        json_decoder = StreamingJSONDecoder()
+        members = []
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            sha256.update(chunk)
+            members.extend(json_decoder.feed(text_decoder.decode(chunk)))
+        members.extend(json_decoder.feed(text_decoder.decode(b'', final=True)))
+        members.extend(json_decoder.close())
+        df = _json_members_to_frame(json_decoder.container, members)
+        return df, sha256.hexdigest(), response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    async def _extract_json_data(self, json_url, use_cache=True):
+        cache = self.cache if use_cache else None
+        validators = cache.validators(json_url) if cache is not None else {}
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        result, error = await self._request(json_url, self._stream_json, headers=headers)
+        if error is None and result is None:
+            cached_df = cache.load(json_url)
+            if cached_df is not None:
+                return cached_df
+            # The cached copy was evicted in the meantime
+            result, error = await self._request(json_url, self._stream_json)
+        if error is not None:
+            self._record_error(error)
+            raise ExtractionError(error)
+
+        df, content_hash, etag, last_modified = result
+        if cache is not None:
+            cache.store(json_url, df, content_hash, etag=etag, last_modified=last_modified)
+        return df
+
+    def list_number_of_stores(self, store_endpoint):
+        """
+        Retrieve the number of stores from the API.
+
+        Parameters:
+        store_endpoint (str): The API endpoint to retrieve the number of stores.
+
+        Returns:
+        int: The number of stores. Raises ExtractionError if it cannot be retrieved.
+        """
+        return run_coroutine(self._list_number_of_stores(store_endpoint))
+
+    def retrieve_stores_data(self, store_data_endpoint, number_stores_endpoint, snapshot=None):
+        """
+        Retrieve the details of every store concurrently on the shared event loop, at most max_connections_per_host
+        at once. The rows keep the store number order, and the stores that cannot be retrieved are recorded in errors.
+
+        Parameters:
+        store_data_endpoint (str): The API endpoint to retrieve store details.
+        number_stores_endpoint (str): The API endpoint to retrieve the number of stores.
+        snapshot (StoreSnapshot): The local snapshot of the stores fetched by earlier runs, so that only the stores
+                                  that are new, stale or due for a retry are requested. Defaults to None.
+
+        Returns:
+        pandas.DataFrame: A DataFrame containing details for all stores retrieved.
+        """
+        return run_coroutine(self._retrieve_stores_data(store_data_endpoint, number_stores_endpoint, snapshot))
+
+    def extract_json_data(self, json_url, use_cache=True):
+        """
+        Extract data from a JSON file at the specified URL, decoding it member by member as it is downloaded.
+
+        Parameters:
+        json_url (str): The URL of the JSON file.
+        use_cache (bool): Whether to load an unchanged file from the cache. Defaults to True.
+
+        Returns:
+        pandas.DataFrame: A DataFrame containing the extracted data. Raises ExtractionError if it cannot be downloaded.
+        """
+        return run_coroutine(self._extract_json_data(json_url, use_cache))
+
+    def close(self):
+        """
+        Close the connections of the extractor.
+        """
+        if self._session is not None and not self._session.closed:
+            run_coroutine(self._session.close())
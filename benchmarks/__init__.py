@@ -0,0 +1,7 @@
+"""
+Benchmarks of the extract, clean and load steps against synthetic data and local stand-ins of the sources.
+
+Run them with:
+
+    python3 -m benchmarks.run --scale small
+"""
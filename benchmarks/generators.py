@@ -0,0 +1,403 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from column_types import uuid_bytes_to_strings
+
+FIRST_NAMES = np.array(['Sophie', 'Liam', 'Emma', 'Noah', 'Mia', 'Lukas', 'Hannah', 'James', 'Olivia', 'Felix',
+                        'Amelia', 'Jacob', 'Lena', 'Oliver', 'Charlotte', 'Ethan', 'Leonie', 'Henry', 'Ava', 'Paul'])
+LAST_NAMES = np.array(['Smith', 'Jones', 'Muller', 'Schmidt', 'Johnson', 'Williams', 'Brown', 'Schneider', 'Taylor',
+                       'Fischer', 'Davies', 'Weber', 'Miller', 'Evans', 'Meyer', 'Wilson', 'Wagner', 'Moore', 'Becker', 'Clark'])
+COMPANIES = np.array(['Shaw Ltd', 'Bauer GmbH', 'Hill and Sons', 'Parker Inc', 'Koch AG', 'Ward PLC', 'Lewis LLC'])
+STREETS = np.array(['High Street', 'Station Road', 'Hauptstrasse', 'Main Street', 'Church Lane', 'Park Avenue'])
+LOCALITIES = np.array(['London', 'Manchester', 'Berlin', 'Munich', 'New York', 'Chicago', 'Leeds', 'Hamburg'])
+COUNTRIES = np.array([('United Kingdom', 'GB'), ('Germany', 'DE'), ('United States', 'US')])
+CONTINENTS = {'GB': 'Europe', 'DE': 'Europe', 'US': 'America'}
+CARD_PROVIDERS = np.array(['VISA 16 digit', 'VISA 13 digit', 'Mastercard', 'American Express', 'Discover',
+                           'JCB 16 digit', 'Diners Club / Carte Blanche', 'Maestro'])
+STORE_TYPES = np.array(['Local', 'Super Store', 'Mall Kiosk', 'Outlet'])
+CATEGORIES = np.array(['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty',
+                       'food-and-drink', 'diy'])
+TIME_PERIODS = np.array(['Late_Hours'] * 6 + ['Morning'] * 6 + ['Midday'] * 5 + ['Evening'] * 5 + ['Late_Hours'] * 2)
+
+# Date layouts found in the real sources, the first being by far the most common
+DATE_LAYOUTS = ['%Y-%m-%d', '%Y %B %d', '%B %Y %d', '%Y/%m/%d']
+DATE_LAYOUT_WEIGHTS = [0.94, 0.02, 0.02, 0.02]
+
+_LETTERS = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+
+
+def random_uuids(rng, n):
+    """
+    Generate UUID strings from the random generator, without a per-row Python loop.
+
+    Parameters:
+    rng (numpy.random.Generator): The seeded random generator.
+    n (int): The number of UUIDs.
+
+    Returns:
+    pandas.Series: Series of canonical UUID strings.
+    """
+    raw = pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), n, [None, pa.py_buffer(rng.bytes(16 * n))])
+    return uuid_bytes_to_strings(pd.Series(pd.arrays.ArrowExtensionArray(raw)))
+
+
+def random_codes(rng, n, length=10):
+    """
+    Generate random upper case codes such as 'VSM4IZ4EL3', the garbage values found in the real sources.
+    """
+    return rng.choice(_LETTERS, size=(n, length)).view(f'<U{length}').ravel()
+
+
+def random_dates(rng, n, start, end):
+    """
+    Generate dates uniformly distributed between two dates.
+
+    Returns:
+    pandas.Series: Series of datetimes, at midnight.
+    """
+    start_day, end_day = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    days = rng.integers(0, (end_day - start_day).astype(int), n)
+    return pd.Series(start_day + days.astype('timedelta64[D]')).astype('datetime64[ns]')
+
+
+def format_dates(rng, dates):
+    """
+    Format dates as strings, mixing the layouts found in the real sources.
+
+    Returns:
+    pandas.Series: Series of date strings.
+    """
+    layouts = rng.choice(len(DATE_LAYOUTS), len(dates), p=DATE_LAYOUT_WEIGHTS)
+    formatted = pd.Series(index=dates.index, dtype=object)
+    for position, layout in enumerate(DATE_LAYOUTS):
+        selected = layouts == position
+        formatted[selected] = dates[selected].dt.strftime(layout)
+    return formatted
+
+
+def corrupt_rows(rng, df, fraction, keep_columns=()):
+    """
+    Overwrite a fraction of the rows with the garbage found in the real sources: half of them
+    are 'NULL' in every column, the other half hold random codes.
+
+    Parameters:
+    rng (numpy.random.Generator): The seeded random generator.
+    df (pandas.DataFrame): The generated rows, corrupted in place.
+    fraction (float): The fraction of rows to corrupt.
+    keep_columns (iterable): The columns left untouched, e.g. the row index.
+
+    Returns:
+    pandas.DataFrame: The DataFrame.
+    """
+    count = int(len(df) * fraction)
+    if count == 0:
+        return df
+    rows = rng.choice(len(df), count, replace=False)
+    null_rows, garbage_rows = rows[:count // 2], rows[count // 2:]
+    for column in df.columns:
+        if column in keep_columns:
+            continue
+        values = df[column].to_numpy(dtype=object, copy=True)
+        values[null_rows] = 'NULL'
+        values[garbage_rows] = random_codes(rng, len(garbage_rows))
+        df[column] = values
+    return df
+
+
+def key_pool(series, pattern):
+    """
+    Return the unique keys of a generated dimension that were not corrupted, to be referenced by the orders.
+    """
+    return series[series.astype(str).str.fullmatch(pattern)].unique()
+
+
+def generate_users(n, seed=0, dirty_fraction=0.01):
+    """
+    Generate rows shaped like the RDS legacy_users table.
+
+    Parameters:
+    n (int): The number of users.
+    seed (int): The random seed. Defaults to 0.
+    dirty_fraction (float): The fraction of 'NULL' and garbage rows. Defaults to 0.01.
+
+    Returns:
+    pandas.DataFrame: The users.
+    """
+    rng = np.random.default_rng([seed, 1])
+    first_names = pd.Series(rng.choice(FIRST_NAMES, n))
+    last_names = pd.Series(rng.choice(LAST_NAMES, n))
+    countries = COUNTRIES[rng.choice(len(COUNTRIES), n, p=[0.6, 0.25, 0.15])]
+    users_df = pd.DataFrame({
+        'index': np.arange(n),
+        'first_name': first_names,
+        'last_name': last_names,
+        'date_of_birth': format_dates(rng, random_dates(rng, n, '1940-01-01', '2006-12-31')),
+        'company': rng.choice(COMPANIES, n),
+        'email_address': first_names.str.lower() + '.' + last_names.str.lower() + '@example.com',
+        'address': pd.Series(rng.integers(1, 300, n)).astype(str) + ' ' + rng.choice(STREETS, n),
+        'country': countries[:, 0],
+        'country_code': countries[:, 1],
+        'phone_number': '+44 (0)' + pd.Series(rng.integers(10 ** 9, 10 ** 10, n)).astype(str),
+        'join_date': format_dates(rng, random_dates(rng, n, '1992-01-01', '2022-06-30')),
+        'user_uuid': random_uuids(rng, n),
+    })
+    return corrupt_rows(rng, users_df, dirty_fraction, keep_columns=['index'])
+
+
+def generate_cards(n, seed=0, dirty_fraction=0.01):
+    """
+    Generate rows shaped like the card details table of the PDF document.
+
+    Parameters:
+    n (int): The number of cards.
+    seed (int): The random seed. Defaults to 0.
+    dirty_fraction (float): The fraction of 'NULL' and garbage rows. Defaults to 0.01.
+
+    Returns:
+    pandas.DataFrame: The cards.
+    """
+    rng = np.random.default_rng([seed, 2])
+    card_numbers = pd.Series(rng.integers(10 ** 15, 10 ** 16, n)).astype(str)
+    # Some card numbers are prefixed with question marks in the document
+    prefixed = rng.random(n) < 0.005
+    card_numbers[prefixed] = '???' + card_numbers[prefixed]
+    cards_df = pd.DataFrame({
+        'card_number': card_numbers,
+        'expiry_date': random_dates(rng, n, '2022-01-01', '2030-12-31').dt.strftime('%m/%y'),
+        'card_provider': rng.choice(CARD_PROVIDERS, n),
+        'date_payment_confirmed': format_dates(rng, random_dates(rng, n, '1992-01-01', '2022-06-30')),
+    })
+    return corrupt_rows(rng, cards_df, dirty_fraction)
+
+
+def generate_stores(n=451, seed=0, dirty_fraction=0.02):
+    """
+    Generate store details shaped like the responses of the store API. The first store is the web portal.
+
+    Parameters:
+    n (int): The number of stores. Defaults to 451, the number of stores of the real API.
+    seed (int): The random seed. Defaults to 0.
+    dirty_fraction (float): The fraction of 'NULL' and garbage rows. Defaults to 0.02.
+
+    Returns:
+    pandas.DataFrame: The stores, one row per API response.
+    """
+    rng = np.random.default_rng([seed, 3])
+    countries = COUNTRIES[rng.choice(len(COUNTRIES), n, p=[0.6, 0.25, 0.15])]
+    continents = pd.Series(countries[:, 1]).map(CONTINENTS)
+    # Some continents are misspelt in the API, e.g. 'eeEurope'
+    misspelt = rng.random(n) < 0.01
+    continents[misspelt] = 'ee' + continents[misspelt]
+    staff_numbers = pd.Series(rng.integers(5, 100, n)).astype(str)
+    # Some staff numbers contain letters, e.g. 'J78'
+    lettered = rng.random(n) < 0.01
+    staff_numbers[lettered] = 'J' + staff_numbers[lettered]
+    prefixes = np.array(['BL', 'WA', 'CH', 'LO', 'MU', 'NY', 'HA'])
+
+    stores_df = pd.DataFrame({
+        'index': np.arange(n),
+        'address': pd.Series(rng.integers(1, 300, n)).astype(str) + ' ' + rng.choice(STREETS, n),
+        'longitude': pd.Series(rng.uniform(-120, 20, n).round(5)).astype(str),
+        'lat': None,
+        'locality': rng.choice(LOCALITIES, n),
+        'store_code': pd.Series(rng.choice(prefixes, n)) + '-' + pd.Series(rng.integers(10 ** 6, 10 ** 7, n)).astype(str)
+                      + pd.Series(rng.choice(_LETTERS[:26], n)),
+        'staff_numbers': staff_numbers,
+        'opening_date': format_dates(rng, random_dates(rng, n, '1990-01-01', '2022-01-01')),
+        'store_type': rng.choice(STORE_TYPES, n),
+        'latitude': pd.Series(rng.uniform(25, 60, n).round(5)).astype(str),
+        'country_code': countries[:, 1],
+        'continent': continents,
+    })
+    stores_df.loc[0, ['address', 'longitude', 'locality', 'latitude', 'store_type']] = ['N/A', 'N/A', 'N/A', 'N/A', 'Web Portal']
+    stores_df.loc[0, 'store_code'] = 'WEB-1388012W'
+    # The web portal is never corrupted
+    stores_df.iloc[1:] = corrupt_rows(rng, stores_df.iloc[1:].copy(), dirty_fraction, keep_columns=['index'])
+    return stores_df
+
+
+def generate_products(n, seed=0, dirty_fraction=0.01, start=0):
+    """
+    Generate rows shaped like the products CSV file of the S3 bucket.
+
+    Parameters:
+    n (int): The number of products.
+    seed (int): The random seed. Defaults to 0.
+    dirty_fraction (float): The fraction of 'NULL' and garbage rows. Defaults to 0.01.
+    start (int): The index of the first product, to generate a large file in chunks. Defaults to 0.
+
+    Returns:
+    pandas.DataFrame: The products, written to CSV with their index as the unnamed first column.
+    """
+    rng = np.random.default_rng([seed, 4, start])
+    value = pd.Series(rng.uniform(0.1, 40, n).round(2)).astype(str)
+    grams = pd.Series(rng.integers(10, 1000, n)).astype(str)
+    units = pd.Series(rng.integers(2, 16, n)).astype(str)
+    ounces = pd.Series(rng.integers(1, 32, n)).astype(str)
+    # The weight layouts found in the real file, e.g. '1.6kg', '590g', '12 x 100g', '500ml', '16oz' and '77g .'
+    layouts = [value + 'kg', grams + 'g', units + ' x ' + grams + 'g', grams + 'ml', ounces + 'oz', grams + 'g .']
+    layout = rng.choice(len(layouts), n, p=[0.3, 0.35, 0.1, 0.15, 0.08, 0.02])
+    weights = np.select([layout == position for position in range(len(layouts))], [candidate.to_numpy() for candidate in layouts])
+
+    categories = rng.choice(CATEGORIES, n)
+    products_df = pd.DataFrame({
+        'product_name': pd.Series(rng.choice(FIRST_NAMES, n)) + ' ' + pd.Series(categories).str.replace('-', ' ') + ' set',
+        'product_price': '£' + pd.Series(rng.uniform(0.5, 1500, n).round(2)).map('{:,.2f}'.format),
+        'weight': weights,
+        'category': categories,
+        'EAN': pd.Series(rng.integers(10 ** 12, 10 ** 13, n)).astype(str),
+        'date_added': format_dates(rng, random_dates(rng, n, '1992-01-01', '2022-06-30')),
+        'uuid': random_uuids(rng, n),
+        'removed': rng.choice(np.array(['Still_avaliable', 'Removed']), n, p=[0.9, 0.1]),
+        'product_code': pd.Series(rng.choice(_LETTERS[:26], n)) + pd.Series(rng.integers(0, 10, n)).astype(str) + '-'
+                        + pd.Series(rng.integers(10 ** 6, 10 ** 7, n)).astype(str) + pd.Series(rng.choice(_LETTERS[:26], n)).str.lower(),
+    })
+    products_df.index = pd.RangeIndex(start, start + n)
+    return corrupt_rows(rng, products_df, dirty_fraction)
+
+
+def write_products_csv(path, n, seed=0, chunksize=1000000):
+    """
+    Write a products CSV file of any size, e.g. several GB, generating it one chunk at a time.
+
+    Parameters:
+    path (str): The path of the CSV file.
+    n (int): The number of products.
+    seed (int): The random seed. Defaults to 0.
+    chunksize (int): The number of products generated at a time. Defaults to 1000000.
+
+    Returns:
+    int: The size of the file in bytes.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for start in range(0, n, chunksize):
+            generate_products(min(chunksize, n - start), seed=seed, start=start).to_csv(file, header=start == 0)
+    return os.path.getsize(path)
+
+
+def generate_dates(n, seed=0, dirty_fraction=0.01):
+    """
+    Generate rows shaped like the date details JSON file.
+
+    Parameters:
+    n (int): The number of sale timestamps.
+    seed (int): The random seed. Defaults to 0.
+    dirty_fraction (float): The fraction of 'NULL' and garbage rows. Defaults to 0.01.
+
+    Returns:
+    pandas.DataFrame: The date details.
+    """
+    rng = np.random.default_rng([seed, 5])
+    timestamps = random_dates(rng, n, '1992-01-01', '2022-06-30') + pd.to_timedelta(rng.integers(0, 86400, n), unit='s')
+    dates_df = pd.DataFrame({
+        'timestamp': timestamps.dt.strftime('%H:%M:%S'),
+        'month': timestamps.dt.month.astype(str),
+        'year': timestamps.dt.year.astype(str),
+        'day': timestamps.dt.day.astype(str),
+        'time_period': TIME_PERIODS[timestamps.dt.hour.to_numpy()],
+        'date_uuid': random_uuids(rng, n),
+    })
+    return corrupt_rows(rng, dates_df, dirty_fraction)
+
+
+def generate_orders(n, users_df, cards_df, stores_df, products_df, dates_df, seed=0, chunksize=1000000):
+    """
+    Generate rows shaped like the RDS orders_table in chunks, so that 10M orders never need to be held in memory at once.
+
+    The orders reference the keys of the generated dimensions that were not corrupted.
+
+    Parameters:
+    n (int): The number of orders.
+    users_df, cards_df, stores_df, products_df, dates_df (pandas.DataFrame): The generated dimensions.
+    seed (int): The random seed. Defaults to 0.
+    chunksize (int): The number of orders per chunk. Defaults to 1000000.
+
+    Yields:
+    pandas.DataFrame: The next chunk of orders.
+    """
+    uuid_pattern = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    user_uuids = key_pool(users_df['user_uuid'], uuid_pattern)
+    card_numbers = key_pool(cards_df['card_number'], r'\d+').astype(np.int64)
+    store_codes = key_pool(stores_df['store_code'], r'[A-Z]+-\d+[A-Z]')
+    product_codes = key_pool(products_df['product_code'], r'[A-Z]\d-\d+[a-z]')
+    date_uuids = key_pool(dates_df['date_uuid'], uuid_pattern)
+
+    for chunk_number, start in enumerate(range(0, n, chunksize)):
+        rng = np.random.default_rng([seed, 6, chunk_number])
+        size = min(chunksize, n - start)
+        yield pd.DataFrame({
+            'level_0': np.arange(start, start + size),
+            'index': np.arange(start, start + size),
+            'date_uuid': rng.choice(date_uuids, size),
+            'first_name': None,
+            'last_name': None,
+            'user_uuid': rng.choice(user_uuids, size),
+            'card_number': rng.choice(card_numbers, size),
+            'store_code': rng.choice(store_codes, size),
+            'product_code': rng.choice(product_codes, size),
+            '1': None,
+            'product_quantity': rng.integers(1, 13, size),
+        })
+
+
+def _pdf_string(value):
+    """
+    Escape a value for a PDF string literal.
+    """
+    return str(value).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def cards_pdf(cards_df, rows_per_page=50):
+    """
+    Render the cards as a PDF document with one ruled table per page, like the real card details document.
+
+    The document is written directly in the PDF format, so no PDF library is needed to generate it.
+
+    Parameters:
+    cards_df (pandas.DataFrame): The generated cards.
+    rows_per_page (int): The number of rows of each page's table. Defaults to 50.
+
+    Returns:
+    bytes: The PDF document.
+    """
+    widths = [110, 60, 150, 110]
+    row_height, left, top = 14, 40, 800
+    header = list(cards_df.columns)
+    rows = cards_df.astype(str).to_numpy().tolist()
+
+    page_streams = []
+    for start in range(0, max(len(rows), 1), rows_per_page):
+        operations = ['0.5 w']
+        y = top
+        for row in [header] + rows[start:start + rows_per_page]:
+            x = left
+            for value, width in zip(row, widths):
+                operations.append(f'{x} {y} {width} {row_height} re S')
+                operations.append(f'BT /F1 7 Tf {x + 3} {y + 4} Td ({_pdf_string(value)}) Tj ET')
+                x += width
+            y -= row_height
+        page_streams.append('\n'.join(operations).encode('latin-1', errors='replace'))
+
+    page_count = len(page_streams)
+    kids = ' '.join(f'{4 + 2 * page} 0 R' for page in range(page_count))
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {page_count} >>'.encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for page, stream in enumerate(page_streams):
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> '
+                       f'/Contents {5 + 2 * page} 0 R >>'.encode())
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream')
+
+    document = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(document))
+        document += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref_offset = len(document)
+    document += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    document += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    document += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+    return bytes(document)
@@ -0,0 +1,455 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from instrumentation import current_rss_bytes, peak_rss_bytes
+from benchmarks.generators import (cards_pdf, generate_cards, generate_dates, generate_orders, generate_products,
+                                   generate_stores, generate_users, write_products_csv)
+from benchmarks.stand_ins import LocalDatabaseConnector, SourceServer, load_rds_tables, local_s3, serve_stores
+
+# Number of rows generated per source. 'small' is about the size of the real sources.
+SCALES = {
+    'small': {'users': 15000, 'cards': 15000, 'stores': 451, 'products': 1850, 'dates': 120000, 'orders': 120000},
+    'medium': {'users': 100000, 'cards': 100000, 'stores': 451, 'products': 10000, 'dates': 1000000, 'orders': 1000000},
+    'large': {'users': 1000000, 'cards': 100000, 'stores': 451, 'products': 100000, 'dates': 1000000, 'orders': 10000000},
+}
+
+# The orders are cleaned and loaded on a sample of at most this many rows, as the pipeline handles them in chunks
+ORDERS_SAMPLE_ROWS = 1000000
+
+# Benchmarks also run once under tracemalloc to compare the memory they allocate, e.g. whole and chunked reads
+MEMORY_BENCHMARKS = {'extract_orders_rds', 'extract_orders_rds_whole'}
+
+# Numbers of cleaned orders bulk loaded with COPY and with to_sql into the same PostgreSQL database
+LOAD_SCALING_ROWS = {'100k': 100000, '1m': 1000000}
+
+# Number of weights parsed by the vectorized parser and by the per-row parser it replaced
+WEIGHT_ROWS = 1000000
+
+# Number of mixed-format dates parsed with the explicit formats and with pandas parsing each value on its own
+DATE_ROWS = 1000000
+
+# Numbers of stores served by the store API with a round-trip latency, to compare serial and concurrent fetches
+STORE_SCALING_COUNTS = {'1k': 1000, '10k': 10000}
+
+# Numbers of worker processes the orders sample is cleaned with by clean_sharded, to measure how it scales with cores
+CLEANING_WORKERS = [1, 2, 4]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit():
+    """
+    Return the short hash of the current commit, or 'unknown' outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def time_import(module, args=None):
+    """
+    Import a module of the repository in a fresh interpreter, or run it as a script with args, e.g. the
+    command line of main.py, so that the benchmark measures the startup cost a new process pays.
+
+    Parameters:
+    module (str): The module, e.g. 'main'.
+    args (list): Run the module as a script with these arguments instead of importing it. Defaults to None.
+
+    Returns:
+    int: 1, the number of interpreters started.
+    """
+    command = [sys.executable, '-m', module] + args if args is not None else [sys.executable, '-c', f'import {module}']
+    subprocess.run(command, cwd=REPO_DIR, check=True, capture_output=True)
+    return 1
+
+
+def apply_weight_to_kg(weight):
+    """
+    Parse one weight into kg the way the per-row parser replaced by DataCleaning.parse_weights did,
+    kept as the reference of its benchmark.
+    """
+    weight = str(weight).lower().strip()
+    if 'x' in weight:
+        parts = weight.split('x')
+        if len(parts) == 2:
+            try:
+                number_of_units = float(parts[0].strip())
+                unit_weight = parts[1].strip()
+                if 'kg' in unit_weight:
+                    return number_of_units * float(unit_weight.replace('kg', '').strip())
+                elif 'g' in unit_weight:
+                    return number_of_units * float(unit_weight.replace('g', '').strip()) / 1000
+                elif 'ml' in unit_weight:
+                    return number_of_units * float(unit_weight.replace('ml', '').strip()) / 1000
+                elif 'l' in unit_weight:
+                    return number_of_units * float(unit_weight.replace('l', '').strip())
+            except ValueError:
+                return np.nan
+        return np.nan
+    try:
+        if 'kg' in weight:
+            return float(weight.replace('kg', '').strip())
+        elif 'g' in weight:
+            return float(weight.replace('g', '').strip()) / 1000
+        elif 'ml' in weight:
+            return float(weight.replace('ml', '').strip()) / 1000
+        elif 'l' in weight:
+            return float(weight.replace('l', '').strip())
+        return float(weight)
+    except ValueError:
+        return np.nan
+
+
+def peak_allocated_bytes(func):
+    """
+    Run a benchmark once under tracemalloc and return the peak of the memory it allocated. Unlike the peak RSS
+    of the process, it is not raised by the benchmarks run before. NumPy arrays and Python objects are traced,
+    Arrow buffers are not.
+
+    Parameters:
+    func (callable): The benchmark.
+
+    Returns:
+    int: The peak of the traced memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(func, repeat):
+    """
+    Run a benchmark several times and time it.
+
+    Parameters:
+    func (callable): The benchmark. Returns the DataFrame, the Series or the number of rows it processed.
+    repeat (int): The number of runs.
+
+    Returns:
+    tuple: The result of the last run and a dictionary of the status, rows, best and median wall times,
+           throughput and peak RSS of the process.
+    """
+    durations = []
+    result = None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            durations.append(time.perf_counter() - start)
+    except Exception as e:
+        return None, {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+
+    rows = len(result) if isinstance(result, (pd.DataFrame, pd.Series)) else int(result)
+    if rows == 0:
+        return result, {'status': 'error', 'error': 'No rows were processed.'}
+    best = min(durations)
+    return result, {
+        'status': 'ok',
+        'rows': rows,
+        'min_seconds': best,
+        'median_seconds': statistics.median(durations),
+        'rows_per_second': rows / best if best > 0 else None,
+        'rss_after_bytes': current_rss_bytes(),
+    }
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    Print the change of the best wall time of every benchmark against a baseline run.
+
+    Parameters:
+    results (dict): The results of this run.
+    baseline (dict): The results of the baseline run, e.g. of the previous commit.
+    threshold (float): The relative slowdown reported as a regression. Defaults to 0.1, 10%.
+
+    Returns:
+    list: The names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"Comparison with {baseline['commit']} ({baseline['scale']}):")
+    for name, result in results['benchmarks'].items():
+        baseline_result = baseline['benchmarks'].get(name)
+        if result['status'] != 'ok' or baseline_result is None or baseline_result['status'] != 'ok':
+            continue
+        change = result['min_seconds'] / baseline_result['min_seconds'] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<34} {baseline_result['min_seconds']:9.3f}s {result['min_seconds']:9.3f}s {change:+8.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Generate the synthetic sources, serve them from local stand-ins and benchmark every extract,
+    clean and load step. The results are saved as JSON under benchmarks/results/ for comparison between commits.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--scale', choices=SCALES, default='small', help="The size of the generated sources. Defaults to 'small'.")
+    parser.add_argument('--seed', type=int, default=0, help='The random seed of the generators. Defaults to 0.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of runs of each benchmark. Defaults to 3.')
+    parser.add_argument('--filter', default='', help="Only run the benchmarks whose name contains this text, e.g. 'clean'.")
+    parser.add_argument('--pdf-backend', choices=['tabula', 'pdfplumber'], default='tabula', help="Defaults to 'tabula'.")
+    parser.add_argument('--products-file-rows', type=int,
+                        help='Serve a products CSV file of this many rows, written to disk in chunks, to benchmark '
+                             'the streaming S3 reader on large files, e.g. 20000000 for about 3 GB.')
+    parser.add_argument('--api-latency', type=float, default=0.005,
+                        help='The delay in seconds of every response of the store API in the serial and concurrent '
+                             'store benchmarks, standing in for the round trip to the real API. Defaults to 0.005.')
+    parser.add_argument('--postgres-url', help='A local PostgreSQL URL to benchmark the COPY loads against. '
+                                               'Without it, the loads are benchmarked with to_sql on SQLite.')
+    parser.add_argument('--output', help='The path of the results file. Defaults to benchmarks/results/<commit>-<scale>.json.')
+    parser.add_argument('--compare', help='The results file of a baseline run to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='The relative slowdown reported as a regression. Defaults to 0.1.')
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    output_path = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f'{commit}-{args.scale}.json'))
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Run in a scratch directory, so the stand-in databases and the quarantined rows stay out of the repository
+    work_dir = tempfile.mkdtemp(prefix='benchmarks-')
+    os.chdir(work_dir)
+    from data_extraction import DataExtractor, PRODUCTS_CSV_DTYPES
+    from data_cleaning import DataCleaning, SOURCE_COLUMNS
+    from key_index import KeyIndex
+    from store_snapshot import StoreSnapshot
+    from validation_rules import parse_dates
+
+    # --- Generate the sources ---
+    sizes = SCALES[args.scale]
+    start = time.perf_counter()
+    users_df = generate_users(sizes['users'], seed=args.seed)
+    cards_df = generate_cards(sizes['cards'], seed=args.seed)
+    stores_df = generate_stores(sizes['stores'], seed=args.seed)
+    products_df = generate_products(sizes['products'], seed=args.seed)
+    dates_df = generate_dates(sizes['dates'], seed=args.seed)
+    orders_chunks = lambda: generate_orders(sizes['orders'], users_df, cards_df, stores_df, products_df, dates_df, seed=args.seed)
+    print(f"Generated the dimensions in {time.perf_counter() - start:.1f}s.")
+
+    # --- Set up the stand-ins ---
+    start = time.perf_counter()
+    rds_connector = LocalDatabaseConnector(f"sqlite:///{os.path.join(work_dir, 'rds.db')}")
+    load_rds_tables(rds_connector, users_df, orders_chunks())
+    print(f"Loaded {sizes['orders']} orders into the stand-in RDS database in {time.perf_counter() - start:.1f}s.")
+
+    server = SourceServer()
+    server.add('/card_details.pdf', cards_pdf(cards_df), 'application/pdf')
+    serve_stores(server, stores_df)
+    # A store API with a round-trip latency, where the serial and concurrent fetches differ as against the real API
+    api_server = SourceServer(latency=args.api_latency)
+    scaling_stores_df = generate_stores(max(STORE_SCALING_COUNTS.values()), seed=args.seed)
+    for label, count in STORE_SCALING_COUNTS.items():
+        serve_stores(api_server, scaling_stores_df.iloc[:count], prefix=f'/{label}')
+    if args.products_file_rows:
+        start = time.perf_counter()
+        products_path = os.path.join(work_dir, 'products.csv')
+        size = write_products_csv(products_path, args.products_file_rows, seed=args.seed)
+        server.add_file('/data-handling-public/products.csv', products_path, 'text/csv')
+        print(f"Wrote a {size / 1e9:.2f} GB products file in {time.perf_counter() - start:.1f}s.")
+    else:
+        server.add('/data-handling-public/products.csv', products_df.to_csv().encode(), 'text/csv')
+    server.add('/date_details.json', dates_df.to_json().encode(), 'application/json')
+
+    if args.postgres_url:
+        load_connector = LocalDatabaseConnector(args.postgres_url)
+        load_method = 'copy'
+    else:
+        load_connector = LocalDatabaseConnector(f"sqlite:///{os.path.join(work_dir, 'sales_data.db')}")
+        load_method = 'to_sql'
+
+    # The API key is passed directly, as the configuration file is not part of the repository
+    data_extractor = DataExtractor(rds_connector, api_key='benchmark')
+    async_data_extractor = None
+    data_cleaning = DataCleaning()
+
+    weights = pd.Series(np.resize(products_df['weight'].to_numpy(dtype=object), WEIGHT_ROWS))
+    join_dates = pd.Series(np.resize(users_df['join_date'].to_numpy(dtype=object), DATE_ROWS))
+    orders_sample_df = next(generate_orders(min(sizes['orders'], ORDERS_SAMPLE_ROWS), users_df, cards_df, stores_df,
+                                            products_df, dates_df, seed=args.seed, chunksize=ORDERS_SAMPLE_ROWS))
+    cleaned = {}
+
+    with server, api_server, local_s3(server.url):
+        def async_extract(method, *args, **kwargs):
+            # aiohttp is optional, so the async extractor is only imported by its benchmarks
+            nonlocal async_data_extractor
+            if async_data_extractor is None:
+                from async_extraction import AsyncDataExtractor
+                async_data_extractor = AsyncDataExtractor(rds_connector, api_key='benchmark')
+            return getattr(async_data_extractor, method)(*args, **kwargs)
+
+        store_snapshot = StoreSnapshot(os.path.join(work_dir, 'store_snapshot.json'))
+        api_requests = {}
+
+        def snapshot_extract(name, clear=False):
+            # Count the requests the store API receives, the snapshot is meant to cut them rather than the time of one request
+            if clear:
+                store_snapshot.clear()
+            request_count = server.request_count
+            stores = data_extractor.retrieve_stores_data(f'{server.url}/prod/store_details/{{store_number}}',
+                                                         f'{server.url}/prod/number_stores', snapshot=store_snapshot)
+            api_requests.setdefault(name, []).append(server.request_count - request_count)
+            return stores
+
+        repeated_orders = {}
+
+        def orders_rows(n):
+            # Repeat the cleaned orders sample up to n rows, once, as the loads do not check the keys for duplicates
+            if n not in repeated_orders:
+                orders_df = cleaned['clean_orders']
+                repeated_orders[n] = pd.concat([orders_df] * -(-n // len(orders_df)), ignore_index=True).iloc[:n]
+            return repeated_orders[n]
+
+        def count_chunks(chunks):
+            return sum(len(chunk_df) for chunk_df in chunks)
+
+        def check_orphans():
+            key_index = KeyIndex()
+            for table_name, source in [('dim_users', 'clean_users'), ('dim_card_details', 'clean_cards'),
+                                       ('dim_store_details', 'clean_stores'), ('dim_products', 'clean_products'),
+                                       ('dim_date_times', 'clean_dates')]:
+                if source in cleaned:
+                    key_index.add(table_name, cleaned[source])
+            return data_cleaning.remove_orphans(cleaned['clean_orders'], key_index)
+
+        benchmarks = [
+            ('import_main', lambda: time_import('main')),
+            ('import_data_extraction', lambda: time_import('data_extraction')),
+            ('cli_help', lambda: time_import('main', ['--help'])),
+            ('extract_users_rds', lambda: data_extractor.read_rds_table('legacy_users', columns=SOURCE_COLUMNS['clean_user_data'])),
+            ('extract_orders_rds_whole', lambda: data_extractor.read_rds_table('orders_table', columns=SOURCE_COLUMNS['clean_orders_data'])),
+            ('extract_orders_rds', lambda: count_chunks(data_extractor.read_rds_table_chunks('orders_table',
+                                                                                             columns=SOURCE_COLUMNS['clean_orders_data']))),
+            ('extract_cards_pdf', lambda: data_extractor.retrieve_pdf_data(f'{server.url}/card_details.pdf', use_cache=False,
+                                                                           backend=args.pdf_backend)),
+            ('extract_cards_pdf_unsharded', lambda: data_extractor.retrieve_pdf_data(f'{server.url}/card_details.pdf', use_cache=False,
+                                                                                     backend=args.pdf_backend, max_workers=1)),
+            ('extract_stores_api', lambda: data_extractor.retrieve_stores_data(f'{server.url}/prod/store_details/{{store_number}}',
+                                                                               f'{server.url}/prod/number_stores')),
+            ('extract_stores_api_async', lambda: async_extract('retrieve_stores_data', f'{server.url}/prod/store_details/{{store_number}}',
+                                                               f'{server.url}/prod/number_stores')),
+            ('extract_stores_api_snapshot_cold', lambda: snapshot_extract('extract_stores_api_snapshot_cold', clear=True)),
+            ('extract_stores_api_snapshot', lambda: snapshot_extract('extract_stores_api_snapshot')),
+            ('extract_products_s3', lambda: data_extractor.extract_from_s3('s3://data-handling-public/products.csv', use_cache=False,
+                                                                           dtype=PRODUCTS_CSV_DTYPES)),
+            ('extract_products_s3_arrow', lambda: data_extractor.extract_from_s3('s3://data-handling-public/products.csv', use_cache=False,
+                                                                                 dtype=PRODUCTS_CSV_DTYPES, engine='pyarrow')),
+            ('extract_dates_json', lambda: data_extractor.extract_json_data(f'{server.url}/date_details.json', use_cache=False)),
+            ('extract_dates_json_async', lambda: async_extract('extract_json_data', f'{server.url}/date_details.json', use_cache=False)),
+            ('clean_users', lambda: data_cleaning.clean_sharded('clean_user_data', users_df)),
+            ('clean_cards', lambda: data_cleaning.clean_card_data(cards_df)),
+            ('clean_stores', lambda: data_cleaning.clean_store_data(stores_df)),
+            ('clean_products', lambda: data_cleaning.clean_products_data(products_df)),
+            ('parse_weights_1m', lambda: data_cleaning.parse_weights(weights)),
+            ('parse_weights_apply_1m', lambda: weights.apply(apply_weight_to_kg)),
+            ('parse_dates_1m', lambda: parse_dates(join_dates, 'dim_users', 'join_date')),
+            ('parse_dates_mixed_1m', lambda: pd.to_datetime(join_dates, format='mixed', errors='coerce')),
+            ('clean_dates', lambda: data_cleaning.clean_date_data(dates_df)),
+            ('clean_orders', lambda: data_cleaning.clean_sharded('clean_orders_data', orders_sample_df)),
+            ('check_orphans', check_orphans),
+        ]
+        for label in STORE_SCALING_COUNTS:
+            for mode, max_workers in [('serial', 1), ('concurrent', 10)]:
+                benchmarks.append((f'extract_stores_api_{mode}_{label}',
+                                   lambda label=label, max_workers=max_workers: data_extractor.retrieve_stores_data(
+                                       f'{api_server.url}/{label}/store_details/{{store_number}}',
+                                       f'{api_server.url}/{label}/number_stores', max_workers=max_workers)))
+        for table_name, source in [('dim_users', 'clean_users'), ('dim_card_details', 'clean_cards'),
+                                   ('dim_store_details', 'clean_stores'), ('dim_products', 'clean_products'),
+                                   ('dim_date_times', 'clean_dates'), ('orders_table', 'clean_orders')]:
+            benchmarks.append((f"load_{source.split('_', 1)[1]}",
+                               lambda table_name=table_name, source=source: load_connector.upload_to_db(
+                                   cleaned[source], table_name, method=load_method) or len(cleaned[source])))
+        for max_workers in CLEANING_WORKERS:
+            # Shard whatever the sample size, so that every worker gets an equal share of the orders
+            benchmarks.append((f'clean_orders_workers_{max_workers}',
+                               lambda max_workers=max_workers: data_cleaning.clean_sharded(
+                                   'clean_orders_data', orders_sample_df, max_workers=max_workers,
+                                   min_rows_per_shard=len(orders_sample_df) // max_workers)))
+        for label, rows in LOAD_SCALING_ROWS.items():
+            for method in ['copy', 'to_sql']:
+                benchmarks.append((f'upload_orders_{method}_{label}',
+                                   lambda rows=rows, method=method: load_connector.upload_to_db(
+                                       orders_rows(rows), 'orders_table', method=method) or rows))
+
+        results = {
+            'commit': commit,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'scale': args.scale,
+            'sizes': sizes,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'load_target': 'postgresql' if args.postgres_url else 'sqlite',
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'benchmarks': {},
+        }
+        for name, func in benchmarks:
+            if args.filter not in name:
+                continue
+            if name.startswith('load_') and f"clean_{name.split('_', 1)[1]}" not in cleaned:
+                results['benchmarks'][name] = {'status': 'skipped', 'error': 'The table was not cleaned.'}
+                continue
+            if name.startswith('upload_orders_') and not args.postgres_url:
+                results['benchmarks'][name] = {'status': 'skipped', 'error': 'COPY needs --postgres-url.'}
+                continue
+            if (name == 'check_orphans' or name.startswith('upload_orders_')) and 'clean_orders' not in cleaned:
+                results['benchmarks'][name] = {'status': 'skipped', 'error': 'The orders were not cleaned.'}
+                continue
+            if name == 'extract_stores_api_snapshot':
+                # Start from the snapshot of an earlier run, the common case, rather than from an empty one
+                snapshot_extract('warm_up', clear=True)
+            result, results['benchmarks'][name] = run_benchmark(func, args.repeat)
+            if name.startswith('clean_') and not name.startswith('clean_orders_workers_') and result is not None:
+                cleaned[name] = result
+            summary = results['benchmarks'][name]
+            if name in api_requests:
+                summary['api_requests'] = api_requests.pop(name)
+            if name in MEMORY_BENCHMARKS and summary['status'] == 'ok':
+                summary['peak_allocated_bytes'] = peak_allocated_bytes(func)
+            if summary['status'] == 'ok':
+                print(f"  {name:<34} {summary['min_seconds']:9.3f}s {summary['rows']:>10} rows {summary['rows_per_second']:>12,.0f} rows/s"
+                      + (f" {max(summary['api_requests']):>6} API requests" if 'api_requests' in summary else '')
+                      + (f" {summary['peak_allocated_bytes'] / 1e6:>8.1f} MB allocated at peak" if 'peak_allocated_bytes' in summary else ''))
+            else:
+                print(f"  {name:<34} {summary['status']}: {summary['error']}")
+        if async_data_extractor is not None:
+            async_data_extractor.close()
+        data_cleaning.close()
+
+    # The peak RSS never decreases, so it is saved once for the whole run rather than per benchmark
+    results['peak_rss_bytes'] = peak_rss_bytes()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output_path}.")
+
+    if baseline_path:
+        with open(baseline_path, 'r') as file:
+            baseline = json.load(file)
+        if compare_results(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from sqlalchemy import inspect
+from database_utils import DatabaseConnector, get_engine
+
+
+class SourceServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        """
+        Initialise a local HTTP server standing in for the remote sources: the store API, the public
+        PDF and JSON files, and the S3 bucket, whose objects are served at path-style '/<bucket>/<key>' URLs.
+
+        Every response carries an ETag, and a request whose If-None-Match matches it gets a 304,
+        so the conditional downloads of the source cache behave as against the real sources.
+
+        Parameters:
+        host (str): The address to listen on. Defaults to '127.0.0.1'.
+        port (int): The port to listen on. Defaults to 0, any free port.
+        latency (float): The delay in seconds before every response, standing in for the round trip
+                         to a remote source. Defaults to 0.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.routes = {}
+        self.failures = {}
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def add(self, path, content, content_type='application/octet-stream'):
+        """
+        Serve content at a path.
+
+        Parameters:
+        path (str): The path of the URL, e.g. '/prod/number_stores'.
+        content (bytes): The body of the response.
+        content_type (str): The Content-Type of the response.
+        """
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        self.routes[path] = (content, content_type, etag)
+
+    def add_file(self, path, file_path, content_type='application/octet-stream'):
+        """
+        Serve a file at a path, streamed from disk, e.g. a products CSV file of several GB.
+
+        Parameters:
+        path (str): The path of the URL.
+        file_path (str): The path of the file.
+        content_type (str): The Content-Type of the response.
+        """
+        stat = os.stat(file_path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        self.routes[path] = (file_path, content_type, etag)
+
+    def fail(self, path, times, status=503):
+        """
+        Answer the next requests to a path with an error status, e.g. to exercise the retries of a client.
+
+        Parameters:
+        path (str): The path of the URL.
+        times (int): The number of requests answered with the error.
+        status (int): The HTTP status of the error. Defaults to 503.
+        """
+        with self._lock:
+            self.failures[path] = (times, status)
+
+    @property
+    def url(self):
+        """
+        The base URL of the running server.
+        """
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        """
+        Start serving in a background thread.
+
+        Returns:
+        str: The base URL of the server.
+        """
+        source_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # The headers and body are written separately, which Nagle's algorithm would delay by a round trip
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                with source_server._lock:
+                    source_server.request_count += 1
+                    times, status = source_server.failures.get(path, (0, None))
+                    if times:
+                        source_server.failures[path] = (times - 1, status)
+                if source_server.latency:
+                    time.sleep(source_server.latency)
+                route = source_server.routes.get(path)
+                if times or route is None:
+                    self.send_response(status if times else 404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                content, content_type, etag = route
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content) if isinstance(content, bytes) else os.path.getsize(content)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', formatdate(usegmt=True))
+                self.end_headers()
+                if isinstance(content, bytes):
+                    self.wfile.write(content)
+                else:
+                    with open(content, 'rb') as file:
+                        shutil.copyfileobj(file, self.wfile, 1024 ** 2)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def serve_stores(server, stores_df, first_store_number=0, prefix='/prod'):
+    """
+    Serve generated stores the way the store API does: the number of stores at '<prefix>/number_stores'
+    and the details of every store at '<prefix>/store_details/<store number>'.
+
+    Parameters:
+    server (SourceServer): The server to add the routes to.
+    stores_df (pandas.DataFrame): The generated stores, one row per API response.
+    first_store_number (int): The number of the first store. Defaults to 0, as the real API numbers the stores from 0.
+    prefix (str): The path prefix of the endpoints. Defaults to '/prod'.
+    """
+    server.add(f'{prefix}/number_stores', json.dumps({'statusCode': 200, 'number_stores': len(stores_df)}).encode(), 'application/json')
+    records = stores_df.astype(object).where(stores_df.notna(), None).to_dict('records')
+    for store_number, store in enumerate(records, start=first_store_number):
+        server.add(f'{prefix}/store_details/{store_number}', json.dumps(store).encode(), 'application/json')
+
+
+@contextmanager
+def local_s3(endpoint_url):
+    """
+    Point boto3 S3 clients created inside the block at a local endpoint with dummy credentials and
+    path-style addressing, e.g. a SourceServer.
+
+    Parameters:
+    endpoint_url (str): The base URL of the local endpoint.
+    """
+    fd, config_path = tempfile.mkstemp(suffix='.aws_config')
+    with os.fdopen(fd, 'w') as file:
+        file.write('[default]\ns3 =\n    addressing_style = path\n')
+
+    environment = {
+        'AWS_ENDPOINT_URL_S3': endpoint_url,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_DEFAULT_REGION': 'eu-west-1',
+        'AWS_CONFIG_FILE': config_path,
+    }
+    previous = {key: os.environ.get(key) for key in environment}
+    os.environ.update(environment)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        os.remove(config_path)
+
+
+class LocalDatabaseConnector(DatabaseConnector):
+    def __init__(self, url, pool_size=5, max_overflow=10, pool_pre_ping=True):
+        """
+        Initialise a DatabaseConnector reading from and uploading to a database URL instead of the
+        credentials file and the default local database, e.g. a SQLite file standing in for RDS.
+
+        Parameters:
+        url (str): The database URL, e.g. 'sqlite:///benchmark.db'.
+        """
+        self.url = url
+        super().__init__(db_creds=None, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=pool_pre_ping)
+
+    def init_db_engine(self):
+        """
+        Return the shared engine of the database URL.
+        """
+        return get_engine(self.url, pool_size=self.pool_size, max_overflow=self.max_overflow, pool_pre_ping=self.pool_pre_ping)
+
+    def list_db_tables(self, engine=None):
+        """
+        List all tables in the database, also on databases without an information_schema such as SQLite.
+        """
+        return inspect(engine or self.engine).get_table_names()
+
+    def target_engine(self):
+        """
+        Upload to the same database URL.
+        """
+        return self.engine
+
+
+def load_rds_tables(connector, users_df, orders_chunks):
+    """
+    Write the generated users and orders to the stand-in RDS database, one orders chunk at a time.
+
+    Parameters:
+    connector (LocalDatabaseConnector): The connector of the stand-in database.
+    users_df (pandas.DataFrame): The generated users, written to 'legacy_users'.
+    orders_chunks (iterable): The generated orders chunks, written to 'orders_table'.
+
+    Returns:
+    int: The number of orders written.
+    """
+    with connector.engine.begin() as connection:
+        users_df.to_sql('legacy_users', connection, if_exists='replace', index=False, chunksize=100000)
+
+    total_rows = 0
+    for chunk_number, orders_df in enumerate(orders_chunks):
+        with connector.engine.begin() as connection:
+            orders_df.to_sql('orders_table', connection, if_exists='replace' if chunk_number == 0 else 'append',
+                             index=False, chunksize=100000)
+        total_rows += len(orders_df)
+    return total_rows
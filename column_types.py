@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Type of a UUID stored as 16 raw bytes instead of a 36 character Python string
+UUID_DTYPE = pd.ArrowDtype(pa.binary(16))
+
+# Arrow-backed string type for high-cardinality text columns
+STRING_DTYPE = 'string[pyarrow]'
+
+# Target pandas type of every column of the cleaned tables, declared once and applied by every DataCleaning.clean_* method.
+# Low-cardinality fields are categoricals, keys and free text are Arrow strings and UUIDs are 16-byte binaries.
+COLUMN_TYPES = {
+    'dim_users': {
+        'first_name': STRING_DTYPE,
+        'last_name': STRING_DTYPE,
+        'company': STRING_DTYPE,
+        'email_address': STRING_DTYPE,
+        'address': STRING_DTYPE,
+        'country': 'category',
+        'country_code': 'category',
+        'phone_number': STRING_DTYPE,
+        'user_uuid': 'uuid',
+    },
+    'dim_card_details': {
+        'card_number': STRING_DTYPE,
+        'expiry_date': 'category',
+        'card_provider': 'category',
+    },
+    'dim_store_details': {
+        'address': STRING_DTYPE,
+        'locality': 'category',
+        'store_code': STRING_DTYPE,
+        'staff_numbers': 'Int16',
+        'store_type': 'category',
+        'country_code': 'category',
+        'continent': 'category',
+    },
+    'dim_products': {
+        'product_name': STRING_DTYPE,
+        'product_price': 'float64',
+        'category': 'category',
+        'EAN': STRING_DTYPE,
+        'uuid': 'uuid',
+        'removed': 'category',
+        'product_code': STRING_DTYPE,
+        'weight_class': 'category',
+    },
+    'orders_table': {
+        'date_uuid': 'uuid',
+        'user_uuid': 'uuid',
+        'card_number': STRING_DTYPE,
+        'store_code': 'category',
+        'product_code': 'category',
+        'product_quantity': 'Int16',
+    },
+    'dim_date_times': {
+        'month': 'Int8',
+        'year': 'Int16',
+        'day': 'Int8',
+        'time_period': 'category',
+        'date_uuid': 'uuid',
+    },
+}
+
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def uuids_to_bytes(series):
+    """
+    Convert UUID strings to 16-byte binaries without a per-row Python loop.
+
+    The strings are normalised and validated with Arrow kernels on one contiguous buffer, instead of creating
+    two new Python strings per UUID.
+
+    Parameters:
+    series (pandas.Series): Series of UUID strings, with or without hyphens.
+
+    Returns:
+    pandas.Series: Series of the UUID_DTYPE type, null where the string is not a valid UUID.
+    """
+    strings = pa.array(series.astype(str).to_numpy(dtype=object), type=pa.string())
+    hex_strings = pc.ascii_lower(pc.replace_substring(strings, '-', ''))
+    valid = pc.match_substring_regex(hex_strings, '^[0-9a-f]{32}$')
+
+    # Decode the hex digits of all valid rows at once, invalid rows become zeros. Every string is then 32 bytes
+    # long, so the string data is a (rows, 32) matrix.
+    padded = pc.if_else(valid, hex_strings, pa.scalar('0' * 32))
+    data_start = int(np.frombuffer(padded.buffers()[1], dtype=np.int32)[padded.offset])
+    digits = np.frombuffer(padded.buffers()[2], dtype=np.uint8, count=32 * len(padded), offset=data_start).reshape(-1, 32)
+    nibbles = np.where(digits >= ord('a'), digits - ord('a') + 10, digits - ord('0')).astype(np.uint8)
+    raw = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+
+    array = pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), len(series), [None, pa.py_buffer(raw.tobytes())])
+    array = pc.if_else(valid, array, pa.scalar(None, pa.binary(16)))
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=series.index, name=series.name)
+
+
+def uuid_bytes_to_strings(series):
+    """
+    Convert 16-byte UUID binaries back to canonical hyphenated strings, e.g. for COPY or to_sql.
+
+    Parameters:
+    series (pandas.Series): Series of the UUID_DTYPE type.
+
+    Returns:
+    pandas.Series: Series of UUID strings, None where the UUID is null.
+    """
+    array = series.array.__arrow_array__().combine_chunks()
+    valid = np.asarray(array.is_valid().to_numpy(zero_copy_only=False), dtype=bool)
+    raw = np.frombuffer(array.buffers()[1], dtype=np.uint8, count=len(array) * 16, offset=array.offset * 16).reshape(-1, 16)
+
+    hex_digits = np.empty((len(array), 32), dtype=np.uint8)
+    hex_digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    hex_digits[:, 1::2] = _HEX_DIGITS[raw & 0x0F]
+
+    # Insert the hyphens of the 8-4-4-4-12 layout
+    characters = np.full((len(array), 36), ord('-'), dtype=np.uint8)
+    for start, end, offset in ((0, 8, 0), (8, 12, 1), (12, 16, 2), (16, 20, 3), (20, 32, 4)):
+        characters[:, start + offset:end + offset] = hex_digits[:, start:end]
+
+    strings = characters.view('S36').ravel().astype(str).astype(object)
+    strings[~valid] = None
+    return pd.Series(strings, index=series.index, name=series.name)
+
+
+def is_uuid_dtype(dtype):
+    """
+    Check whether a pandas dtype is the 16-byte UUID_DTYPE.
+    """
+    return isinstance(dtype, pd.ArrowDtype) and pa.types.is_fixed_size_binary(dtype.pyarrow_dtype) and dtype.pyarrow_dtype.byte_width == 16
+
+
+def arrow_types_mapper(arrow_type):
+    """
+    Map the Arrow types of a cleaned table read back from Parquet to its pandas types: 16-byte binaries
+    to UUID_DTYPE, whose name pandas cannot parse from the Parquet metadata, and strings to Arrow strings.
+
+    Parameters:
+    arrow_type (pyarrow.DataType): The Arrow type of a column.
+
+    Returns:
+    The pandas type of the column, or None to use the default conversion.
+    """
+    if pa.types.is_fixed_size_binary(arrow_type) and arrow_type.byte_width == 16:
+        return UUID_DTYPE
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def apply_column_types(df, table_name, copy=True):
+    """
+    Convert the columns of a cleaned DataFrame to the types declared in COLUMN_TYPES.
+
+    Parameters:
+    df (pandas.DataFrame): The cleaned DataFrame.
+    table_name (str): The name of the target table the types are declared for.
+    copy (bool): Whether to convert a copy instead of the DataFrame itself. Defaults to True.
+
+    Returns:
+    pandas.DataFrame: The DataFrame with its columns converted.
+    """
+    if copy:
+        df = df.copy()
+    for column, dtype in COLUMN_TYPES.get(table_name, {}).items():
+        if column not in df.columns:
+            continue
+        if dtype == 'uuid':
+            # A cleaner may have converted the UUIDs already, to reject the rows whose UUID is malformed
+            if not is_uuid_dtype(df[column].dtype):
+                df[column] = uuids_to_bytes(df[column])
+        elif dtype in ('Int8', 'Int16', 'Int32', 'Int64'):
+            df[column] = pd.to_numeric(df[column], errors='coerce').round().astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def memory_usage(df):
+    """
+    Return the memory used by a DataFrame in bytes, including the contents of Python objects.
+    """
+    return int(df.memory_usage(deep=True).sum())
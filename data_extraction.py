@@ -1,119 +1,602 @@
 import pandas as pd
-from database_utils import DatabaseConnector
-import tabula
-import requests
-import boto3
-import yaml
+from instrumentation import instrument_class
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+import json
+from io import BytesIO
+import multiprocessing
+import operator
 
-# Initialise the DatabaseConnector
-db_connector = DatabaseConnector(db_creds='db_creds.yml')
+# Explicit types of the products CSV columns, so that no type is inferred chunk by chunk (e.g. EAN as integers
+# in one chunk and floats in the next). product_price stays a string, so the raw price of the rows the cleaner
+# rejects is staged and quarantined as it was read.
+PRODUCTS_CSV_DTYPES = {
+    'product_name': str,
+    'product_price': str,
+    'weight': str,
+    'category': str,
+    'EAN': str,
+    'date_added': str,
+    'uuid': str,
+    'removed': str,
+    'product_code': str,
+}
 
+# Size of the blocks read by the Arrow CSV reader
+CSV_BLOCK_SIZE = 16 * 1024 ** 2
+
+# Number of rows per chunk read from RDS by read_rds_table_chunks
+RDS_CHUNKSIZE = 50000
+
+# Operators accepted in the filters of read_rds_table, as in the filters of pandas.read_parquet
+FILTER_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda column, values: column.in_(list(values)),
+    'not in': lambda column, values: column.not_in(list(values)),
+    'is null': lambda column: column.is_(None),
+    'is not null': lambda column: column.is_not(None),
+}
+
+def _read_pdf_pages(content, pages, backend='tabula'):
+    """
+    Parse the tables of the given pages of a PDF document. Defined at module level so it can run in a process pool.
+
+    Parameters:
+    content (bytes): The raw PDF document.
+    pages (list or str): The 1-based page numbers to parse, or 'all'.
+    backend (str): 'tabula' or the pure-Python 'pdfplumber', which does not start a JVM. Defaults to 'tabula'.
+
+    Returns:
+    list: The DataFrames of the tables found, in page order.
+    """
+    if backend == 'pdfplumber':
+        import pdfplumber
+
+        tables = []
+        with pdfplumber.open(BytesIO(content)) as pdf:
+            pdf_pages = pdf.pages if pages == 'all' else [pdf.pages[page_number - 1] for page_number in pages]
+            for page in pdf_pages:
+                for table in page.extract_tables():
+                    if len(table) > 1:
+                        tables.append(pd.DataFrame(table[1:], columns=table[0]))
+        return tables
+
+    import tabula
+
+    return tabula.read_pdf(BytesIO(content), pages=pages if pages == 'all' else list(pages), multiple_tables=True)
+
+
+def _count_pdf_pages(content):
+    """
+    Count the pages of a PDF document.
+
+    Parameters:
+    content (bytes): The raw PDF document.
+
+    Returns:
+    int: The number of pages, or None if pypdf is not installed.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    return len(PdfReader(BytesIO(content)).pages)
+
+
+def _read_csv_stream(stream, dtype=None, engine='c', chunksize=100000):
+    """
+    Parse a CSV stream chunk by chunk, so that the raw file is never held in memory as a whole.
+
+    Parameters:
+    stream (file-like): The readable CSV stream, e.g. an S3 object body.
+    dtype (dict): Explicit column types. The other columns are inferred. The 'pyarrow' engine applies the str types. Defaults to None.
+    engine (str): 'c' for the pandas parser or 'pyarrow' for the multithreaded Arrow CSV reader. Defaults to 'c'.
+    chunksize (int): The number of rows per chunk of the 'c' engine. The 'pyarrow' engine reads
+                     blocks of CSV_BLOCK_SIZE bytes. Defaults to 100000.
+
+    Returns:
+    pandas.DataFrame: The parsed rows.
+    """
+    if engine == 'pyarrow':
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+
+        column_types = {column: pa.string() for column, column_dtype in (dtype or {}).items() if column_dtype in (str, 'str', 'string')}
+        reader = pa_csv.open_csv(stream, read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+                                 convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True))
+        chunks = [batch.to_pandas() for batch in reader]
+        df = pd.concat(chunks, ignore_index=True) if chunks else reader.schema.empty_table().to_pandas()
+        # Name the unnamed index column the way pandas does
+        return df.rename(columns={column: f'Unnamed: {position}' for position, column in enumerate(df.columns) if column == ''})
+
+    if engine != 'c':
+        raise ValueError(f"Unsupported CSV engine '{engine}'. Use 'c' or 'pyarrow'.")
+    chunks = list(pd.read_csv(stream, dtype=dtype, chunksize=chunksize))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _normalize_pdf_columns(df, columns):
+    """
+    Align the columns of a table parsed from one PDF page with the columns of the document.
+
+    Header names are stripped, empty 'Unnamed' columns are dropped, and a header that merged
+    several columns (e.g. 'card_number expiry_date') has its values split back into them.
+
+    Parameters:
+    df (pandas.DataFrame): The table parsed from one page.
+    columns (list): The columns of the document.
+
+    Returns:
+    pandas.DataFrame: The table with exactly the given columns.
+    """
+    df = df.rename(columns=lambda column: str(column).strip())
+    df = df.drop(columns=[column for column in df.columns if column.startswith('Unnamed') and df[column].isna().all()])
+
+    for column in list(df.columns):
+        parts = column.split()
+        if column not in columns and len(parts) > 1 and all(part in columns for part in parts):
+            split_values = df[column].astype(str).str.split(n=len(parts) - 1, expand=True)
+            for position, part in enumerate(parts):
+                df[part] = split_values[position] if position in split_values.columns else None
+            df = df.drop(columns=[column])
+
+    return df.reindex(columns=columns)
+
+
+# The configuration file holding the key of the store API
+CONFIG_PATH = 'config.yml'
+
+@instrument_class
 class DataExtractor:
-    def __init__(self, db_connector=None):
+    def __init__(self, db_connector=None, cache=None, config_path=CONFIG_PATH, api_key=None):
         """
         Initialize the DataExtractor with an instance of DatabaseConnector.
 
+        The configuration file is read only when the store API is first called, and only once per process,
+        so the stages that never call the API do not need it.
+
         Parameters:
         db_connector (DatabaseConnector): An instance of the DatabaseConnector class.
+        cache (SourceCache): Optional on-disk cache of the parsed PDF, JSON and S3 sources.
+        config_path (str): The YAML configuration file holding the API key under api.key. Defaults to config.yml.
+        api_key (str): The API key, instead of reading it from the configuration file. Defaults to None.
         """
         self.db_connector = db_connector
-    
-        # Load the API key from the configuration file
-        with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
-            self.api_key = config['api']['key']
-            self.api_endpoints = config['api']['endpoints']
-        
-        self.headers = {'x-api-key': self.api_key}
-        
-    def read_rds_table(self, table_name):
+        self.cache = cache
+        self.config_path = config_path
+        self._api_key = api_key
+
+    @property
+    def api_key(self):
+        """
+        The key of the store API, read from the configuration file the first time it is needed.
+        """
+        if self._api_key is None:
+            from database_utils import load_config
+
+            self._api_key = load_config(self.config_path)['api']['key']
+        return self._api_key
+
+    @property
+    def headers(self):
+        """
+        The headers sent with every request to the store API.
+        """
+        return {'x-api-key': self.api_key}
+
+    def _build_select_query(self, table_name, watermark_column=None, watermark=None, columns=None, filters=None):
+        """
+        Build the SELECT query used to read a table, selecting only the given columns and rows.
+
+        The table and column names are quoted by SQLAlchemy and the filter values are sent as bound
+        parameters, so none of them are interpolated into the SQL text.
+
+        Parameters:
+        table_name (str): The name of the table to read from the database.
+        watermark_column (str): The monotonically increasing column to compare with the watermark.
+                                It is always selected and the rows are ordered by it.
+        watermark (int): Only rows with watermark_column greater than this value are selected.
+        columns (list): The columns to select. Defaults to all columns.
+        filters (list): Conditions the selected rows must all meet, as (column, operator, value) tuples
+                        like the filters of pandas.read_parquet, e.g. ('product_quantity', '>', 0),
+                        ('store_code', 'in', ['WEB-1388012W']) or ('user_uuid', 'is not null').
+
+        Returns:
+        sqlalchemy.sql.Select: The query, with its bound parameters.
+        """
+        from sqlalchemy import column, literal_column, select, table
+
+        selected_columns = list(columns) if columns is not None else []
+        if columns is not None and watermark_column is not None and watermark_column not in selected_columns:
+            selected_columns.append(watermark_column)
+        source_table = table(table_name, *(column(name) for name in selected_columns))
+        query = select(*source_table.columns) if columns is not None else select(literal_column('*')).select_from(source_table)
+
+        filters = list(filters or [])
+        if watermark_column is not None and watermark is not None:
+            filters.append((watermark_column, '>', int(watermark)))
+        for condition in filters:
+            name, operator_name = condition[0], condition[1].lower()
+            if operator_name not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator '{condition[1]}'. Use one of {', '.join(FILTER_OPERATORS)}.")
+            query = query.where(FILTER_OPERATORS[operator_name](column(name), *condition[2:]))
+
+        if watermark_column is not None:
+            query = query.order_by(column(watermark_column))
+        return query
+
+    def read_rds_table(self, table_name, watermark_column=None, watermark=None, columns=None, filters=None):
         """
         Read a table from the RDS database into a pandas DataFrame.
 
         Parameters:
         table_name (str): The name of the table to read from the database.
+        watermark_column (str): Optional column used for incremental extraction, e.g. 'index'.
+        watermark (int): Only rows with watermark_column greater than this value are read. Defaults to all rows.
+        columns (list): The columns to read, e.g. the SOURCE_COLUMNS of the cleaner. Defaults to all columns.
+        filters (list): (column, operator, value) conditions pushed into the query. Defaults to no conditions.
 
         Returns:
         pandas.DataFrame: A DataFrame containing the data from the table.
         """
         engine = self.db_connector.engine
-        query = f"SELECT * FROM {table_name}"
+        query = self._build_select_query(table_name, watermark_column, watermark, columns, filters)
         df = pd.read_sql(query, engine)
         return df
 
-    def retrieve_pdf_data(self, link):
+    def read_rds_table_chunks(self, table_name, chunksize=RDS_CHUNKSIZE, watermark_column=None, watermark=None, columns=None, filters=None):
+        """
+        Read a table from the RDS database as a stream of pandas DataFrame chunks.
+
+        A server-side cursor is used so that only one chunk is held in memory at a time.
+
+        Parameters:
+        table_name (str): The name of the table to read from the database.
+        chunksize (int): The number of rows per chunk. Defaults to RDS_CHUNKSIZE, 50000.
+        watermark_column (str): Optional column used for incremental extraction, e.g. 'index'.
+        watermark (int): Only rows with watermark_column greater than this value are read. Defaults to all rows.
+        columns (list): The columns to read, e.g. the SOURCE_COLUMNS of the cleaner. Defaults to all columns.
+        filters (list): (column, operator, value) conditions pushed into the query. Defaults to no conditions.
+
+        Yields:
+        pandas.DataFrame: A DataFrame containing the next chunk of rows from the table.
+        """
+        engine = self.db_connector.engine
+        query = self._build_select_query(table_name, watermark_column, watermark, columns, filters)
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for chunk_df in pd.read_sql(query, connection, chunksize=chunksize):
+                yield chunk_df
+
+    def _cached_source(self, url, fetch, parse, use_cache=True, streamed=False, variant=None):
+        """
+        Download and parse a remote source, going through the cache when there is one.
+
+        The download is conditional on the validators of the cached copy. When the source is not
+        modified, or its content hash matches a cached copy, the parsed DataFrame is loaded from the
+        cache instead of being parsed again.
+
+        Parameters:
+        url (str): The URL of the source, used as the cache key.
+        fetch (callable): Called with the stored validators. Returns the raw content, ETag and
+                          Last-Modified, or None as content when the source is not modified.
+        parse (callable): Parses the raw content into a DataFrame.
+        use_cache (bool): Whether to use the cache. Defaults to True.
+        streamed (bool): Whether fetch returns a readable stream instead of bytes. The stream is parsed as it
+                         is downloaded and hashed on the way, so it is never held in memory as a whole. Defaults to False.
+        variant (str): What else the parsed DataFrame depends on, e.g. the PDF backend, cached apart for the same
+                       source. Defaults to None.
+
+        Returns:
+        pandas.DataFrame: The parsed DataFrame.
+        """
+        if self.cache is None or not use_cache:
+            content, _, _ = fetch({})
+            return parse(content)
+
+        def cache_hash(content_hash):
+            return content_hash if variant is None else self.cache.content_hash(f'{content_hash}:{variant}'.encode())
+
+        if variant is not None:
+            url = f'{url}#{variant}'
+        content, etag, last_modified = fetch(self.cache.validators(url))
+        if content is None:
+            cached_df = self.cache.load(url)
+            if cached_df is not None:
+                return cached_df
+            # The cached copy was evicted in the meantime
+            content, etag, last_modified = fetch({})
+
+        if streamed:
+            from source_cache import HashingReader
+
+            reader = HashingReader(content)
+            df = parse(reader)
+            content_hash = cache_hash(reader.hexdigest())
+        else:
+            content_hash = cache_hash(self.cache.content_hash(content))
+            df = self.cache.load(content_hash=content_hash)
+            if df is None:
+                df = parse(content)
+        self.cache.store(url, df, content_hash, etag=etag, last_modified=last_modified)
+        return df
+
+    def _fetch_http(self, url, validators, timeout=60):
+        """
+        Download a URL with a conditional GET.
+
+        Parameters:
+        url (str): The URL to download.
+        validators (dict): The 'etag' and 'last_modified' values of the cached copy, if any.
+        timeout (float): The request timeout in seconds. Defaults to 60.
+
+        Returns:
+        tuple: The raw content, ETag and Last-Modified, or (None, None, None) if the source is not modified.
+        """
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        import requests
+
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return None, None, None
+        response.raise_for_status()
+        return response.content, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def _parse_pdf(self, content, backend='tabula', max_workers=4):
+        """
+        Parse every table of a PDF document into one DataFrame.
+
+        The pages are split into contiguous ranges parsed in a process pool, and the tables are
+        merged back in page order after aligning their columns.
+
+        Parameters:
+        content (bytes): The raw PDF document.
+        backend (str): 'tabula' or the pure-Python 'pdfplumber'. Defaults to 'tabula'.
+        max_workers (int): The number of processes parsing page ranges. 1 parses the document in one call. Defaults to 4.
+
+        Returns:
+        pandas.DataFrame: A DataFrame containing the rows of all tables.
+        """
+        page_count = _count_pdf_pages(content)
+        if page_count is None or max_workers <= 1 or page_count < 2:
+            pages = range(1, page_count + 1) if page_count else 'all'
+            tables = _read_pdf_pages(content, pages, backend)
+        else:
+            shard_count = min(max_workers, page_count)
+            shard_size = -(-page_count // shard_count)
+            shards = [list(range(start, min(start + shard_size, page_count + 1))) for start in range(1, page_count + 1, shard_size)]
+            # Spawned rather than forked, as the stages run on threads next to live connection pools and event loops,
+            # whose locks a forked child could inherit held
+            with ProcessPoolExecutor(max_workers=shard_count, mp_context=multiprocessing.get_context('spawn')) as executor:
+                # executor.map yields the shards in page order
+                tables = [table for shard_tables in executor.map(_read_pdf_pages, repeat(content), shards, repeat(backend))
+                          for table in shard_tables]
+
+        if not tables:
+            return pd.DataFrame()
+
+        # Take the widest header as the document's columns, as some pages merge two headers into one
+        columns = max(([str(column).strip() for column in table.columns] for table in tables), key=len)
+        return pd.concat([_normalize_pdf_columns(table, columns) for table in tables], ignore_index=True)
+
+    def retrieve_pdf_data(self, link, use_cache=True, backend='tabula', max_workers=4):
         """
         Retrieve data from a PDF document at the specified link.
 
         Parameters:
         link (str): The URL of the PDF document.
+        use_cache (bool): Whether to load an unchanged document from the cache. Defaults to True.
+        backend (str): 'tabula' or the pure-Python 'pdfplumber', which skips the JVM start-up. Defaults to 'tabula'.
+        max_workers (int): The number of processes parsing page ranges. Defaults to 4.
 
         Returns:
         pandas.DataFrame: A DataFrame containing the extracted data.
         """
+        parse = partial(self._parse_pdf, backend=backend, max_workers=max_workers)
         try:
-            df_list = tabula.read_pdf(link, pages='all', multiple_tables=True)
-            pdf_data_df = pd.concat(df_list, ignore_index=True)
-            return pdf_data_df
+            return self._cached_source(link, lambda validators: self._fetch_http(link, validators), parse, use_cache,
+                                       variant=backend)
         except Exception as e:
             return pd.DataFrame()  # Return an empty DataFrame if extraction fails
 
-    def list_number_of_stores(self, store_endpoint):
+    def list_number_of_stores(self, store_endpoint, timeout=10):
         """
         Retrieve the number of stores from the API.
 
         Parameters:
         store_endpoint (str): The API endpoint to retrieve the number of stores.
+        timeout (float): The request timeout in seconds. Defaults to 10.
 
         Returns:
         int: The number of stores.
         """
+        import requests
+
         try:
-            response = requests.get(store_endpoint, headers=self.headers)
+            response = requests.get(store_endpoint, headers=self.headers, timeout=timeout)
             response.raise_for_status()
             data = response.json()
             return data['number_stores']
         except Exception as e:
             return None
 
-    def retrieve_stores_data(self, store_data_endpoint):
+    def _create_session(self, pool_size=10, retries=3, backoff_factor=0.5):
+        """
+        Create a requests Session with a pooled adapter that retries on 429 and 5xx responses.
+
+        Parameters:
+        pool_size (int): The maximum number of pooled connections per host. Defaults to 10.
+        retries (int): The number of retries for a failed request. Defaults to 3.
+        backoff_factor (float): The exponential backoff factor between retries. Defaults to 0.5.
+
+        Returns:
+        requests.Session: A Session sharing connections between requests.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def _fetch_store(self, session, url, timeout):
+        """
+        Retrieve the details of a single store.
+
+        Parameters:
+        session (requests.Session): The Session used to send the request.
+        url (str): The API URL of the store.
+        timeout (float): The per-request timeout in seconds.
+
+        Returns:
+        dict: The store details, or None if the request failed.
+        """
+        try:
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return None
+
+    def retrieve_stores_data(self, store_data_endpoint, number_stores_endpoint, max_workers=10, timeout=10, retries=3, backoff_factor=0.5,
+                             snapshot=None):
         """
         Retrieve data for all stores from the API and save them in a pandas DataFrame.
 
+        The stores are fetched concurrently on a bounded thread pool sharing one pooled Session.
+        The rows keep the store number order regardless of the order the responses arrive in.
+        With a snapshot, only the stores that are new, stale or due for a retry are requested, and the others are
+        taken from the snapshot.
+
         Parameters:
         store_data_endpoint (str): The API endpoint to retrieve store details.
+        number_stores_endpoint (str): The API endpoint to retrieve the number of stores.
+        max_workers (int): The number of concurrent requests. 1 fetches the stores serially. Defaults to 10.
+        timeout (float): The per-request timeout in seconds. Defaults to 10.
+        retries (int): The number of retries on 429 and 5xx responses. Defaults to 3.
+        backoff_factor (float): The exponential backoff factor between retries. Defaults to 0.5.
+        snapshot (StoreSnapshot): The local snapshot of the stores fetched by earlier runs. Defaults to None.
 
         Returns:
         pandas.DataFrame: A DataFrame containing details for all stores.
         """
-        number_of_stores = self.list_number_of_stores()
+        number_of_stores = self.list_number_of_stores(number_stores_endpoint, timeout=timeout)
         if number_of_stores is None:
             return pd.DataFrame()
 
-        all_stores_data = []
-        for store_number in range(1, number_of_stores + 1):
-            url = store_data_endpoint.format(store_number=store_number)
-            try:
-                response = requests.get(url, headers=self.headers)
-                response.raise_for_status()
-                store_details = response.json()
-                all_stores_data.append(store_details)
-            except Exception as e:
-                if store_number == 451:
-                    continue  # Skip this store to avoid errors
+        # The API numbers the stores from 0
+        store_numbers = range(number_of_stores)
+        if snapshot is not None:
+            store_numbers = snapshot.due(store_numbers)
+        urls = [store_data_endpoint.format(store_number=store_number) for store_number in store_numbers]
+
+        with self._create_session(pool_size=max_workers, retries=retries, backoff_factor=backoff_factor) as session:
+            if max_workers <= 1:
+                results = [self._fetch_store(session, url, timeout) for url in urls]
+            else:
+                # executor.map yields the results in the order of the urls
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    results = list(executor.map(lambda url: self._fetch_store(session, url, timeout), urls))
+
+        if snapshot is not None:
+            for store_number, store_details in zip(store_numbers, results):
+                if store_details is None:
+                    snapshot.record_failure(store_number)
+                else:
+                    snapshot.record(store_number, store_details)
+            snapshot.save()
+            return snapshot.to_frame()
+
+        # Skip the stores that could not be retrieved
+        all_stores_data = [store_details for store_details in results if store_details is not None]
 
         return pd.DataFrame(all_stores_data)
 
-    def extract_from_s3(self, s3_address):
+    def _fetch_s3(self, s3, bucket_name, key, validators):
+        """
+        Open an S3 object for streaming, conditional on the ETag of the cached copy.
+
+        Parameters:
+        s3 (botocore.client.S3): The S3 client.
+        bucket_name (str): The name of the bucket.
+        key (str): The key of the object.
+        validators (dict): The 'etag' value of the cached copy, if any.
+
+        Returns:
+        tuple: The streaming body, ETag and Last-Modified, or (None, None, None) if the object is not modified.
+        """
+        from botocore.exceptions import ClientError
+
+        kwargs = {}
+        if 'etag' in validators:
+            kwargs['IfNoneMatch'] = validators['etag']
+        try:
+            response = s3.get_object(Bucket=bucket_name, Key=key, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('304', 'NotModified'):
+                return None, None, None
+            raise
+        return response['Body'], response.get('ETag'), str(response.get('LastModified'))
+
+    def extract_from_s3(self, s3_address, use_cache=True, dtype=None, engine='c', chunksize=100000):
         """
         Extract data from a CSV file stored in an S3 bucket.
 
+        The object body is streamed and parsed chunk by chunk instead of being downloaded whole first.
+
         Parameters:
         s3_address (str): The S3 address of the CSV file.
+        use_cache (bool): Whether to load an unchanged file from the cache. Defaults to True.
+        dtype (dict): Explicit column types, e.g. PRODUCTS_CSV_DTYPES, instead of types inferred per chunk. Defaults to None.
+        engine (str): 'c' for the pandas parser or 'pyarrow' for the multithreaded Arrow CSV reader. Defaults to 'c'.
+        chunksize (int): The number of rows per chunk of the 'c' engine. Defaults to 100000.
 
         Returns:
         pandas.DataFrame: A DataFrame containing the extracted data.
         """
+        import boto3
+
         s3 = boto3.client('s3')
         bucket_name, key = s3_address.replace("s3://", "").split("/", 1)
-      
+        return self._cached_source(s3_address,
+                                   lambda validators: self._fetch_s3(s3, bucket_name, key, validators),
+                                   partial(_read_csv_stream, dtype=dtype, engine=engine, chunksize=chunksize),
+                                   use_cache, streamed=True)
+
+    def extract_json_data(self, json_url, use_cache=True):
+        """
+        Extract data from a JSON file at the specified URL.
+
+        Parameters:
+        json_url (str): The URL of the JSON file.
+        use_cache (bool): Whether to load an unchanged file from the cache. Defaults to True.
+
+        Returns:
+        pandas.DataFrame: A DataFrame containing the extracted data.
+        """
+        try:
+            return self._cached_source(json_url,
+                                       lambda validators: self._fetch_http(json_url, validators),
+                                       lambda content: pd.DataFrame(json.loads(content)),
+                                       use_cache)
+        except Exception as e:
+            return pd.DataFrame()  # Return an empty DataFrame if extraction fails
@@ -0,0 +1,282 @@
+import csv
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident set size the process has reached since it started, in bytes. It never decreases,
+    so it is the peak of the whole run rather than of any one operation.
+
+    Returns:
+    int: The peak RSS, or None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def current_rss_bytes():
+    """
+    Return the current resident set size of the process in bytes, sampled before and after every operation.
+
+    Returns:
+    int: The current RSS, or None where /proc/self/statm is not available (e.g. macOS and Windows).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class RunMetrics:
+    def __init__(self):
+        """
+        Initialise an empty collection of the operations recorded during a pipeline run.
+        """
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Tag the operations recorded by the current thread with a pipeline stage name.
+
+        Parameters:
+        name (str): The name of the stage, e.g. 'users'.
+        """
+        previous = getattr(self._local, 'stage', None)
+        self._local.stage = name
+        try:
+            yield
+        finally:
+            self._local.stage = previous
+
+    def start_record(self, operation):
+        """
+        Start the record of an operation, tagged with the stage of the current thread and the RSS before it runs.
+
+        Parameters:
+        operation (str): The name of the operation, e.g. 'DataCleaning.clean_user_data'.
+
+        Returns:
+        dict: The record of the operation, completed by finish_record.
+        """
+        return {'stage': getattr(self._local, 'stage', None), 'operation': operation, 'wall_time': None, 'rows': None,
+                'bytes': None, 'rss_before_bytes': current_rss_bytes(), 'rss_after_bytes': None, 'status': 'ok'}
+
+    def finish_record(self, record, wall_time):
+        """
+        Complete the record of an operation with its wall time and the RSS after it ran, and add it to the records.
+
+        Parameters:
+        record (dict): The record returned by start_record.
+        wall_time (float): The seconds spent in the operation.
+        """
+        record['wall_time'] = wall_time
+        record['rss_after_bytes'] = current_rss_bytes()
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def measure(self, operation):
+        """
+        Record the wall time and the RSS before and after a block of code. The rows and bytes it processed
+        can be set on the yielded record.
+
+        Parameters:
+        operation (str): The name of the operation, e.g. 'DataCleaning.clean_user_data'.
+
+        Yields:
+        dict: The record of the operation.
+        """
+        record = self.start_record(operation)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['status'] = 'error'
+            raise
+        finally:
+            self.finish_record(record, time.perf_counter() - start)
+
+    def to_dataframe(self):
+        """
+        Return the recorded operations as a DataFrame.
+        """
+        with self._lock:
+            records = list(self.records)
+        return pd.DataFrame(records, columns=['stage', 'operation', 'wall_time', 'rows', 'bytes', 'rss_before_bytes', 'rss_after_bytes', 'status'])
+
+    def write_json(self, path):
+        """
+        Write the recorded operations as a JSON run report, along with the peak RSS of the whole run.
+
+        Parameters:
+        path (str): The path of the JSON file.
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(path, 'w') as file:
+            json.dump({'peak_rss_bytes': peak_rss_bytes(), 'operations': records}, file, indent=2)
+
+    def write_csv(self, path):
+        """
+        Write the recorded operations as a CSV run report.
+
+        Parameters:
+        path (str): The path of the CSV file.
+        """
+        self.to_dataframe().to_csv(path, index=False, quoting=csv.QUOTE_MINIMAL)
+
+    def to_prometheus(self):
+        """
+        Export the totals per stage and operation in the Prometheus text exposition format.
+
+        Returns:
+        str: The metrics text.
+        """
+        metrics_df = self.to_dataframe()
+        lines = []
+        if metrics_df.empty:
+            return ''
+        metrics_df['stage'] = metrics_df['stage'].fillna('')
+        metrics_df['rss_growth_bytes'] = metrics_df['rss_after_bytes'] - metrics_df['rss_before_bytes']
+        totals = metrics_df.groupby(['stage', 'operation']).agg(
+            calls=('operation', 'size'), seconds=('wall_time', 'sum'), rows=('rows', 'sum'),
+            bytes=('bytes', 'sum'), rss_growth_bytes=('rss_growth_bytes', 'max'))
+
+        metric_help = {
+            'calls': ('pipeline_operation_calls_total', 'counter', 'Number of calls of each pipeline operation.'),
+            'seconds': ('pipeline_operation_seconds_total', 'counter', 'Wall time spent in each pipeline operation.'),
+            'rows': ('pipeline_operation_rows_total', 'counter', 'Rows processed by each pipeline operation.'),
+            'bytes': ('pipeline_operation_bytes_total', 'counter', 'Bytes of the DataFrames processed by each pipeline operation.'),
+            'rss_growth_bytes': ('pipeline_operation_rss_growth_bytes', 'gauge', 'Largest growth of the resident set size over one call of each pipeline operation.'),
+        }
+        for column, (metric, metric_type, description) in metric_help.items():
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {metric_type}')
+            for (stage, operation), value in totals[column].items():
+                if pd.notna(value):
+                    lines.append(f'{metric}{{stage="{stage}",operation="{operation}"}} {float(value):g}')
+
+        run_peak_rss = peak_rss_bytes()
+        if run_peak_rss is not None:
+            lines.append('# HELP pipeline_run_peak_rss_bytes Peak resident set size of the process over the whole run.')
+            lines.append('# TYPE pipeline_run_peak_rss_bytes gauge')
+            lines.append(f'pipeline_run_peak_rss_bytes {float(run_peak_rss):g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics in the Prometheus text exposition format, e.g. for the node exporter textfile collector.
+
+        Parameters:
+        path (str): The path of the .prom file.
+        """
+        with open(path, 'w') as file:
+            file.write(self.to_prometheus())
+
+
+# Metrics of the current pipeline run, shared by every instrumented class
+run_metrics = RunMetrics()
+
+
+def _set_size(record, df):
+    """
+    Set the rows and shallow bytes of a DataFrame on a record. The shallow size avoids walking every Python string.
+    """
+    if isinstance(df, pd.DataFrame):
+        record['rows'] = (record['rows'] or 0) + len(df)
+        record['bytes'] = (record['bytes'] or 0) + int(df.memory_usage(index=True, deep=False).sum())
+
+
+def instrumented(func):
+    """
+    Decorate a method so that every call is recorded in run_metrics with its wall time, rows, bytes and the RSS
+    before and after it.
+
+    The rows and bytes come from the DataFrame returned, or from the DataFrame passed in when nothing is
+    returned (e.g. uploads). For generators, the DataFrames yielded are summed over the whole iteration, and
+    only the time spent producing them is counted, not the time the consumer spends between two items.
+    """
+    operation = func.__qualname__
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            record = run_metrics.start_record(operation)
+            wall_time = 0.0
+            iterator = func(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        wall_time += time.perf_counter() - start
+                    _set_size(record, item)
+                    yield item
+            except Exception:
+                record['status'] = 'error'
+                raise
+            finally:
+                # Close the wrapped generator too when the consumer stops early
+                iterator.close()
+                run_metrics.finish_record(record, wall_time)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with run_metrics.measure(operation) as record:
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                _set_size(record, result)
+            else:
+                _set_size(record, next((arg for arg in args[1:] if isinstance(arg, pd.DataFrame)), None))
+            return result
+    return wrapper
+
+
+def instrument_class(cls):
+    """
+    Class decorator applying instrumented to every public method of the class.
+    """
+    for name, member in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(member):
+            setattr(cls, name, instrumented(member))
+    return cls
+
+
+def preview(df, n=5):
+    """
+    Build a short preview of a DataFrame instead of printing the whole frame.
+
+    Parameters:
+    df (pandas.DataFrame): The DataFrame to preview.
+    n (int): The number of sampled rows. Defaults to 5.
+
+    Returns:
+    str: The shape of the DataFrame followed by a sample of its rows.
+    """
+    sample_df = df.sample(n=min(n, len(df)), random_state=0).sort_index() if len(df) > n else df
+    return f"{len(df)} rows x {len(df.columns)} columns\n{sample_df.to_string(max_colwidth=40)}"
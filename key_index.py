@@ -0,0 +1,88 @@
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from database_utils import NATURAL_KEYS
+
+
+def _to_arrow(series):
+    """
+    Convert a key Series to an Arrow array, e.g. 16-byte UUIDs, Arrow strings or plain Python strings.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(series.cat.categories.dtype)
+    array = pa.array(series)
+    return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+
+
+class KeyIndex:
+    def __init__(self):
+        """
+        Initialise an empty in-memory index of the keys of the dimension tables.
+
+        The keys of each dimension table are held as one Arrow array of unique values, and the foreign keys of
+        the orders are looked up in it with a vectorized hash lookup, so that orphan orders are found before
+        the upload rather than by the foreign key constraints of milestone_3.sql failing after it.
+        """
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def add(self, table_name, df):
+        """
+        Add the keys of a cleaned dimension table to the index. The keys added for the same table are combined,
+        e.g. the users loaded by earlier incremental runs and the new users.
+
+        Parameters:
+        table_name (str): The name of the dimension table, e.g. 'dim_card_details'.
+        df (pandas.DataFrame): The cleaned dimension table, or only its key column.
+        """
+        column = NATURAL_KEYS[table_name][0]
+        keys = _to_arrow(df[column]).drop_null()
+        with self._lock:
+            if column in self._keys:
+                keys = pa.concat_arrays([self._keys[column], keys.cast(self._keys[column].type)])
+            self._keys[column] = pc.unique(keys)
+
+    def has(self, column):
+        """
+        Check whether the keys of a column have been added.
+
+        Parameters:
+        column (str): The key column, e.g. 'card_number'.
+
+        Returns:
+        bool: True if the dimension table holding the column has been added.
+        """
+        with self._lock:
+            return column in self._keys
+
+    def size(self, column):
+        """
+        Return the number of unique keys of a column.
+        """
+        with self._lock:
+            return len(self._keys[column])
+
+    def contains(self, column, values):
+        """
+        Check which values exist among the keys of a column. Missing values (NULL) pass, as for a foreign key.
+
+        Parameters:
+        column (str): The key column, e.g. 'card_number'.
+        values (pandas.Series): The foreign key values, e.g. the card numbers of the orders.
+
+        Returns:
+        numpy.ndarray: Boolean array, True where the value is a known key or missing.
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Look up each category once and broadcast the results to the rows through the codes. Code -1 is a missing value.
+            found = np.append(self.contains(column, pd.Series(values.cat.categories)), True)
+            return found[values.cat.codes.to_numpy()]
+
+        with self._lock:
+            keys = self._keys[column]
+        array = _to_arrow(values)
+        if array.type != keys.type:
+            keys = keys.cast(array.type)
+        return pc.or_(pc.is_in(array, value_set=keys), pc.is_null(array)).to_numpy(zero_copy_only=False)
@@ -1,151 +1,428 @@
-import pandas as pd
-import tabula
-import requests
-from database_utils import DatabaseConnector
-from data_extraction import DataExtractor
-from data_cleaning import DataCleaning
+import argparse
+import time
 
-def main():
-    # Initialize the DatabaseConnector for the local database
-    db_connector = DatabaseConnector(db_creds='db_creds.yml')
+# The stages a run can be limited to. 'orders' covers extracting, cleaning and uploading the orders.
+STAGES = ('users', 'cards', 'stores', 'products', 'dates', 'orders', 'reports')
 
-    # Initialize the DatabaseConnector for the RDS database
-    rds_db_connector = DatabaseConnector(db_creds='rds_db_creds.yml')
+# The dimension table loaded by each dimension stage
+DIMENSION_TABLES = {
+    'users': 'dim_users',
+    'cards': 'dim_card_details',
+    'stores': 'dim_store_details',
+    'products': 'dim_products',
+    'dates': 'dim_date_times',
+}
+
+def main(incremental=False, watermark_column='index', max_workers=6, orders_after_dimensions=False, use_cache=True, refresh_cache=False,
+         report_path='run_report', prometheus_path=None, build_reports=True, staging_dir='.staging', resume=False, check_orphans=True,
+         stages=None, async_http=False, store_max_age_hours=168, target_db=None):
+    """
+    Extract, clean and upload every data source, or only the chosen stages.
+
+    Parameters:
+    incremental (bool): Extract only the users and orders past the stored high-water marks and upsert them, and upsert
+                        the other dimension tables on their natural keys, instead of re-reading the RDS tables and
+                        replacing every table. The foreign keys on the dimension tables are kept. Defaults to False.
+    watermark_column (str): The monotonically increasing RDS column used as the high-water mark. Defaults to 'index'.
+    max_workers (int): The number of stages run concurrently. Defaults to 6.
+    orders_after_dimensions (bool): Upload the orders only after every dimension stage has succeeded,
+                                    e.g. when the foreign key constraints of milestone_3.sql are in place. Defaults to False.
+    use_cache (bool): Load unchanged PDF, JSON and S3 sources from the local cache, and request only the stores
+                      that are new, stale or due for a retry from the store API. Defaults to True.
+    refresh_cache (bool): Invalidate the local cache and the store snapshot before running. Defaults to False.
+    report_path (str): The path, without extension, of the JSON and CSV run reports of the time, rows, bytes
+                       and RSS of every operation. Defaults to 'run_report'.
+    prometheus_path (str): The path of a Prometheus text export of the run metrics, e.g. for the node exporter
+                           textfile collector. Defaults to None, no export.
+    build_reports (bool): After every stage has loaded, create the keys and indexes of the star schema and refresh
+                          the summary tables of the milestone_4.sql reports. Defaults to True.
+    staging_dir (str): The directory of the Parquet snapshots of the raw and cleaned data of every stage. Defaults to '.staging'.
+    resume (bool): Resume the most recent run from its staged data: the stages that were uploaded are skipped,
+                   and the others restart from their last complete layer instead of the sources. Defaults to False.
+    check_orphans (bool): Check the keys of the cleaned orders against the cleaned dimension tables before upload,
+                          quarantining the orphan orders and reporting the missing keys in orphans.csv. The orders are then
+                          uploaded only after every dimension stage has succeeded. Defaults to True.
+    stages (list): The stages to run, e.g. ['users', 'orders'], see STAGES. The orders of a partial run are checked
+                   against the keys of the dimension stages it runs and the dimension tables already loaded.
+                   Defaults to every stage, 'reports' only if build_reports is set.
+    async_http (bool): Fetch the store API and the date JSON with aiohttp on one event loop shared by the stages,
+                       streaming the JSON as it is decoded. The requests that fail are reported in fetch_errors.csv.
+                       Defaults to False.
+    store_max_age_hours (float): The age after which the details of a store in the snapshot are fetched again. Defaults to 168, one week.
+    target_db (str): The credentials file, with the keys of db_creds.yml, or the DSN of the database the cleaned data is
+                     uploaded to. Defaults to the local sales_data database.
+    """
+    if stages is None:
+        stages = [stage for stage in STAGES if stage != 'reports' or build_reports]
+    unknown_stages = set(stages) - set(STAGES)
+    if unknown_stages:
+        raise ValueError(f"Unknown stages {sorted(unknown_stages)}, expected some of {STAGES}.")
+
+    # Imported here rather than at the top, so that parsing the command line stays fast. The heavy
+    # dependencies of single stages, e.g. tabula or boto3, are imported by the stages that use them.
+    from database_utils import DatabaseConnector, TARGET_DATABASE, get_pool_stats
+    from data_extraction import DataExtractor, PRODUCTS_CSV_DTYPES, RDS_CHUNKSIZE
+    from data_cleaning import DataCleaning, SOURCE_COLUMNS, cleaning_workers
+    from source_cache import SourceCache
+    from store_snapshot import StoreSnapshot
+    from quarantine import QuarantineStore
+    from staging import StagingStore
+    from key_index import KeyIndex
+    from pipeline import PipelineTask, PipelineScheduler, print_timing_report
+    from instrumentation import run_metrics, preview
+
+    # Initialize the DatabaseConnector for the local database, uploading to the target database
+    db_connector = DatabaseConnector(db_creds='db_creds.yml', target=target_db or TARGET_DATABASE)
+
+    # Initialize the DatabaseConnector for the RDS database, only read by the users and orders stages
+    rds_db_connector = DatabaseConnector(db_creds='rds_db_creds.yml') if {'users', 'orders'} & set(stages) else None
+
+    # Initialize the local cache of the remote sources
+    source_cache = SourceCache() if use_cache else None
+    if source_cache is not None and refresh_cache:
+        source_cache.invalidate()
+    store_snapshot = StoreSnapshot(max_age_seconds=store_max_age_hours * 3600) if use_cache else None
+    if store_snapshot is not None and refresh_cache:
+        store_snapshot.clear()
 
     # Initialize the DataExtractor
-    data_extractor = DataExtractor(db_connector)
+    if async_http:
+        from async_extraction import AsyncDataExtractor
+
+        data_extractor = AsyncDataExtractor(db_connector, cache=source_cache)
+    else:
+        data_extractor = DataExtractor(db_connector, cache=source_cache)
     rds_data_extractor = DataExtractor(rds_db_connector)
 
-    # Initialize the DataCleaning
-    data_cleaning = DataCleaning()
+    # Initialize the DataCleaning, sending the rejected rows to the quarantine store
+    quarantine = QuarantineStore()
+    data_cleaning = DataCleaning(quarantine=quarantine)
+
+    # The users and every chunk of orders read from RDS are split across one cleaning process per core, up to 4.
+    # On a single core they are cleaned serially.
+    min_rows_per_shard = RDS_CHUNKSIZE // cleaning_workers()
+
+    def clean_rds_data(cleaner_name, df):
+        return data_cleaning.clean_sharded(cleaner_name, df, min_rows_per_shard=min_rows_per_shard)
+
+    # Initialize the index of the dimension keys the orders are checked against before upload
+    key_index = KeyIndex()
+    check_orphans = check_orphans and 'orders' in stages
+
+    # Initialize the staging store of the raw and cleaned data of every stage
+    staging = StagingStore.latest(staging_dir) if resume else StagingStore(staging_dir)
+    print(f"{'Resuming' if resume else 'Staging'} run {staging.run_id} in {staging.run_dir}.")
+
+    # The dimension tables read in full from their sources are upserted in incremental runs, so they keep their foreign keys
+    dimension_if_exists = 'upsert' if incremental else 'replace'
+
+    def upload_once(stage, df, table_name, part=None, **kwargs):
+        """
+        Upload a staged DataFrame unless this run has already uploaded it, then record the upload.
+        """
+        if staging.is_loaded(stage, part):
+            print(f"Skipping the upload of {table_name}{'' if part is None else f' chunk {part}'}, already uploaded by run {staging.run_id}.")
+            return
+        db_connector.upload_to_db(df, table_name, **kwargs)
+        staging.mark_loaded(stage, part)
 
     # --- Extract and clean user data from the database ---
-    try:
+    def process_users():
         rds_tables = rds_db_connector.list_db_tables()
         user_data_table = next((table for table in rds_tables if 'user' in table.lower()), None)
 
         if user_data_table:
             print("Table containing user data:", user_data_table)
-            user_data_df = rds_data_extractor.read_rds_table(user_data_table)
-            cleaned_user_data_df = data_cleaning.clean_user_data(user_data_df)
-            db_connector.upload_to_db(cleaned_user_data_df, 'dim_users')
-            print(cleaned_user_data_df)
+            if incremental:
+                watermark = db_connector.get_watermark(user_data_table)
+                user_data_df = staging.staged('users', 'raw', lambda: rds_data_extractor.read_rds_table(
+                    user_data_table, watermark_column=watermark_column, watermark=watermark, columns=SOURCE_COLUMNS['clean_user_data']))
+                if user_data_df.empty:
+                    print(f"No new user data past watermark {watermark}.")
+                else:
+                    # Take the new watermark before cleaning, which drops the index column
+                    new_watermark = user_data_df[watermark_column].max()
+                    cleaned_user_data_df = staging.staged('users', 'cleaned', lambda: clean_rds_data('clean_user_data', user_data_df))
+                    upload_once('users', cleaned_user_data_df, 'dim_users', if_exists='upsert',
+                                watermark=(user_data_table, new_watermark))
+                    print(preview(cleaned_user_data_df))
+                # The orders may reference users loaded by earlier runs, so every loaded user is indexed
+                if check_orphans:
+                    key_index.add('dim_users', db_connector.read_natural_keys('dim_users'))
+            else:
+                user_data_df = staging.staged('users', 'raw', lambda: rds_data_extractor.read_rds_table(
+                    user_data_table, columns=SOURCE_COLUMNS['clean_user_data']))
+                cleaned_user_data_df = staging.staged('users', 'cleaned', lambda: clean_rds_data('clean_user_data', user_data_df))
+                key_index.add('dim_users', cleaned_user_data_df)
+                upload_once('users', cleaned_user_data_df, 'dim_users')
+                print(preview(cleaned_user_data_df))
         else:
             print('No table containing user data found.')
-    except Exception as e:
-        print(f"Error processing user data: {e}")
 
     # --- Extract and clean card data from a PDF ---
-    try:
+    def process_cards():
         pdf_link = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf'
-        card_data_df = data_extractor.retrieve_pdf_data(pdf_link)
+        card_data_df = staging.staged('cards', 'raw', lambda: data_extractor.retrieve_pdf_data(pdf_link))
         print('Extracted Data:')
-        print(card_data_df)
+        print(preview(card_data_df))
 
         if not card_data_df.empty:
-            cleaned_card_data = data_cleaning.clean_card_data(card_data_df)
-            print("Cleaned Data:", cleaned_card_data)
-            db_connector.upload_to_db(cleaned_card_data, 'dim_card_details')
+            cleaned_card_data = staging.staged('cards', 'cleaned', lambda: data_cleaning.clean_card_data(card_data_df))
+            print("Cleaned Data:")
+            print(preview(cleaned_card_data))
+            key_index.add('dim_card_details', cleaned_card_data)
+            upload_once('cards', cleaned_card_data, 'dim_card_details', if_exists=dimension_if_exists)
             print("Cleaned card data has been uploaded to the 'dim_card_details' table in the 'sales_data' database.")
         else:
             print("No data extracted from the PDF.")
-    except Exception as e:
-        print(f"Error processing card data: {e}")
 
     # --- Extract and clean store data from the API ---
-    try:
+    def process_stores():
         store_details_endpoint = 'https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}'
-        all_store_data = data_extractor.retrieve_stores_data(store_details_endpoint)
-        
-        all_store_data.to_csv('extracted_store_data.csv', index=False)
+        number_stores_endpoint = 'https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores'
+        all_store_data = staging.staged('stores', 'raw', lambda: data_extractor.retrieve_stores_data(
+            store_details_endpoint, number_stores_endpoint, snapshot=store_snapshot))
+        if store_snapshot is not None and store_snapshot.last_refresh:
+            refresh = store_snapshot.last_refresh
+            print(f"Requested {refresh['requested']} of {refresh['stores']} stores from the API: "
+                  f"{refresh['changed']} new or changed, {refresh['failed']} failed and put on the retry list.")
         print("Extracted Store Data:")
-        print(all_store_data)
+        print(preview(all_store_data))
 
-        cleaned_store_data = data_cleaning.clean_store_data(all_store_data)
-        cleaned_store_data.to_csv('cleaned_store_data.csv', index=False)
-        print("Cleaned Store Data:")
-        print(cleaned_store_data)
+        def clean_stores():
+            cleaned_store_data = data_cleaning.clean_store_data(all_store_data)
+            cleaned_store_data.reset_index(drop=True, inplace=True)
+            if 'index' in cleaned_store_data.columns:
+                cleaned_store_data.drop(columns=['index'], inplace=True)
+            return cleaned_store_data
 
-        cleaned_store_data.reset_index(drop=True, inplace=True)
-        if 'index' in cleaned_store_data.columns:
-            cleaned_store_data.drop(columns=['index'], inplace=True)
+        cleaned_store_data = staging.staged('stores', 'cleaned', clean_stores)
+        print("Cleaned Store Data:")
+        print(preview(cleaned_store_data))
 
         print("DataFrame columns before uploading:")
         print(cleaned_store_data.columns)
 
-        db_connector.upload_to_db(cleaned_store_data, 'dim_store_details')
+        key_index.add('dim_store_details', cleaned_store_data)
+        upload_once('stores', cleaned_store_data, 'dim_store_details', if_exists=dimension_if_exists)
         print("Cleaned store data has been uploaded to the 'dim_store_details' table in the 'sales_data' database.")
-    except Exception as e:
-        print(f"Error processing store data: {e}")
 
     # --- Extract and clean product data from S3 ---
-    try:
+    def process_products():
         s3_address = 's3://data-handling-public/products.csv'
-        products_data_df = data_extractor.extract_from_s3(s3_address)
+        products_data_df = staging.staged('products', 'raw', lambda: data_extractor.extract_from_s3(s3_address, dtype=PRODUCTS_CSV_DTYPES))
         print("Extracted Products Data:")
-        print(products_data_df)
-
-        products_data_df['product_price'] = products_data_df['product_price'].astype(str)
-        products_data_df['product_price_clean'] = products_data_df['product_price'].str.replace('£', '').str.replace(',', '')
-        products_data_df['product_price_numeric_check'] = products_data_df['product_price_clean'].apply(lambda x: x.replace('.', '', 1).isdigit())
-        non_numeric_prices = products_data_df[~products_data_df['product_price_numeric_check']]
-        print("Problematic Rows:")
-        print(non_numeric_prices)
-        products_data_df = products_data_df[products_data_df['product_price_numeric_check']]
+        print(preview(products_data_df))
 
         if not products_data_df.empty:
-            cleaned_products_data = data_cleaning.clean_products_data(products_data_df)
+            cleaned_products_data = staging.staged('products', 'cleaned', lambda: data_cleaning.clean_products_data(products_data_df))
             print("Cleaned Products Data:")
-            print(cleaned_products_data)
-            db_connector.upload_to_db(cleaned_products_data, 'dim_products')
+            print(preview(cleaned_products_data))
+            key_index.add('dim_products', cleaned_products_data)
+            upload_once('products', cleaned_products_data, 'dim_products', if_exists=dimension_if_exists)
             print("Cleaned products data has been uploaded to the 'dim_products' table in the 'sales_data' database.")
         else:
             print("No product data extracted from S3.")
-    except Exception as e:
-        print(f"Error processing product data: {e}")
 
     # --- Extract and clean orders data from RDS database ---
-    try:
+    def process_orders():
         rds_tables = rds_db_connector.list_db_tables()
         orders_table = 'orders_table'
 
         if orders_table in rds_tables:
             print("Table containing orders data:", orders_table)
-            orders_df = rds_data_extractor.read_rds_table(orders_table)
-            print("Extracted Orders Data:")
-            print(orders_df)
 
-            cleaned_orders_df = data_cleaning.clean_orders_data(orders_df)
-            print("Cleaned Orders Data:")
-            print(cleaned_orders_df)
+            if staging.is_complete('orders', 'cleaned'):
+                print("Orders already cleaned by this run.")
+                return
+            if staging.is_complete('orders', 'raw'):
+                # Resume from the staged chunks, skipping the ones already cleaned
+                cleaned_parts = set(staging.parts('orders', 'cleaned'))
+                orders_parts = staging.iter_parts('orders', 'raw', parts=[part for part in staging.parts('orders', 'raw')
+                                                                         if part not in cleaned_parts])
+            else:
+                # Stream the orders through cleaning and staging one chunk at a time, reading only the columns the cleaner keeps
+                if incremental:
+                    watermark = db_connector.get_watermark(orders_table)
+                    orders_chunks = rds_data_extractor.read_rds_table_chunks(orders_table, watermark_column=watermark_column, watermark=watermark,
+                                                                             columns=SOURCE_COLUMNS['clean_orders_data'])
+                else:
+                    orders_chunks = rds_data_extractor.read_rds_table_chunks(orders_table, columns=SOURCE_COLUMNS['clean_orders_data'])
+                orders_parts = staging.write_parts('orders', 'raw', orders_chunks)
 
-            db_connector.upload_to_db(cleaned_orders_df, 'orders_table')
-            print("Cleaned orders data has been uploaded to the 'orders_table'.")
+            for chunk_number, orders_df in orders_parts:
+                cleaned_orders_df = staging.staged('orders', 'cleaned', lambda: clean_rds_data('clean_orders_data', orders_df),
+                                                   part=chunk_number)
+                print(f"Cleaned orders chunk {chunk_number}: {len(orders_df)} rows extracted, {len(cleaned_orders_df)} rows cleaned.")
+            staging.commit('orders', 'cleaned')
         else:
             print(f'Table {orders_table} not found in RDS database.')
-    except Exception as e:
-        print(f"Error processing orders data: {e}")
+
+    # --- Check the cleaned orders against the dimension keys and upload them ---
+    def process_orders_upload():
+        if not staging.is_complete('orders', 'cleaned'):
+            print("No cleaned orders to upload.")
+            return
+
+        if check_orphans:
+            # The dimensions this run does not load are checked against the keys already in the target database
+            loaded_tables = db_connector.list_db_tables(db_connector.target_engine())
+            for stage, table_name in DIMENSION_TABLES.items():
+                if stage in stages:
+                    continue
+                if table_name in loaded_tables:
+                    key_index.add(table_name, db_connector.read_natural_keys(table_name))
+                else:
+                    print(f"Not checking the orders against {table_name}, which has not been loaded.")
+
+        total_rows = 0
+        # The staged chunks are read back one at a time, skipping the ones already uploaded
+        for chunk_number, cleaned_orders_df in staging.iter_parts('orders', 'cleaned', parts=[
+                part for part in staging.parts('orders', 'cleaned') if not staging.is_loaded('orders', part)]):
+            if check_orphans:
+                cleaned_orders_df = data_cleaning.remove_orphans(cleaned_orders_df, key_index)
+            if incremental:
+                # Each chunk commits its own watermark, so an interrupted run resumes after the last chunk
+                new_watermark = staging.read('orders', 'raw', columns=[watermark_column], part=chunk_number)[watermark_column].max()
+                upload_once('orders', cleaned_orders_df, 'orders_table', part=chunk_number, if_exists='upsert',
+                            watermark=('orders_table', new_watermark))
+            else:
+                if_exists = 'replace' if chunk_number == 0 else 'append'
+                upload_once('orders', cleaned_orders_df, 'orders_table', part=chunk_number, if_exists=if_exists)
+            total_rows += len(cleaned_orders_df)
+            print(f"Uploaded orders chunk {chunk_number}: {len(cleaned_orders_df)} rows.")
+        staging.mark_loaded('orders')
+
+        print(f"Cleaned orders data has been uploaded to the 'orders_table' ({total_rows} rows).")
 
     # --- Extract and clean date data from JSON ---
-    try:
+    def process_dates():
         json_url = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json'
-        date_data_df = data_extractor.extract_json_data(json_url)
+        date_data_df = staging.staged('dates', 'raw', lambda: data_extractor.extract_json_data(json_url))
         print("Extracted Date Data:")
-        print(date_data_df)
+        print(preview(date_data_df))
 
         print("Columns in the extracted date data:")
         print(date_data_df.columns)
 
         if not date_data_df.empty:
-            cleaned_date_data = data_cleaning.clean_date_data(date_data_df)
+            cleaned_date_data = staging.staged('dates', 'cleaned', lambda: data_cleaning.clean_date_data(date_data_df))
             print("Cleaned Date Data:")
-            print(cleaned_date_data)
-            db_connector.upload_to_db(cleaned_date_data, 'dim_date_times')
+            print(preview(cleaned_date_data))
+            key_index.add('dim_date_times', cleaned_date_data)
+            upload_once('dates', cleaned_date_data, 'dim_date_times', if_exists=dimension_if_exists)
             print("Cleaned date data has been uploaded to the 'dim_date_times' table in the 'sales_data' database.")
         else:
             print("No date data extracted from JSON.")
-    except Exception as e:
-        print(f"Error processing date data: {e}")
+
+    # --- Create the keys and refresh the report summary tables once everything has loaded ---
+    def process_reports():
+        from reporting import ReportBuilder
+
+        report_builder = ReportBuilder(db_connector)
+        for name, status in report_builder.create_constraints().items():
+            if status.startswith('failed'):
+                print(f"Could not create {name}: {status}")
+        for summary_table, kind in report_builder.refresh_summaries().items():
+            print(f"Refreshed {summary_table} ({kind}).")
+
+    # --- Run the chosen stages, the independent ones concurrently ---
+    dimension_stages = [stage for stage in DIMENSION_TABLES if stage in stages]
+    tasks = [
+        PipelineTask('users', process_users),
+        PipelineTask('cards', process_cards),
+        PipelineTask('stores', process_stores),
+        PipelineTask('products', process_products),
+        PipelineTask('orders', process_orders),
+        # Extracting and cleaning the orders runs alongside the dimensions, checking them against the dimension keys waits for them
+        PipelineTask('orders_upload', process_orders_upload,
+                     depends_on=['orders'] + (dimension_stages if check_orphans or orders_after_dimensions else [])),
+        PipelineTask('dates', process_dates),
+        PipelineTask('reports', process_reports, depends_on=dimension_stages + (['orders_upload'] if 'orders' in stages else [])),
+    ]
+    tasks = [task for task in tasks if task.name.split('_')[0] in stages]
+    start = time.perf_counter()
+    results = PipelineScheduler(tasks, max_workers=max_workers).run()
+    data_cleaning.close()
+    print_timing_report(results, time.perf_counter() - start)
+
+    # --- Report the rows in, out and rejected per rule of every table ---
+    rejection_summary = data_cleaning.rejection_summary()
+    quarantine.write_summary(rejection_summary)
+    print(f"Rejected rows of run {quarantine.run_id} (quarantined in {quarantine.run_dir}):")
+    print(rejection_summary.to_string(index=False))
+
+    # --- Report the dimension keys missing for the orphan orders ---
+    if check_orphans:
+        orphan_summary = data_cleaning.orphan_summary()
+        quarantine.write_summary(orphan_summary, 'orphans.csv')
+        for column, keys_df in orphan_summary.groupby('column'):
+            print(f"Orphan orders on {column}: {keys_df['orders'].sum()} orders referencing {len(keys_df)} missing keys.")
+
+    # --- Report the requests of the HTTP sources that failed after their retries ---
+    if async_http:
+        data_extractor.close()
+        fetch_errors = data_extractor.error_summary()
+        quarantine.write_summary(fetch_errors, 'fetch_errors.csv')
+        for kind, errors_df in fetch_errors.groupby('kind'):
+            print(f"Failed {kind} requests: {len(errors_df)}, e.g. {errors_df['url'].iloc[0]}.")
+
+    # --- Report the memory of every cleaned table before and after the column type conversion ---
+    for table_name, memory in data_cleaning.memory_report.items():
+        print(f"Memory of {table_name}: {memory['before'] / 1e6:.1f} MB before, {memory['after'] / 1e6:.1f} MB after column type conversion.")
+
+    # --- Write the time, rows, bytes and RSS of every operation ---
+    run_metrics.write_json(f'{report_path}.json')
+    run_metrics.write_csv(f'{report_path}.csv')
+    if prometheus_path:
+        run_metrics.write_prometheus(prometheus_path)
+    print(f"Run report written to {report_path}.json and {report_path}.csv.")
+
+    # --- Report connection pool pressure per database ---
+    for url, stats in get_pool_stats().items():
+        print(f"Connection pool {url}: {stats['checkouts']} checkouts, {stats['wait_time']:.3f}s waiting. {stats['status']}")
+
+def parse_args(argv=None):
+    """
+    Parse the command line of the pipeline.
+
+    Parameters:
+    argv (list): The arguments. Defaults to sys.argv[1:].
+
+    Returns:
+    dict: The keyword arguments of main.
+    """
+    parser = argparse.ArgumentParser(description='Extract, clean and upload the retail data sources into the sales_data database.')
+    parser.add_argument('--only', type=lambda value: [stage.strip() for stage in value.split(',') if stage.strip()],
+                        help=f"Comma-separated stages to run, e.g. 'users,orders', out of {', '.join(STAGES)}. Defaults to every stage.")
+    parser.add_argument('--incremental', action='store_true',
+                        help='Extract and upsert only the users and orders past the stored high-water marks, and upsert the other dimension tables.')
+    parser.add_argument('--watermark-column', default='index', help="The RDS column used as the high-water mark. Defaults to 'index'.")
+    parser.add_argument('--max-workers', type=int, default=6, help='The number of stages run concurrently. Defaults to 6.')
+    parser.add_argument('--orders-after-dimensions', action='store_true', help='Upload the orders only after every dimension stage has succeeded.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='Always download the PDF, JSON and S3 sources and every store.')
+    parser.add_argument('--refresh-cache', action='store_true', help='Invalidate the local cache of the sources and the store snapshot before running.')
+    parser.add_argument('--store-max-age-hours', type=float, default=168,
+                        help='The age after which the details of a store are fetched again. Defaults to 168, one week.')
+    parser.add_argument('--report-path', default='run_report', help="The path, without extension, of the run reports. Defaults to 'run_report'.")
+    parser.add_argument('--prometheus-path', help='The path of a Prometheus text export of the run metrics.')
+    parser.add_argument('--no-reports', dest='build_reports', action='store_false', help='Do not refresh the report summary tables.')
+    parser.add_argument('--staging-dir', default='.staging', help="The directory of the staged data. Defaults to '.staging'.")
+    parser.add_argument('--resume', action='store_true', help='Resume the most recent run from its staged data.')
+    parser.add_argument('--async-http', action='store_true',
+                        help='Fetch the store API and the date JSON with aiohttp on one shared event loop.')
+    parser.add_argument('--target-db',
+                        help='The credentials file or DSN of the database the cleaned data is uploaded to. Defaults to the local sales_data database.')
+    parser.add_argument('--no-orphan-check', dest='check_orphans', action='store_false',
+                        help='Upload the orders without checking their keys against the dimension tables.')
+    args = parser.parse_args(argv)
+    unknown_stages = set(args.only or []) - set(STAGES)
+    if unknown_stages:
+        parser.error(f"unknown stages {', '.join(sorted(unknown_stages))}, expected some of {', '.join(STAGES)}")
+    kwargs = vars(args)
+    kwargs['stages'] = kwargs.pop('only')
+    return kwargs
+
 
 if __name__ == "__main__":
-    main()
+    main(**parse_args())
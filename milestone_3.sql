@@ -1,3 +1,6 @@
+-- DatabaseConnector.upload_to_db creates the tables with the column types below before
+-- bulk loading them, so the type casts in Tasks 1-7 are no-ops on a fresh load.
+
 --Task 1: Cast columns of orders_table to the correct data types
 ALTER TABLE orders_table
     ALTER COLUMN date_uuid TYPE UUID USING date_uuid::UUID,
@@ -54,8 +57,8 @@ UPDATE dim_store_details
     WHERE locality = 'N/A';
 
 --Task 4: Remove the £ character from the product_price column
-UPDATE dim_products
-SET product_price = REPLACE(product_price, '£', '');
+-- DataCleaning.clean_products_data parses the prices into numbers, so product_price
+-- is loaded as FLOAT without the £ and no UPDATE is needed.
 
 
 -- Populate the weight_class column based on weight ranges
@@ -96,9 +99,10 @@ ALTER TABLE dim_products
 
 -- Task 6: Alter the dim_date_times table to update column data types
 ALTER TABLE dim_date_times
-    ALTER COLUMN month TYPE VARCHAR(10),
-    ALTER COLUMN year TYPE VARCHAR(4),
-    ALTER COLUMN day TYPE VARCHAR(2),
+    ALTER COLUMN month TYPE SMALLINT USING month::SMALLINT,
+    ALTER COLUMN year TYPE SMALLINT USING year::SMALLINT,
+    ALTER COLUMN day TYPE SMALLINT USING day::SMALLINT,
+    ALTER COLUMN full_timestamp TYPE TIMESTAMP,
     ALTER COLUMN time_period TYPE VARCHAR(20),
     ALTER COLUMN date_uuid TYPE UUID USING date_uuid::UUID;
 
@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from instrumentation import run_metrics
+
+class PipelineTask:
+    def __init__(self, name, func, depends_on=()):
+        """
+        Initialise a pipeline task.
+
+        Parameters:
+        name (str): The unique name of the task, e.g. 'users'.
+        func (callable): The function running the task. It takes no arguments.
+        depends_on (iterable): The names of the tasks that must succeed before this task starts.
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class PipelineScheduler:
+    def __init__(self, tasks, max_workers=6):
+        """
+        Initialise the scheduler with the tasks of the pipeline.
+
+        Parameters:
+        tasks (list): The PipelineTask objects to run.
+        max_workers (int): The number of tasks run concurrently. Defaults to 6.
+        """
+        self.tasks = {task.name: task for task in tasks}
+        self.max_workers = max_workers
+        self._validate()
+
+    def _validate(self):
+        """
+        Check that every dependency exists and that the dependencies do not form a cycle.
+        """
+        for task in self.tasks.values():
+            for dependency in task.depends_on:
+                if dependency not in self.tasks:
+                    raise ValueError(f"Task '{task.name}' depends on unknown task '{dependency}'.")
+
+        visited = set()
+        in_progress = set()
+
+        def visit(name):
+            if name in in_progress:
+                raise ValueError(f"Dependency cycle detected at task '{name}'.")
+            if name in visited:
+                return
+            in_progress.add(name)
+            for dependency in self.tasks[name].depends_on:
+                visit(dependency)
+            in_progress.remove(name)
+            visited.add(name)
+
+        for name in self.tasks:
+            visit(name)
+
+    def _run_task(self, task):
+        """
+        Run a single task and time it. The operations it calls are recorded in run_metrics under the task name.
+
+        Parameters:
+        task (PipelineTask): The task to run.
+
+        Returns:
+        dict: The status, duration in seconds and error of the task.
+        """
+        start = time.perf_counter()
+        try:
+            with run_metrics.stage(task.name):
+                task.func()
+            return {'status': 'success', 'duration': time.perf_counter() - start, 'error': None}
+        except Exception as e:
+            print(f"Error processing {task.name} data: {e}")
+            return {'status': 'failed', 'duration': time.perf_counter() - start, 'error': str(e)}
+
+    def run(self):
+        """
+        Run the tasks on a worker pool, starting each task as soon as all of its dependencies have succeeded.
+
+        A failed task does not stop the other tasks. The tasks depending on it are skipped.
+
+        Returns:
+        dict: A dictionary mapping each task name to its status, duration in seconds and error.
+        """
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    dependency_results = [results.get(dependency) for dependency in task.depends_on]
+                    if any(result is not None and result['status'] != 'success' for result in dependency_results):
+                        results[name] = {'status': 'skipped', 'duration': 0.0, 'error': 'A dependency did not succeed.'}
+                        del pending[name]
+                    elif all(result is not None for result in dependency_results):
+                        running[executor.submit(self._run_task, task)] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return results
+
+
+def print_timing_report(results, total_duration):
+    """
+    Print the status and duration of every task and the end-to-end duration of the pipeline.
+
+    Parameters:
+    results (dict): The results returned by PipelineScheduler.run.
+    total_duration (float): The end-to-end duration of the pipeline in seconds.
+    """
+    print("Pipeline timing:")
+    for name, result in results.items():
+        print(f"  {name:<10} {result['status']:<8} {result['duration']:8.2f}s")
+    print(f"  {'total':<10} {'':<8} {total_duration:8.2f}s")
@@ -0,0 +1,77 @@
+import os
+import threading
+import uuid
+from datetime import datetime
+import pandas as pd
+from column_types import is_uuid_dtype, uuid_bytes_to_strings
+
+class QuarantineStore:
+    def __init__(self, output_dir='quarantine', run_id=None):
+        """
+        Initialise a store for the rows rejected by the DataCleaning rules.
+
+        The rejected rows of each table are written as Parquet files under output_dir/run_id/,
+        tagged with the name of the rule that rejected them and the run id.
+
+        Parameters:
+        output_dir (str): The directory holding the quarantined rows. Defaults to 'quarantine'.
+        run_id (str): The id of the pipeline run. Defaults to a timestamp followed by a random suffix.
+        """
+        self.output_dir = output_dir
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.run_dir = os.path.join(output_dir, self.run_id)
+        self._part_numbers = {}
+        self._lock = threading.Lock()
+
+    def add(self, table_name, rule_name, rejected_df):
+        """
+        Write the rows rejected by one rule to a new Parquet part of the table.
+
+        Parameters:
+        table_name (str): The name of the table the rows were rejected from.
+        rule_name (str): The name of the rule that rejected them.
+        rejected_df (pandas.DataFrame): The rejected rows.
+        """
+        with self._lock:
+            part_number = self._part_numbers.get(table_name, 0)
+            self._part_numbers[table_name] = part_number + 1
+        table_dir = os.path.join(self.run_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+
+        # The rejected values are kept as text, as they are often the ones that failed to parse. Rows rejected after the
+        # column type conversion, e.g. orphan orders, store their UUIDs and categories as text too, so every part has the same schema.
+        quarantined_df = rejected_df.astype({column: 'string' for column in rejected_df.columns
+                                             if rejected_df[column].dtype == object or isinstance(rejected_df[column].dtype, pd.CategoricalDtype)})
+        for column in quarantined_df.columns:
+            if is_uuid_dtype(quarantined_df[column].dtype):
+                quarantined_df[column] = uuid_bytes_to_strings(quarantined_df[column]).astype('string')
+        quarantined_df = quarantined_df.assign(rejection_rule=rule_name, run_id=self.run_id)
+        # The process id keeps the parts written by sharded cleaning workers apart
+        quarantined_df.to_parquet(os.path.join(table_dir, f'part-{os.getpid()}-{part_number:05d}.parquet'), index=False)
+
+    def read(self, table_name):
+        """
+        Read back the quarantined rows of a table for this run.
+
+        Parameters:
+        table_name (str): The name of the table.
+
+        Returns:
+        pandas.DataFrame: The rejected rows with their rejection_rule and run_id, empty if there are none.
+        """
+        table_dir = os.path.join(self.run_dir, table_name)
+        if not os.path.isdir(table_dir):
+            return pd.DataFrame()
+        return pd.read_parquet(table_dir)
+
+    def write_summary(self, summary_df, file_name='summary.csv'):
+        """
+        Write the run summary of rows in, out and rejected per rule next to the quarantined rows.
+
+        Parameters:
+        summary_df (pandas.DataFrame): The summary returned by DataCleaning.rejection_summary, or another
+                                       report of the run such as DataCleaning.orphan_summary.
+        file_name (str): The name of the CSV file. Defaults to 'summary.csv'.
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        summary_df.assign(run_id=self.run_id).to_csv(os.path.join(self.run_dir, file_name), index=False)
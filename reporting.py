@@ -0,0 +1,400 @@
+import argparse
+import re
+import time
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from database_utils import FOREIGN_KEYS, LOAD_TIMESTAMP_COLUMN, LOAD_TIMESTAMP_TABLES
+from instrumentation import instrument_class
+
+FACT_TABLE = 'orders_table'
+
+# Local state table holding the time each summary table was last refreshed
+REFRESH_TABLE = 'report_refreshes'
+
+# Summary tables of the orders, each aggregated per group of its grain. A refresh recomputes only the groups
+# of the orders loaded since the last refresh, so a new month of orders does not rescan the older months.
+# A change to a joined dimension can move orders between groups, so it rebuilds the whole table instead.
+SUMMARY_TABLES = {
+    # Sales per month and store type, serving queries 4.4, 4.6 and 4.7. The dimensions are left joined so that the
+    # orders without a store, product or date still count towards the queries that do not join that dimension.
+    'report_sales_summary': {
+        'columns': {
+            'year': 'SMALLINT',
+            'month': 'SMALLINT',
+            'store_type': 'VARCHAR(255)',
+            'number_of_sales': 'BIGINT NOT NULL',
+            'product_quantity': 'BIGINT',
+            'total_sales': 'FLOAT',
+        },
+        'group_by': {'year': 'dt.year', 'month': 'dt.month', 'store_type': 'd.store_type'},
+        'aggregates': {
+            'number_of_sales': 'COUNT(*)',
+            'product_quantity': 'SUM(o.product_quantity)',
+            'total_sales': 'SUM(o.product_quantity * p.product_price)',
+        },
+        'joins': """LEFT JOIN dim_date_times dt ON o.date_uuid = dt.date_uuid
+            LEFT JOIN dim_store_details d ON o.store_code = d.store_code
+            LEFT JOIN dim_products p ON o.product_code = p.product_code""",
+        'dimensions': ['dim_date_times', 'dim_store_details', 'dim_products'],
+    },
+    # First and last sale and number of sales per year, serving query 4.8: the differences between consecutive
+    # sales add up to the last minus the first sale, so their average is (last - first) / (number of sales - 1).
+    'report_sale_times': {
+        'columns': {
+            'year': 'SMALLINT',
+            'first_sale': 'TIMESTAMP',
+            'last_sale': 'TIMESTAMP',
+            'number_of_sales': 'BIGINT NOT NULL',
+        },
+        'group_by': {'year': 'dt.year'},
+        'aggregates': {
+            'first_sale': 'MIN(dt.full_timestamp)',
+            'last_sale': 'MAX(dt.full_timestamp)',
+            'number_of_sales': 'COUNT(*)',
+        },
+        'joins': 'JOIN dim_date_times dt ON o.date_uuid = dt.date_uuid',
+        'dimensions': ['dim_date_times'],
+    },
+}
+
+# Indexes created after every load: on the join columns of the orders, and on the sale timestamps that the
+# window of query 4.8 partitions by year and sorts
+TABLE_INDEXES = {
+    FACT_TABLE: [(column,) for column in [*FOREIGN_KEYS, LOAD_TIMESTAMP_COLUMN]],
+    'dim_date_times': [('year', 'full_timestamp')],
+}
+
+# The queries of milestone_4.sql that join the orders, answered from the summary tables
+SUMMARY_QUERIES = {
+    '4.4': """
+        SELECT
+            SUM(number_of_sales) AS numbers_of_sales,
+            SUM(product_quantity) AS product_quantity_count,
+            CASE
+                WHEN LOWER(store_type) = 'web portal' THEN 'Web'
+                ELSE 'Offline'
+            END AS location
+        FROM report_sales_summary
+        WHERE store_type IS NOT NULL
+        GROUP BY location
+        ORDER BY location""",
+    '4.6': """
+        WITH total_sales AS (
+            SELECT store_type, SUM(total_sales) AS total_sales
+            FROM report_sales_summary
+            WHERE store_type IS NOT NULL
+            GROUP BY store_type
+            HAVING SUM(total_sales) IS NOT NULL
+        ),
+        total_revenue AS (
+            SELECT SUM(total_sales) AS grand_total
+            FROM total_sales
+        )
+        SELECT
+            t.store_type,
+            t.total_sales,
+            ROUND(CAST((t.total_sales / tr.grand_total) * 100 AS NUMERIC), 2) AS percentage_total
+        FROM total_sales t, total_revenue tr
+        ORDER BY t.total_sales DESC""",
+    '4.7': """
+        SELECT SUM(total_sales) AS total_sales, year, month
+        FROM report_sales_summary
+        WHERE year IS NOT NULL
+        GROUP BY year, month
+        HAVING SUM(total_sales) IS NOT NULL
+        ORDER BY total_sales DESC
+        LIMIT 10""",
+    '4.8': """
+        WITH average_time AS (
+            SELECT
+                year,
+                EXTRACT(EPOCH FROM last_sale - first_sale) / (number_of_sales - 1) AS avg_time_seconds
+            FROM report_sale_times
+            WHERE number_of_sales > 1
+        )
+        SELECT
+            year,
+            CONCAT(
+                '"hours": ', FLOOR(avg_time_seconds / 3600), ', ',
+                '"minutes": ', FLOOR((avg_time_seconds % 3600) / 60), ', ',
+                '"seconds": ', FLOOR(avg_time_seconds % 60), ', ',
+                '"milliseconds": ', ROUND((avg_time_seconds - FLOOR(avg_time_seconds)) * 1000)
+            ) AS actual_time_taken
+        FROM average_time
+        ORDER BY year""",
+}
+
+QUERY_HEADING = re.compile(r'^-- (\d+\.\d+):', re.MULTILINE)
+
+
+def read_milestone_queries(path='milestone_4.sql'):
+    """
+    Read the queries of a milestone SQL file, each starting with a '-- 4.x:' heading comment.
+
+    Parameters:
+    path (str): The path of the SQL file. Defaults to 'milestone_4.sql'.
+
+    Returns:
+    dict: A dictionary mapping each query number, e.g. '4.7', to its SQL.
+    """
+    with open(path, 'r') as file:
+        sql = file.read()
+    headings = list(QUERY_HEADING.finditer(sql))
+    queries = {}
+    for heading, next_heading in zip(headings, headings[1:] + [None]):
+        end = next_heading.start() if next_heading else len(sql)
+        queries[heading.group(1)] = sql[heading.start():end].strip()
+    return queries
+
+
+def _error_message(error):
+    """
+    Return the database message of a failed statement without the SQL that SQLAlchemy appends.
+    """
+    return str(getattr(error, 'orig', error)).strip().splitlines()[0]
+
+
+@instrument_class
+class ReportBuilder:
+    def __init__(self, db_connector):
+        """
+        Initialise the ReportBuilder with the database the cleaned data is uploaded to.
+
+        Parameters:
+        db_connector (DatabaseConnector): The connector uploading the cleaned data, whose target database is reported on.
+        """
+        self.engine = db_connector.target_engine()
+
+    def _add_constraint(self, connection, name, statement, existing, results):
+        """
+        Add a constraint unless it exists, recording whether it was created, already existed or failed.
+        A failure, e.g. a duplicate key or an order referencing a missing dimension row, does not stop the others.
+        """
+        if name in existing:
+            results[name] = 'exists'
+            return
+        try:
+            with connection.begin_nested():
+                connection.execute(text(statement))
+            results[name] = 'created'
+        except SQLAlchemyError as e:
+            results[name] = f'failed: {_error_message(e)}'
+
+    def _create_index(self, connection, table_name, columns, existing, results):
+        """
+        Create an index unless it exists, recording whether it was created, already existed or failed,
+        e.g. because the table was loaded without one of the columns.
+        """
+        index_name = f'{table_name}_{"_".join(columns)}_idx'
+        if index_name in existing:
+            results[index_name] = 'exists'
+            return
+        try:
+            with connection.begin_nested():
+                column_list = ', '.join(f'"{column}"' for column in columns)
+                connection.execute(text(f'CREATE INDEX "{index_name}" ON "{table_name}" ({column_list})'))
+            results[index_name] = 'created'
+        except SQLAlchemyError as e:
+            results[index_name] = f'failed: {_error_message(e)}'
+
+    def create_constraints(self):
+        """
+        Create the primary keys of the dimension tables, the foreign keys of the orders and the indexes of TABLE_INDEXES,
+        skipping the ones that exist. Replacing a table drops its keys and indexes, so this runs after every load.
+
+        Returns:
+        dict: A dictionary mapping each constraint and index name to 'created', 'exists' or 'failed: <reason>'.
+        """
+        results = {}
+        with self.engine.begin() as connection:
+            existing = {row[0] for row in connection.execute(text(
+                "SELECT conname FROM pg_constraint WHERE connamespace = 'public'::regnamespace"))}
+            tables = {row[0] for row in connection.execute(text(
+                "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"))}
+
+            for column, table_name in FOREIGN_KEYS.items():
+                if table_name in tables:
+                    self._add_constraint(connection, f'pk_{column}',
+                                         f'ALTER TABLE "{table_name}" ADD CONSTRAINT "pk_{column}" PRIMARY KEY ("{column}")',
+                                         existing, results)
+
+            # Tables loaded with to_sql, or before they were stamped, have no load timestamp yet
+            for table_name in sorted(LOAD_TIMESTAMP_TABLES & tables):
+                connection.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS "{LOAD_TIMESTAMP_COLUMN}" '
+                                        'TIMESTAMPTZ NOT NULL DEFAULT NOW()'))
+
+            if FACT_TABLE in tables:
+                for column, table_name in FOREIGN_KEYS.items():
+                    if table_name in tables:
+                        self._add_constraint(connection, f'fk_{column}',
+                                             f'ALTER TABLE "{FACT_TABLE}" ADD CONSTRAINT "fk_{column}" '
+                                             f'FOREIGN KEY ("{column}") REFERENCES "{table_name}" ("{column}")',
+                                             existing, results)
+
+            indexes = {row[0] for row in connection.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'"))}
+            for table_name, table_indexes in TABLE_INDEXES.items():
+                if table_name in tables:
+                    for columns in table_indexes:
+                        self._create_index(connection, table_name, columns, indexes, results)
+        return results
+
+    def _dimensions_changed(self, connection, dimension_tables, since):
+        """
+        Check whether any row of the given dimension tables was loaded or changed after a time. A table without a
+        load timestamp counts as changed, as there is no telling.
+        """
+        for table_name in dimension_tables:
+            if LOAD_TIMESTAMP_COLUMN not in self._column_types(connection, table_name):
+                return True
+            if connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{table_name}" WHERE "{LOAD_TIMESTAMP_COLUMN}" > :since)'),
+                                  {'since': since}).scalar():
+                return True
+        return False
+
+    def _refresh_summary(self, connection, summary_table, full):
+        """
+        Refresh one summary table in the open transaction.
+
+        The groups of the orders loaded since the last refresh are deleted and aggregated again from all of
+        their orders, which covers new orders as well as upserted ones. The whole table is rebuilt on the first
+        refresh, when full is set, when every order is newer than the last refresh, i.e. the orders were replaced,
+        or when a joined dimension was replaced or changed since, e.g. a store moved to another store type, which
+        moves its orders out of groups that no new order points to.
+
+        Returns:
+        str: 'full' or 'incremental', the kind of refresh done.
+        """
+        spec = SUMMARY_TABLES[summary_table]
+        group_columns = ', '.join(spec['group_by'])
+        select_list = ', '.join([f'{expression} AS {column}' for column, expression in spec['group_by'].items()] +
+                                [f'{expression} AS {column}' for column, expression in spec['aggregates'].items()])
+        aggregate_sql = (f'SELECT {select_list} FROM "{FACT_TABLE}" o {spec["joins"]} {{where}} '
+                         f'GROUP BY {", ".join(spec["group_by"].values())}')
+        insert_sql = f'INSERT INTO "{summary_table}" ({group_columns}, {", ".join(spec["aggregates"])}) {aggregate_sql}'
+
+        row = connection.execute(text(f'SELECT refreshed_at FROM "{REFRESH_TABLE}" WHERE summary_table = :summary_table'),
+                                 {'summary_table': summary_table}).first()
+        since = row[0] if row else None
+        if since is not None and not full:
+            oldest_load = connection.execute(text(f'SELECT MIN("{LOAD_TIMESTAMP_COLUMN}") FROM "{FACT_TABLE}"')).scalar()
+            full = (oldest_load is not None and oldest_load > since) or self._dimensions_changed(connection, spec['dimensions'], since)
+
+        if since is None or full:
+            connection.execute(text(f'TRUNCATE "{summary_table}"'))
+            connection.execute(text(insert_sql.format(where='')))
+            kind = 'full'
+        else:
+            new_orders = f'WHERE o."{LOAD_TIMESTAMP_COLUMN}" > :since'
+            connection.execute(text(f'CREATE TEMP TABLE _affected_groups ON COMMIT DROP AS '
+                                    f'SELECT DISTINCT {", ".join(f"{expression} AS {column}" for column, expression in spec["group_by"].items())} '
+                                    f'FROM "{FACT_TABLE}" o {spec["joins"]} {new_orders}'),
+                               {'since': since})
+            # IS NOT DISTINCT FROM also matches the groups of orders without a dimension row, whose grain is NULL
+            matches = ' AND '.join(f'a.{column} IS NOT DISTINCT FROM {expression}' for column, expression in spec['group_by'].items())
+            connection.execute(text(f'DELETE FROM "{summary_table}" s USING _affected_groups a WHERE ' +
+                                    ' AND '.join(f'a.{column} IS NOT DISTINCT FROM s.{column}' for column in spec['group_by'])))
+            connection.execute(text(insert_sql.format(where=f'WHERE EXISTS (SELECT 1 FROM _affected_groups a WHERE {matches})')))
+            kind = 'incremental'
+
+        # The refresh time is the start of this transaction, so run it after the loads rather than concurrently with them
+        connection.execute(text(f'INSERT INTO "{REFRESH_TABLE}" (summary_table, refreshed_at) VALUES (:summary_table, NOW()) '
+                                'ON CONFLICT (summary_table) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at'),
+                           {'summary_table': summary_table})
+        return kind
+
+    def _column_types(self, connection, table_name):
+        """
+        Return the SQL type of every column of a table, e.g. {'year': 'smallint'}, or an empty dictionary if it does not exist.
+        """
+        rows = connection.execute(text('SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute '
+                                       'WHERE attrelid = to_regclass(:table_name) AND attnum > 0 AND NOT attisdropped '
+                                       'ORDER BY attnum'), {'table_name': table_name})
+        return dict(rows.fetchall())
+
+    def refresh_summaries(self, full=False):
+        """
+        Create the summary tables if they do not exist and refresh them from the orders loaded since their last refresh.
+        A summary table whose columns differ from SUMMARY_TABLES is recreated and rebuilt.
+
+        Parameters:
+        full (bool): Rebuild every summary table from all orders. Defaults to False.
+
+        Returns:
+        dict: A dictionary mapping each summary table to 'full' or 'incremental', the kind of refresh done.
+        """
+        refreshes = {}
+        with self.engine.begin() as connection:
+            connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{REFRESH_TABLE}" '
+                                    '(summary_table TEXT PRIMARY KEY, refreshed_at TIMESTAMPTZ NOT NULL)'))
+        for summary_table, spec in SUMMARY_TABLES.items():
+            columns = ', '.join(f'{column} {sql_type}' for column, sql_type in spec['columns'].items())
+            with self.engine.begin() as connection:
+                existing_types = self._column_types(connection, summary_table)
+                if existing_types:
+                    connection.execute(text(f'CREATE TEMP TABLE _expected_columns ({columns}) ON COMMIT DROP'))
+                    if existing_types != self._column_types(connection, '_expected_columns'):
+                        # The table was created with other columns, e.g. the years as text before they were integers
+                        connection.execute(text(f'DROP TABLE "{summary_table}"'))
+                        existing_types = {}
+                created = not existing_types
+                connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{summary_table}" ({columns})'))
+                if created:
+                    connection.execute(text(f'CREATE INDEX "{summary_table}_grain_idx" ON "{summary_table}" ({", ".join(spec["group_by"])})'))
+                refreshes[summary_table] = self._refresh_summary(connection, summary_table, full or created)
+        return refreshes
+
+    def _read_query(self, sql, repeat):
+        """
+        Run a query repeat times and return its result with the fastest time in seconds.
+        """
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with self.engine.connect() as connection:
+                result_df = pd.read_sql(text(sql), connection)
+            times.append(time.perf_counter() - start)
+        return result_df, min(times)
+
+    def time_queries(self, repeat=3, milestone_path='milestone_4.sql'):
+        """
+        Time every milestone_4.sql query that joins the orders against the base tables and against the summary
+        tables, and check that both return the same result.
+
+        Parameters:
+        repeat (int): The number of runs of each query, of which the fastest is kept. Defaults to 3.
+        milestone_path (str): The path of the milestone SQL file. Defaults to 'milestone_4.sql'.
+
+        Returns:
+        pandas.DataFrame: One row per query with its time before and after, the speedup and whether the results match.
+        """
+        milestone_queries = read_milestone_queries(milestone_path)
+        rows = []
+        for query, summary_sql in SUMMARY_QUERIES.items():
+            before_df, before_seconds = self._read_query(milestone_queries[query], repeat)
+            after_df, after_seconds = self._read_query(summary_sql, repeat)
+            try:
+                pd.testing.assert_frame_equal(before_df.reset_index(drop=True), after_df.reset_index(drop=True),
+                                              check_dtype=False, check_exact=False, rtol=1e-9)
+                results_match = True
+            except AssertionError:
+                results_match = False
+            rows.append({'query': query, 'before_seconds': before_seconds, 'after_seconds': after_seconds,
+                         'speedup': before_seconds / after_seconds if after_seconds else None, 'results_match': results_match})
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from database_utils import DatabaseConnector
+
+    parser = argparse.ArgumentParser(description='Create the keys and summary tables of the milestone_4.sql reports and time the queries before and after.')
+    parser.add_argument('--full', action='store_true', help='Rebuild the summary tables from all orders.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of runs of each query. Defaults to 3.')
+    args = parser.parse_args()
+
+    report_builder = ReportBuilder(DatabaseConnector(db_creds='db_creds.yml'))
+    for name, status in report_builder.create_constraints().items():
+        print(f"{name}: {status}")
+    for summary_table, kind in report_builder.refresh_summaries(full=args.full).items():
+        print(f"Refreshed {summary_table} ({kind}).")
+    print(report_builder.time_queries(repeat=args.repeat).to_string(index=False))
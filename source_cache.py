@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import pandas as pd
+
+def write_parquet(df, path, compression='snappy'):
+    """
+    Write a DataFrame as Parquet, storing object columns holding mixed types (e.g. card numbers
+    parsed as both integers and strings) as strings.
+
+    Parameters:
+    df (pandas.DataFrame): The DataFrame to write.
+    path (str): The path of the Parquet file.
+    compression (str): The Parquet compression codec. Defaults to 'snappy'.
+    """
+    mixed_columns = [column for column in df.columns
+                     if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')]
+    if mixed_columns:
+        df = df.copy()
+        for column in mixed_columns:
+            df[column] = df[column].astype('string')
+    df.to_parquet(path, index=False, compression=compression)
+
+
+class HashingReader:
+    def __init__(self, stream):
+        """
+        Wrap a readable stream, e.g. an S3 object body, computing the SHA-256 hash of the bytes read through it,
+        so that content parsed while it streams can be cached under the same hash as SourceCache.content_hash.
+
+        Parameters:
+        stream (file-like): The stream to read from.
+        """
+        self.stream = stream
+        self.closed = False
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read() if size is None or size < 0 else self.stream.read(size)
+        self._sha256.update(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            close()
+        self.closed = True
+
+    def hexdigest(self):
+        """
+        Return the SHA-256 hex digest of the bytes read so far.
+        """
+        return self._sha256.hexdigest()
+
+
+class SourceCache:
+    def __init__(self, cache_dir='.source_cache', max_size_bytes=1024 ** 3):
+        """
+        Initialise an on-disk cache of the parsed remote sources (PDF, JSON, S3 CSV).
+
+        Every URL is mapped to the ETag and Last-Modified validators of its last download and to
+        the SHA-256 hash of its raw content. The parsed DataFrame is stored as Parquet under that
+        content hash, so an unchanged source is loaded without being downloaded or parsed again.
+
+        Parameters:
+        cache_dir (str): The directory holding the cache. Defaults to '.source_cache'.
+        max_size_bytes (int): The total size of the Parquet files above which the least recently
+                              used entries are evicted. Defaults to 1 GiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _read_index(self):
+        """
+        Read the cache index from disk.
+
+        Returns:
+        dict: A dictionary mapping each URL to its validators, content hash, size and last access time.
+        """
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, 'r') as file:
+            return json.load(file)
+
+    def _write_index(self, index):
+        """
+        Atomically write the cache index to disk.
+
+        Parameters:
+        index (dict): The cache index.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(index, file)
+        os.replace(tmp_path, self.index_path)
+
+    def _parquet_path(self, content_hash):
+        """
+        Return the path of the Parquet file holding the parsed content with the given hash.
+        """
+        return os.path.join(self.cache_dir, f'{content_hash}.parquet')
+
+    @staticmethod
+    def content_hash(content):
+        """
+        Return the SHA-256 hex digest of raw downloaded content.
+
+        Parameters:
+        content (bytes): The raw content.
+
+        Returns:
+        str: The hex digest.
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    def validators(self, url):
+        """
+        Get the stored validators of a URL, to be sent with a conditional request.
+
+        Parameters:
+        url (str): The URL of the source.
+
+        Returns:
+        dict: The 'etag' and 'last_modified' values, empty if the URL is not cached.
+        """
+        with self._lock:
+            entry = self._read_index().get(url)
+        if entry is None or not os.path.exists(self._parquet_path(entry['content_hash'])):
+            return {}
+        return {key: entry[key] for key in ('etag', 'last_modified') if entry.get(key)}
+
+    def load(self, url=None, content_hash=None):
+        """
+        Load a cached DataFrame by URL or by the hash of its raw content.
+
+        Parameters:
+        url (str): The URL of the source.
+        content_hash (str): The SHA-256 hash of the raw content, used instead of the URL.
+
+        Returns:
+        pandas.DataFrame: The cached DataFrame, or None if it is not cached.
+        """
+        with self._lock:
+            index = self._read_index()
+            if content_hash is None:
+                entry = index.get(url)
+                if entry is None:
+                    return None
+                content_hash = entry['content_hash']
+
+            path = self._parquet_path(content_hash)
+            if not os.path.exists(path):
+                return None
+
+            # Record the access for the LRU eviction
+            for entry in index.values():
+                if entry['content_hash'] == content_hash:
+                    entry['last_access'] = time.time()
+            self._write_index(index)
+
+        return pd.read_parquet(path)
+
+    def store(self, url, df, content_hash, etag=None, last_modified=None):
+        """
+        Store a parsed DataFrame for a URL and evict the least recently used entries if the cache is too large.
+
+        Parameters:
+        url (str): The URL of the source.
+        df (pandas.DataFrame): The parsed DataFrame.
+        content_hash (str): The SHA-256 hash of the raw content the DataFrame was parsed from.
+        etag (str): The ETag returned with the content.
+        last_modified (str): The Last-Modified header returned with the content.
+        """
+        path = self._parquet_path(content_hash)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            write_parquet(df, tmp_path)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            index = self._read_index()
+            index[url] = {
+                'content_hash': content_hash,
+                'etag': etag,
+                'last_modified': last_modified,
+                'size': os.path.getsize(path),
+                'last_access': time.time(),
+            }
+            self._evict(index)
+            self._write_index(index)
+
+    def _evict(self, index):
+        """
+        Remove the least recently used entries until the total size is below max_size_bytes.
+
+        Parameters:
+        index (dict): The cache index, updated in place.
+        """
+        sizes = {entry['content_hash']: entry['size'] for entry in index.values()}
+        total_size = sum(sizes.values())
+        for url, entry in sorted(index.items(), key=lambda item: item[1]['last_access']):
+            if total_size <= self.max_size_bytes:
+                break
+            del index[url]
+            content_hash = entry['content_hash']
+            # Several URLs may share the same content
+            if not any(other['content_hash'] == content_hash for other in index.values()):
+                total_size -= sizes[content_hash]
+                path = self._parquet_path(content_hash)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def invalidate(self, url=None):
+        """
+        Remove one URL from the cache, or every URL if none is given.
+
+        Parameters:
+        url (str): The URL of the source to invalidate. Defaults to all URLs.
+        """
+        with self._lock:
+            index = self._read_index()
+            urls = [url] if url is not None else list(index)
+            for key in urls:
+                entry = index.pop(key, None)
+                if entry is None:
+                    continue
+                content_hash = entry['content_hash']
+                if not any(other['content_hash'] == content_hash for other in index.values()):
+                    path = self._parquet_path(content_hash)
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._write_index(index)
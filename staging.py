@@ -0,0 +1,281 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+import pyarrow.parquet as pq
+from column_types import arrow_types_mapper
+from source_cache import write_parquet
+
+# The layers of a stage in the order they are produced. Rebuilding a layer invalidates the ones after it.
+STAGE_LAYERS = ('raw', 'cleaned', 'loaded')
+
+# Marker written once every part of a layer has been written
+COMPLETE_MARKER = '_SUCCESS'
+
+PART_NAME = re.compile(r'^part-(\d+)(?:\.parquet)?$')
+
+
+class StagingStore:
+    def __init__(self, staging_dir='.staging', run_id=None, compression='zstd', keep_runs=3):
+        """
+        Initialise a store for the raw and cleaned DataFrames of every pipeline stage.
+
+        Each stage is staged as compressed Parquet under staging_dir/run_id/<stage>/<layer>/, one part file per chunk,
+        e.g. one per orders chunk. Every part is written to a temporary file and renamed into place, and a layer
+        counts as complete only once its _SUCCESS marker has been written, so an interrupted run never leaves a
+        half-written layer behind. The 'loaded' layer holds no data, only the markers of the uploaded parts.
+
+        Parameters:
+        staging_dir (str): The directory holding the staged runs. Defaults to '.staging'.
+        run_id (str): The id of the run. Defaults to a new id, a timestamp followed by a random suffix.
+        compression (str): The Parquet compression codec. Defaults to 'zstd'.
+        keep_runs (int): The number of most recent runs kept, older runs are deleted. Defaults to 3.
+        """
+        self.staging_dir = staging_dir
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.run_dir = os.path.join(staging_dir, self.run_id)
+        self.compression = compression
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._prune(keep_runs)
+
+    @classmethod
+    def latest(cls, staging_dir='.staging', **kwargs):
+        """
+        Open the most recent run to resume it, or start a new run if there is none.
+
+        Parameters:
+        staging_dir (str): The directory holding the staged runs. Defaults to '.staging'.
+        **kwargs: The other arguments of StagingStore.
+
+        Returns:
+        StagingStore: The store of the most recent run.
+        """
+        runs = cls.list_runs(staging_dir)
+        return cls(staging_dir, run_id=runs[-1] if runs else None, **kwargs)
+
+    @staticmethod
+    def list_runs(staging_dir='.staging'):
+        """
+        List the staged runs, oldest first.
+
+        Parameters:
+        staging_dir (str): The directory holding the staged runs. Defaults to '.staging'.
+
+        Returns:
+        list: The run ids, which start with the time the run started.
+        """
+        if not os.path.isdir(staging_dir):
+            return []
+        return sorted(entry for entry in os.listdir(staging_dir) if os.path.isdir(os.path.join(staging_dir, entry)))
+
+    def _prune(self, keep_runs):
+        """
+        Delete the oldest runs other than this one, keeping keep_runs runs.
+        """
+        runs = [run_id for run_id in self.list_runs(self.staging_dir) if run_id != self.run_id]
+        for run_id in runs[:max(len(runs) - keep_runs + 1, 0)]:
+            shutil.rmtree(os.path.join(self.staging_dir, run_id), ignore_errors=True)
+
+    def _layer_dir(self, stage, layer):
+        """
+        Return the directory of a layer of a stage.
+        """
+        if layer not in STAGE_LAYERS:
+            raise ValueError(f"Unknown layer '{layer}', expected one of {STAGE_LAYERS}.")
+        return os.path.join(self.run_dir, stage, layer)
+
+    def _part_path(self, stage, layer, part):
+        """
+        Return the path of a part of a layer. The parts of the 'loaded' layer are empty markers.
+        """
+        suffix = '' if layer == 'loaded' else '.parquet'
+        return os.path.join(self._layer_dir(stage, layer), f'part-{part:05d}{suffix}')
+
+    def _clear(self, stage, layer):
+        """
+        Delete a layer of a stage and the layers after it, which were produced from it.
+        """
+        for later_layer in STAGE_LAYERS[STAGE_LAYERS.index(layer):]:
+            shutil.rmtree(self._layer_dir(stage, later_layer), ignore_errors=True)
+
+    def write(self, stage, layer, df, part=0):
+        """
+        Atomically write a DataFrame as one part of a layer.
+
+        Parameters:
+        stage (str): The name of the stage, e.g. 'orders'.
+        layer (str): 'raw' or 'cleaned'.
+        df (pandas.DataFrame): The DataFrame to stage.
+        part (int): The number of the part, e.g. the chunk number. Defaults to 0.
+        """
+        layer_dir = self._layer_dir(stage, layer)
+        os.makedirs(layer_dir, exist_ok=True)
+        # The leading dot hides the temporary file from Parquet dataset reads of the directory
+        fd, tmp_path = tempfile.mkstemp(dir=layer_dir, prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            write_parquet(df, tmp_path, compression=self.compression)
+            os.replace(tmp_path, self._part_path(stage, layer, part))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def commit(self, stage, layer):
+        """
+        Mark a layer as complete, recording its parts and number of rows.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): The name of the layer.
+        """
+        layer_dir = self._layer_dir(stage, layer)
+        os.makedirs(layer_dir, exist_ok=True)
+        parts = self.parts(stage, layer)
+        manifest = {'parts': parts, 'committed_at': datetime.now().isoformat()}
+        if layer != 'loaded':
+            manifest['rows'] = sum(pq.ParquetFile(self._part_path(stage, layer, part)).metadata.num_rows for part in parts)
+        fd, tmp_path = tempfile.mkstemp(dir=layer_dir, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, os.path.join(layer_dir, COMPLETE_MARKER))
+
+    def is_complete(self, stage, layer):
+        """
+        Check whether every part of a layer has been written.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): The name of the layer.
+
+        Returns:
+        bool: True once the layer has been committed.
+        """
+        return os.path.exists(os.path.join(self._layer_dir(stage, layer), COMPLETE_MARKER))
+
+    def parts(self, stage, layer):
+        """
+        List the numbers of the parts written to a layer.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): The name of the layer.
+
+        Returns:
+        list: The sorted part numbers.
+        """
+        layer_dir = self._layer_dir(stage, layer)
+        if not os.path.isdir(layer_dir):
+            return []
+        return sorted(int(match.group(1)) for match in map(PART_NAME.match, os.listdir(layer_dir)) if match)
+
+    def read(self, stage, layer, columns=None, part=None):
+        """
+        Read a layer, or one part of it, memory-mapping the Parquet files and reading only the requested columns.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): 'raw' or 'cleaned'.
+        columns (list): The columns to read. Defaults to all columns.
+        part (int): The part to read. Defaults to every part of the layer.
+
+        Returns:
+        pandas.DataFrame: The staged DataFrame. The cleaned layers keep their UUID and Arrow string types.
+        """
+        path = self._layer_dir(stage, layer) if part is None else self._part_path(stage, layer, part)
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas(types_mapper=arrow_types_mapper if layer == 'cleaned' else None)
+
+    def iter_parts(self, stage, layer, columns=None, parts=None):
+        """
+        Read the parts of a layer one at a time.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): 'raw' or 'cleaned'.
+        columns (list): The columns to read. Defaults to all columns.
+        parts (list): The part numbers to read. Defaults to every part of the layer.
+
+        Yields:
+        tuple: The part number and its DataFrame.
+        """
+        for part in self.parts(stage, layer) if parts is None else parts:
+            yield part, self.read(stage, layer, columns=columns, part=part)
+
+    def write_parts(self, stage, layer, chunks):
+        """
+        Stage a stream of chunks as they pass through, one part per chunk, and commit the layer once the
+        stream is exhausted. The layer and the layers after it are cleared first, as they belong to an older stream.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): 'raw' or 'cleaned'.
+        chunks (iterable): The DataFrame chunks, e.g. from DataExtractor.read_rds_table_chunks.
+
+        Yields:
+        tuple: The part number and its DataFrame.
+        """
+        self._clear(stage, layer)
+        for part, df in enumerate(chunks):
+            self.write(stage, layer, df, part=part)
+            yield part, df
+        self.commit(stage, layer)
+
+    def staged(self, stage, layer, build, part=None):
+        """
+        Return a layer from the store if it is complete, otherwise build it, stage it and return it.
+
+        Parameters:
+        stage (str): The name of the stage.
+        layer (str): 'raw' or 'cleaned'.
+        build (callable): The function returning the DataFrame of the layer, e.g. extracting or cleaning it.
+        part (int): Stage a single part of a chunked layer instead of the whole layer, e.g. a cleaned orders chunk.
+
+        Returns:
+        pandas.DataFrame: The staged DataFrame.
+        """
+        if part is not None:
+            if os.path.exists(self._part_path(stage, layer, part)):
+                return self.read(stage, layer, part=part)
+            df = build()
+            self.write(stage, layer, df, part=part)
+            return df
+
+        if self.is_complete(stage, layer):
+            return self.read(stage, layer)
+        df = build()
+        self._clear(stage, layer)
+        self.write(stage, layer, df)
+        self.commit(stage, layer)
+        return df
+
+    def mark_loaded(self, stage, part=None):
+        """
+        Record that a stage, or one part of it, has been uploaded, so that a resumed run does not upload it again.
+
+        Parameters:
+        stage (str): The name of the stage.
+        part (int): The uploaded part. Defaults to the whole stage.
+        """
+        if part is None:
+            self.commit(stage, 'loaded')
+            return
+        os.makedirs(self._layer_dir(stage, 'loaded'), exist_ok=True)
+        open(self._part_path(stage, 'loaded', part), 'w').close()
+
+    def is_loaded(self, stage, part=None):
+        """
+        Check whether a stage, or one part of it, has been uploaded.
+
+        Parameters:
+        stage (str): The name of the stage.
+        part (int): The part to check. Defaults to the whole stage.
+
+        Returns:
+        bool: True if it has been uploaded.
+        """
+        if part is None:
+            return self.is_complete(stage, 'loaded')
+        return os.path.exists(self._part_path(stage, 'loaded', part))
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import pandas as pd
+
+
+def details_hash(details):
+    """
+    Return the SHA-256 hex digest of the details of a store, independent of the order of their keys.
+
+    Parameters:
+    details (dict): The store details returned by the API.
+
+    Returns:
+    str: The hex digest.
+    """
+    return hashlib.sha256(json.dumps(details, sort_keys=True).encode()).hexdigest()
+
+
+class StoreSnapshot:
+    def __init__(self, path='.source_cache/store_snapshot.json', max_age_seconds=7 * 24 * 3600, retry_seconds=3600,
+                 max_retry_seconds=7 * 24 * 3600):
+        """
+        Initialise a local snapshot of the details of every store fetched from the store API.
+
+        Each store is kept with the hash of its details and the time it was fetched, so that a run only requests the
+        stores that are new or older than max_age_seconds, rather than every store. A store whose request fails, e.g.
+        a store number the API does not know, goes on a retry list and is requested again after an exponential backoff
+        of retry_seconds, doubled after every failure, instead of on every run.
+
+        Parameters:
+        path (str): The JSON file holding the snapshot. Defaults to '.source_cache/store_snapshot.json'.
+        max_age_seconds (float): The age after which a store is fetched again. Defaults to 7 days.
+        retry_seconds (float): The wait before a failed store is retried for the first time. Defaults to 1 hour.
+        max_retry_seconds (float): The longest wait between two retries. Defaults to 7 days.
+        """
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.stores = {}
+        self.retries = {}
+        self.last_refresh = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                snapshot = json.load(file)
+            # JSON object keys are strings, the store numbers are integers
+            self.stores = {int(number): entry for number, entry in snapshot.get('stores', {}).items()}
+            self.retries = {int(number): entry for number, entry in snapshot.get('retries', {}).items()}
+
+    def save(self):
+        """
+        Atomically write the snapshot to disk.
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'stores': self.stores, 'retries': self.retries}, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """
+        Forget every store and retry, so that the next run fetches every store.
+        """
+        self.stores = {}
+        self.retries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def due(self, store_numbers, now=None):
+        """
+        Select the stores to request: the new ones, the ones older than max_age_seconds and the failed ones whose
+        backoff has passed. The stores no longer among store_numbers, e.g. closed stores, are forgotten.
+
+        Parameters:
+        store_numbers (iterable): The store numbers listed by the API.
+        now (float): The current time as a UNIX timestamp. Defaults to time.time().
+
+        Returns:
+        list: The store numbers to request, in order.
+        """
+        now = time.time() if now is None else now
+        store_numbers = list(store_numbers)
+        listed = set(store_numbers)
+        self.stores = {number: entry for number, entry in self.stores.items() if number in listed}
+        self.retries = {number: entry for number, entry in self.retries.items() if number in listed}
+
+        due = []
+        for number in store_numbers:
+            if number in self.retries:
+                if self.retries[number]['next_attempt'] <= now:
+                    due.append(number)
+            elif number not in self.stores or now - self.stores[number]['fetched_at'] >= self.max_age_seconds:
+                due.append(number)
+        self.last_refresh = {'stores': len(store_numbers), 'requested': len(due), 'changed': 0, 'failed': 0}
+        return due
+
+    def record(self, store_number, details, now=None):
+        """
+        Record the details fetched for a store and take it off the retry list.
+
+        Parameters:
+        store_number (int): The store number.
+        details (dict): The store details returned by the API.
+        now (float): The time of the request as a UNIX timestamp. Defaults to time.time().
+
+        Returns:
+        bool: True if the store is new or its details changed since the last fetch.
+        """
+        now = time.time() if now is None else now
+        content_hash = details_hash(details)
+        previous = self.stores.get(store_number)
+        changed = previous is None or previous['hash'] != content_hash
+        self.stores[store_number] = {
+            'details': details,
+            'hash': content_hash,
+            'fetched_at': now,
+            'changed_at': now if changed else previous['changed_at'],
+        }
+        self.retries.pop(store_number, None)
+        if changed:
+            self.last_refresh['changed'] = self.last_refresh.get('changed', 0) + 1
+        return changed
+
+    def record_failure(self, store_number, error=None, now=None):
+        """
+        Put a store whose request failed on the retry list, doubling its backoff after every failure. The details
+        fetched before, if any, are kept until a request succeeds.
+
+        Parameters:
+        store_number (int): The store number.
+        error (str): The reason of the failure, e.g. 'http 404'. Defaults to None.
+        now (float): The time of the request as a UNIX timestamp. Defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        failures = self.retries.get(store_number, {}).get('failures', 0) + 1
+        backoff = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+        self.retries[store_number] = {'failures': failures, 'next_attempt': now + backoff, 'error': error}
+        self.last_refresh['failed'] = self.last_refresh.get('failed', 0) + 1
+
+    def to_frame(self):
+        """
+        Build the DataFrame of the stores in the snapshot, in store number order.
+
+        Returns:
+        pandas.DataFrame: One row per store, as returned by DataExtractor.retrieve_stores_data.
+        """
+        return pd.DataFrame([self.stores[number]['details'] for number in sorted(self.stores)])
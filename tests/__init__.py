@@ -0,0 +1,7 @@
+"""
+Tests of the pipeline against local stand-ins of the sources, shared with the benchmarks.
+
+Run them with:
+
+    python3 -m pytest tests
+"""
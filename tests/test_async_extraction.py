@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import pandas as pd
+import pytest
+import async_extraction
+from source_cache import SourceCache
+
+web = pytest.importorskip('aiohttp.web')
+
+STORE_COUNT = 30
+DATES = {
+    'timestamp': {str(i): f'{i % 24:02d}:00:00' for i in range(500)},
+    'month': {str(i): str(i % 12 + 1) for i in range(500)},
+    'year': {str(i): str(1993 + i % 30) for i in range(500)},
+    # Multi-byte characters, split across the chunks the body is decoded in
+    'time_period': {str(i): 'Évening' if i % 7 else 'Morning' for i in range(500)},
+}
+
+
+class StubServer:
+    def __init__(self):
+        """
+        An aiohttp server on its own event loop and thread, standing in for the store API and the date JSON.
+        """
+        self.failures = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency = 0.0
+        self.body = json.dumps(DATES, ensure_ascii=False).encode('utf-8')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _number_stores(self, request):
+        self.requests.append(request.path)
+        return web.json_response({'statusCode': 200, 'number_stores': STORE_COUNT})
+
+    async def _store_details(self, request):
+        self.requests.append(request.path)
+        store_number = int(request.match_info['store_number'])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        statuses = self.failures.get(store_number)
+        if statuses:
+            return web.Response(status=statuses.pop(0))
+        return web.json_response({'index': store_number, 'store_code': f'ST-{store_number:04d}'})
+
+    async def _date_details(self, request):
+        self.requests.append(request.path)
+        if request.headers.get('If-None-Match') == '"dates-v1"':
+            return web.Response(status=304, headers={'ETag': '"dates-v1"'})
+        return web.Response(body=self.body, content_type='application/json', charset='utf-8', headers={'ETag': '"dates-v1"'})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/prod/number_stores', self._number_stores)
+        app.router.add_get('/prod/store_details/{store_number}', self._store_details)
+        app.router.add_get('/date_details.json', self._date_details)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    def __enter__(self):
+        self._thread.start()
+        port = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        self.url = f'http://127.0.0.1:{port}'
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+@pytest.fixture
+def server():
+    with StubServer() as server:
+        yield server
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    extractor = async_extraction.AsyncDataExtractor(cache=SourceCache(str(tmp_path / 'cache')), api_key='test',
+                                                    max_connections_per_host=5, backoff_factor=0.01)
+    yield extractor
+    extractor.close()
+
+
+def retrieve_stores(server, extractor):
+    return extractor.retrieve_stores_data(f'{server.url}/prod/store_details/{{store_number}}', f'{server.url}/prod/number_stores')
+
+
+def test_stores_are_fetched_concurrently_in_order(server, extractor):
+    server.latency = 0.02
+    stores_df = retrieve_stores(server, extractor)
+
+    assert stores_df['index'].tolist() == list(range(STORE_COUNT))
+    # The connector bounds the requests in flight to one host
+    assert 1 < server.max_in_flight <= 5
+    assert extractor.errors == []
+
+
+def test_failed_stores_are_retried_or_recorded(server, extractor):
+    server.failures = {3: [503, 503], 7: [404], 9: [500] * 4}
+    stores_df = retrieve_stores(server, extractor)
+
+    assert 3 in stores_df['index'].tolist()
+    assert 7 not in stores_df['index'].tolist() and 9 not in stores_df['index'].tolist()
+    errors_df = extractor.error_summary().sort_values('url')
+    assert errors_df['status'].tolist() == [404, 500]
+    # A 404 is not retried, a 500 is retried three times
+    assert errors_df['attempts'].tolist() == [1, 4]
+
+
+def test_missing_number_of_stores_raises(server, extractor):
+    with pytest.raises(async_extraction.ExtractionError):
+        extractor.list_number_of_stores(f'{server.url}/prod/missing')
+
+
+def test_json_is_decoded_while_streamed(server, extractor, monkeypatch):
+    # Chunks small enough to split the members and the multi-byte characters
+    monkeypatch.setattr(async_extraction, 'CHUNK_SIZE', 7)
+    df = extractor.extract_json_data(f'{server.url}/date_details.json', use_cache=False)
+
+    expected_df = pd.DataFrame(DATES)
+    assert df.columns.tolist() == expected_df.columns.tolist()
+    assert df.reset_index(drop=True).astype(str).equals(expected_df.reset_index(drop=True).astype(str))
+
+
+def test_unchanged_json_is_loaded_from_cache(server, extractor):
+    url = f'{server.url}/date_details.json'
+    first_df = extractor.extract_json_data(url)
+    second_df = extractor.extract_json_data(url)
+
+    assert server.requests == ['/date_details.json', '/date_details.json']
+    assert extractor.cache.validators(url) == {'etag': '"dates-v1"'}
+    assert second_df.reset_index(drop=True).equals(first_df.reset_index(drop=True))
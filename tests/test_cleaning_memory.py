@@ -0,0 +1,43 @@
+import tracemalloc
+import pytest
+from benchmarks.generators import generate_cards, generate_dates, generate_orders, generate_products, generate_stores, generate_users
+from column_types import memory_usage
+from data_cleaning import DataCleaning
+
+ROWS = 20000
+
+
+@pytest.fixture(scope='module')
+def users_df():
+    return generate_users(ROWS, seed=0)
+
+
+@pytest.fixture(scope='module')
+def orders_df(users_df):
+    return next(generate_orders(ROWS, users_df, generate_cards(2000, seed=0), generate_stores(50, seed=0),
+                                generate_products(200, seed=0), generate_dates(ROWS, seed=0), seed=0))
+
+
+def peak_allocated_bytes(func, *args):
+    """
+    Return the peak memory allocated by a call, as traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# The cleaners select the surviving rows once and convert the columns in place, so their peak stays
+# well below a copy of the input, whose size includes its Python strings
+@pytest.mark.parametrize('cleaner_name, source, max_ratio', [
+    ('clean_user_data', 'users_df', 0.5),
+    ('clean_orders_data', 'orders_df', 1.0),
+])
+def test_cleaning_peak_memory_stays_below_input_size(cleaner_name, source, max_ratio, request):
+    df = request.getfixturevalue(source)
+    peak = peak_allocated_bytes(getattr(DataCleaning(), cleaner_name), df)
+
+    assert peak < max_ratio * memory_usage(df)
@@ -0,0 +1,47 @@
+import pandas as pd
+from column_types import uuid_bytes_to_strings
+from data_cleaning import DataCleaning
+
+DATE_UUID = '83dc0a69-f96f-4c34-bcb7-928acae19a94'
+USER_UUID = '93caf182-e4e9-4c6e-bebb-60a1a9dcf9b8'
+
+
+def orders(date_uuids, user_uuids):
+    return pd.DataFrame({
+        'level_0': range(len(date_uuids)),
+        'index': range(len(date_uuids)),
+        'date_uuid': date_uuids,
+        'first_name': None,
+        'last_name': None,
+        'user_uuid': user_uuids,
+        'card_number': '4971858637664481',
+        'store_code': 'BL-8387506C',
+        'product_code': 'R7-3126933h',
+        '1': None,
+        'product_quantity': 3,
+    })
+
+
+def test_malformed_uuids_are_quarantined():
+    orders_df = orders([DATE_UUID, 'not-a-uuid', DATE_UUID.upper(), DATE_UUID],
+                       [USER_UUID, USER_UUID, USER_UUID.replace('-', ''), USER_UUID[:-1] + 'g'])
+    data_cleaning = DataCleaning()
+    cleaned_df = data_cleaning.clean_orders_data(orders_df)
+
+    # Upper case and unhyphenated UUIDs are valid
+    assert uuid_bytes_to_strings(cleaned_df['date_uuid']).tolist() == [DATE_UUID, DATE_UUID]
+    assert uuid_bytes_to_strings(cleaned_df['user_uuid']).tolist() == [USER_UUID, USER_UUID]
+    report = data_cleaning.rejection_report['orders_table']
+    assert (report['rows_in'], report['rows_out']) == (4, 2)
+    assert report['rules'] == {'null_values': 0, 'invalid_date_uuid': 1, 'invalid_user_uuid': 1}
+
+
+def test_memory_report_adds_up_across_chunks():
+    data_cleaning = DataCleaning()
+    data_cleaning.clean_orders_data(orders([DATE_UUID] * 10, [USER_UUID] * 10))
+    one_chunk = dict(data_cleaning.memory_report['orders_table'])
+    data_cleaning.clean_orders_data(orders([DATE_UUID] * 10, [USER_UUID] * 10))
+
+    # The memory before conversion is measured on the UUID strings
+    assert one_chunk['before'] > one_chunk['after']
+    assert data_cleaning.memory_report['orders_table'] == {'before': 2 * one_chunk['before'], 'after': 2 * one_chunk['after']}
@@ -0,0 +1,73 @@
+import warnings
+import numpy as np
+import pandas as pd
+from data_cleaning import DataCleaning
+from validation_rules import build_timestamps, parse_dates
+
+
+def test_dates_are_parsed_with_explicit_formats_only():
+    dates = pd.Series(['1968-10-16', '1971 October 14', 'January 2006 12', '2005/07/20', '16 Oct 1968', 'NULL', None])
+    parsed = parse_dates(dates, 'dim_store_details', 'opening_date')
+
+    assert parsed.dt.strftime('%Y-%m-%d').tolist()[:4] == ['1968-10-16', '1971-10-14', '2006-01-12', '2005-07-20']
+    # A layout none of the formats match is not guessed at
+    assert parsed[4:].isna().all()
+
+
+def test_sale_times_are_parsed_without_guessing():
+    dates_df = pd.DataFrame({
+        'timestamp': ['22:00:56', '09:01:03', '7:3:1'],
+        'month': ['9', '2', '11'],
+        'year': ['2012', '1997', '1994'],
+        'day': ['19', '10', '3'],
+        'time_period': ['Evening', 'Morning', 'Midday'],
+        'date_uuid': ['3b7ca996-37f9-433f-b6d0-ce8391b615ad', 'adc86836-6c35-49ca-bb0d-65b6507a00fa',
+                      '5ff791bf-d8e0-4f86-8ceb-c7b60bef9b31'],
+    })
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        cleaned_df = DataCleaning().clean_date_data(dates_df)
+
+    assert cleaned_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist() == [
+        '1900-01-01 22:00:56', '1900-01-01 09:01:03', '1900-01-01 07:03:01']
+
+
+def test_timestamps_are_built_from_their_parts():
+    years = pd.Series([2020, 1999, 2012, 1993])
+    months = pd.Series([2, 12, 1, 6])
+    days = pd.Series([29, 31, 1, 15])
+    hours = pd.Series([18, 22, 0, 12])
+
+    assert build_timestamps(years, months, days, hours).dt.strftime('%Y-%m-%d %H:%M').tolist() == [
+        '2020-02-29 18:00', '1999-12-31 22:00', '2012-01-01 00:00', '1993-06-15 12:00']
+
+
+def test_impossible_or_missing_parts_give_no_timestamp():
+    # Feb 29 in a non-leap year, Apr 31, month 13, month 0, a missing day, a missing hour and a fractional month
+    years = pd.Series([2021, 2019, 2012, 2012, 2001, 2003, 2004], index=range(10, 17))
+    months = pd.Series([2, 4, 13, 0, 5, 6, 2.5], index=years.index)
+    days = pd.Series([29, 31, 1, 1, np.nan, 4, 1], index=years.index)
+    hours = pd.Series([8, 8, 12, 12, 8, None, 8], index=years.index)
+    timestamps = build_timestamps(years, months, days, hours)
+
+    assert timestamps.isna().all()
+    assert timestamps.index.equals(years.index)
+
+
+def test_sale_dates_that_do_not_exist_are_rejected():
+    dates_df = pd.DataFrame({
+        'timestamp': ['22:00:56', '09:01:03', '12:00:00', '23:10:00'],
+        'month': ['2', '2', '13', '12'],
+        'year': ['2020', '2021', '2012', '1999'],
+        'day': ['29', '29', '1', '31'],
+        'time_period': ['Evening', 'Morning', 'Midday', 'Late_Hours'],
+        'date_uuid': ['3b7ca996-37f9-433f-b6d0-ce8391b615ad', 'adc86836-6c35-49ca-bb0d-65b6507a00fa',
+                      '5ff791bf-d8e0-4f86-8ceb-c7b60bef9b31', '83dc0a69-f96f-4c34-bcb7-928acae19a94'],
+    })
+    data_cleaning = DataCleaning()
+    cleaned_df = data_cleaning.clean_date_data(dates_df)
+
+    # The timestamp query 4.8 reads: the date of the sale at the hour its time period starts
+    assert cleaned_df['full_timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist() == ['2020-02-29 18:00:00', '1999-12-31 22:00:00']
+    assert cleaned_df[['year', 'month', 'day']].astype(int).values.tolist() == [[2020, 2, 29], [1999, 12, 31]]
+    assert data_cleaning.rejection_report['dim_date_times']['rules']['invalid_date'] == 2
@@ -0,0 +1,64 @@
+import time
+import pandas as pd
+import pytest
+from instrumentation import RunMetrics, instrumented, run_metrics
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = RunMetrics()
+    monkeypatch.setattr(run_metrics, 'records', metrics.records)
+    return metrics
+
+
+@instrumented
+def read_chunks(count, seconds):
+    for _ in range(count):
+        time.sleep(seconds)
+        yield pd.DataFrame({'value': range(10)})
+
+
+def test_generator_time_leaves_out_consumer(metrics):
+    for _ in read_chunks(3, 0.01):
+        # The consumer of each chunk takes much longer than producing it
+        time.sleep(0.05)
+
+    record, = metrics.records
+    assert record['rows'] == 30
+    assert 0.03 <= record['wall_time'] < 0.1
+    assert record['status'] == 'ok'
+
+
+def test_generator_closed_early_is_recorded(metrics):
+    chunks = read_chunks(3, 0)
+    next(chunks)
+    chunks.close()
+
+    record, = metrics.records
+    assert record['rows'] == 10
+
+
+def test_generator_error_is_recorded(metrics):
+    @instrumented
+    def failing_chunks():
+        yield pd.DataFrame({'value': [1]})
+        raise ValueError('lost connection')
+
+    with pytest.raises(ValueError):
+        list(failing_chunks())
+
+    record, = metrics.records
+    assert record['status'] == 'error'
+
+
+def test_rss_is_sampled_around_each_operation(metrics):
+    pytest.importorskip('resource')
+    with metrics.measure('allocate'):
+        data = bytearray(64 * 1024 ** 2)
+        data[::4096] = b'x' * len(data[::4096])
+
+    record, = metrics.records
+    if record['rss_before_bytes'] is None:
+        pytest.skip('/proc/self/statm is not available.')
+    assert record['rss_after_bytes'] - record['rss_before_bytes'] >= 32 * 1024 ** 2
+    assert 'pipeline_run_peak_rss_bytes' in metrics.to_prometheus()
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+import data_extraction
+from benchmarks.generators import cards_pdf, generate_cards
+from benchmarks.stand_ins import SourceServer
+from data_extraction import DataExtractor
+from source_cache import SourceCache
+
+pytest.importorskip('pdfplumber')
+
+CARD_COUNT = 120
+
+
+@pytest.fixture(scope='module')
+def cards_df():
+    return generate_cards(CARD_COUNT, seed=0)
+
+
+@pytest.fixture(scope='module')
+def pdf_content(cards_df):
+    # Six pages of 20 cards
+    return cards_pdf(cards_df, rows_per_page=20)
+
+
+def test_sharded_parse_matches_unsharded_parse(pdf_content, cards_df):
+    pytest.importorskip('pypdf')
+    extractor = DataExtractor()
+    unsharded_df = extractor._parse_pdf(pdf_content, backend='pdfplumber', max_workers=1)
+    sharded_df = extractor._parse_pdf(pdf_content, backend='pdfplumber', max_workers=3)
+
+    assert len(unsharded_df) == CARD_COUNT
+    assert unsharded_df['card_number'].tolist() == cards_df['card_number'].astype(str).tolist()
+    pd.testing.assert_frame_equal(sharded_df, unsharded_df)
+
+
+def test_every_page_is_parsed_without_page_count(pdf_content, monkeypatch):
+    # Without pypdf the pages are not counted, and the whole document is parsed in one call
+    monkeypatch.setattr(data_extraction, '_count_pdf_pages', lambda content: None)
+    df = DataExtractor()._parse_pdf(pdf_content, backend='pdfplumber', max_workers=4)
+
+    assert len(df) == CARD_COUNT
+
+
+def test_backends_are_cached_apart(pdf_content, tmp_path, monkeypatch):
+    parses = []
+
+    def parse_pdf(self, content, backend='tabula', max_workers=4):
+        parses.append(backend)
+        return pd.DataFrame({'backend': [backend]})
+
+    monkeypatch.setattr(DataExtractor, '_parse_pdf', parse_pdf)
+    extractor = DataExtractor(cache=SourceCache(str(tmp_path / 'cache')))
+    with SourceServer() as server:
+        server.add('/card_details.pdf', pdf_content, 'application/pdf')
+        url = f'{server.url}/card_details.pdf'
+        tabula_df = extractor.retrieve_pdf_data(url, backend='tabula')
+        pdfplumber_df = extractor.retrieve_pdf_data(url, backend='pdfplumber')
+        cached_df = extractor.retrieve_pdf_data(url, backend='pdfplumber')
+
+    assert parses == ['tabula', 'pdfplumber']
+    assert tabula_df['backend'].tolist() == ['tabula']
+    assert pdfplumber_df['backend'].tolist() == ['pdfplumber']
+    assert cached_df['backend'].tolist() == ['pdfplumber']
@@ -0,0 +1,111 @@
+import io
+import pandas as pd
+import pytest
+import data_extraction
+import source_cache
+from benchmarks.generators import generate_products
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor, PRODUCTS_CSV_DTYPES
+from quarantine import QuarantineStore
+from source_cache import SourceCache
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+BUCKET = 'data-handling-public'
+S3_ADDRESS = f's3://{BUCKET}/products.csv'
+PRODUCT_COUNT = 20000
+
+
+@pytest.fixture(scope='module')
+def products_csv():
+    buffer = io.StringIO()
+    generate_products(PRODUCT_COUNT, seed=0).to_csv(buffer)
+    return buffer.getvalue().encode('utf-8')
+
+
+@pytest.fixture
+def bucket(products_csv, monkeypatch):
+    for name, value in [('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'), ('AWS_DEFAULT_REGION', 'eu-west-1')]:
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('AWS_ENDPOINT_URL_S3', raising=False)
+    with moto.mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        s3.put_object(Bucket=BUCKET, Key='products.csv', Body=products_csv)
+        yield s3
+
+
+@pytest.fixture
+def read_sizes(monkeypatch):
+    sizes = []
+    read = source_cache.HashingReader.read
+
+    def recording_read(self, size=-1):
+        data = read(self, size)
+        sizes.append(len(data))
+        return data
+
+    monkeypatch.setattr(source_cache.HashingReader, 'read', recording_read)
+    return sizes
+
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_object_is_parsed_while_streamed(bucket, products_csv, read_sizes, engine, tmp_path, monkeypatch):
+    # Blocks smaller than the object, so that the Arrow reader streams it too
+    monkeypatch.setattr(data_extraction, 'CSV_BLOCK_SIZE', 256 * 1024)
+    extractor = DataExtractor(cache=SourceCache(str(tmp_path / 'cache')))
+    df = extractor.extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES, engine=engine, chunksize=1000)
+
+    assert len(df) == PRODUCT_COUNT
+    # The prices are kept as read, the cleaner parses them
+    expected_prices = generate_products(PRODUCT_COUNT, seed=0)['product_price']
+    assert df['product_price'].fillna('NULL').tolist() == expected_prices.fillna('NULL').tolist()
+    # The body is read in pieces, never as a whole
+    assert sum(read_sizes) == len(products_csv)
+    assert max(read_sizes) <= 1024 ** 2
+
+
+def test_engines_parse_the_same_rows(bucket):
+    c_df = DataExtractor().extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES, engine='c')
+    arrow_df = DataExtractor().extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES, engine='pyarrow')
+
+    assert arrow_df.columns.tolist() == c_df.columns.tolist()
+    assert arrow_df['product_price'].fillna('').tolist() == c_df['product_price'].fillna('').tolist()
+    assert arrow_df['product_code'].fillna('').tolist() == c_df['product_code'].fillna('').tolist()
+
+
+def test_unchanged_object_is_loaded_from_cache(bucket, tmp_path, monkeypatch):
+    parses = []
+    read_csv_stream = data_extraction._read_csv_stream
+
+    def counting_read_csv_stream(stream, **kwargs):
+        parses.append(1)
+        return read_csv_stream(stream, **kwargs)
+
+    monkeypatch.setattr(data_extraction, '_read_csv_stream', counting_read_csv_stream)
+    extractor = DataExtractor(cache=SourceCache(str(tmp_path / 'cache')))
+    first_df = extractor.extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES)
+    second_df = extractor.extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES)
+    assert len(parses) == 1
+    assert second_df['product_price'].fillna('').tolist() == first_df['product_price'].fillna('').tolist()
+
+    bucket.put_object(Bucket=BUCKET, Key='products.csv', Body=b'product_name,product_price\nTea,\xc2\xa31.50\n')
+    changed_df = extractor.extract_from_s3(S3_ADDRESS, dtype=PRODUCTS_CSV_DTYPES)
+    assert len(parses) == 2
+    assert changed_df['product_price'].tolist() == ['£1.50']
+
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_non_numeric_price_is_quarantined_as_read(bucket, engine, tmp_path):
+    products_df = generate_products(5, seed=0, dirty_fraction=0)
+    products_df.loc[2, 'product_price'] = '£12.5O'
+    bucket.put_object(Bucket=BUCKET, Key='products.csv', Body=products_df.to_csv().encode('utf-8'))
+    extracted_df = DataExtractor().extract_from_s3(S3_ADDRESS, use_cache=False, dtype=PRODUCTS_CSV_DTYPES, engine=engine)
+    quarantine = QuarantineStore(str(tmp_path / 'quarantine'))
+    cleaned_df = DataCleaning(quarantine=quarantine).clean_products_data(extracted_df)
+
+    assert len(cleaned_df) == 4
+    quarantined_df = quarantine.read('dim_products')
+    assert quarantined_df['rejection_rule'].tolist() == ['non_numeric_price']
+    assert quarantined_df['product_price'].tolist() == ['£12.5O']
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+import data_cleaning
+from benchmarks.generators import generate_cards, generate_dates, generate_orders, generate_products, generate_stores, generate_users
+from data_cleaning import CLEANER_TABLES, DataCleaning
+
+ROWS = 3000
+
+
+def sources():
+    users_df = generate_users(ROWS, seed=0)
+    cards_df = generate_cards(ROWS, seed=0)
+    stores_df = generate_stores(ROWS, seed=0)
+    products_df = generate_products(ROWS, seed=0)
+    dates_df = generate_dates(ROWS, seed=0)
+    orders_df = next(generate_orders(ROWS, users_df, cards_df, stores_df, products_df, dates_df, seed=0))
+    return {
+        'clean_user_data': (users_df, 'country'),
+        'clean_card_data': (cards_df, 'card_provider'),
+        'clean_store_data': (stores_df, 'store_type'),
+        'clean_products_data': (products_df, 'category'),
+        'clean_date_data': (dates_df, 'time_period'),
+        'clean_orders_data': (orders_df, 'store_code'),
+    }
+
+
+@pytest.fixture(scope='module')
+def sorted_sources():
+    """
+    Every source sorted on one of its categorical columns, so each shard sees different categories.
+    The cards and stores end with copies of their first rows, duplicates spanning the shards.
+    """
+    sorted_sources = {}
+    for cleaner_name, (df, column) in sources().items():
+        df = df.sort_values(column, kind='stable')
+        if cleaner_name in ('clean_card_data', 'clean_store_data'):
+            df = pd.concat([df, df.head(20)])
+        sorted_sources[cleaner_name] = df.reset_index(drop=True)
+    return sorted_sources
+
+
+@pytest.fixture(scope='module')
+def sharded_cleaning():
+    """
+    One DataCleaning for every sharded test, so the worker processes are spawned once. Each cleaner reports on its own table.
+    """
+    sharded_cleaning = DataCleaning()
+    yield sharded_cleaning
+    sharded_cleaning.close()
+
+
+@pytest.mark.parametrize('cleaner_name', list(sources()))
+def test_sharded_cleaning_matches_serial(sorted_sources, sharded_cleaning, cleaner_name):
+    df = sorted_sources[cleaner_name]
+    serial_cleaning = DataCleaning()
+    serial_df = getattr(serial_cleaning, cleaner_name)(df.copy())
+    sharded_df = sharded_cleaning.clean_sharded(cleaner_name, df.copy(), max_workers=3, min_rows_per_shard=len(df) // 3)
+
+    assert sharded_df.dtypes.to_dict() == serial_df.dtypes.to_dict()
+    assert sharded_df.equals(serial_df)
+    sharded_summary = sharded_cleaning.rejection_summary()
+    sharded_summary = sharded_summary[sharded_summary['table_name'] == CLEANER_TABLES[cleaner_name]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(sharded_summary, serial_cleaning.rejection_summary())
+
+
+def test_single_core_cleans_serially(sorted_sources, monkeypatch):
+    monkeypatch.setattr(data_cleaning.os, 'cpu_count', lambda: 1)
+    monkeypatch.setattr(data_cleaning, 'ProcessPoolExecutor', None)
+    df = sorted_sources['clean_orders_data']
+    cleaned_df = DataCleaning().clean_sharded('clean_orders_data', df, min_rows_per_shard=1)
+
+    assert cleaned_df.equals(DataCleaning().clean_orders_data(df))
+
+
+def test_worker_processes_are_spawned_once(sorted_sources, sharded_cleaning):
+    df = sorted_sources['clean_orders_data']
+    first_df = sharded_cleaning.clean_sharded('clean_orders_data', df, max_workers=3, min_rows_per_shard=len(df) // 3)
+    executor = sharded_cleaning._executor(3)
+    second_df = sharded_cleaning.clean_sharded('clean_orders_data', df, max_workers=3, min_rows_per_shard=len(df) // 3)
+
+    assert sharded_cleaning._executor(3) is executor
+    assert executor._mp_context.get_start_method() == 'spawn'
+    assert second_df.equals(first_df)
@@ -0,0 +1,128 @@
+import json
+import os
+import pandas as pd
+import pytest
+from benchmarks.stand_ins import SourceServer
+from data_extraction import DataExtractor
+from source_cache import SourceCache
+
+DATES = {'month': {'0': '1', '1': '2'}, 'year': {'0': '2020', '1': '2021'}, 'timestamp': {'0': '10:00:00', '1': '11:30:00'}}
+
+
+@pytest.fixture
+def json_server():
+    with SourceServer() as server:
+        server.add('/date_details.json', json.dumps(DATES).encode(), 'application/json')
+        yield server
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    return DataExtractor(cache=SourceCache(str(tmp_path / 'cache')))
+
+
+def cached_json(extractor, url, parses, use_cache=True):
+    """
+    Download and parse a JSON source through the cache, counting the parses.
+    """
+    def parse(content):
+        parses.append(url)
+        return pd.DataFrame(json.loads(content))
+
+    return extractor._cached_source(url, lambda validators: extractor._fetch_http(url, validators), parse, use_cache)
+
+
+def assert_same_rows(df, expected_df):
+    """
+    Assert that two DataFrames hold the same rows, as the cache keeps the rows of a source but not its index labels.
+    """
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected_df.reset_index(drop=True))
+
+
+def test_unchanged_source_is_not_parsed_again(json_server, extractor):
+    url = f'{json_server.url}/date_details.json'
+    parses = []
+    first_df = cached_json(extractor, url, parses)
+    second_df = cached_json(extractor, url, parses)
+
+    assert len(parses) == 1
+    # Both requests reach the server, the second one answered with a 304
+    assert json_server.request_count == 2
+    assert_same_rows(second_df, first_df)
+
+
+def test_extract_json_data_goes_through_cache(json_server, extractor):
+    url = f'{json_server.url}/date_details.json'
+    first_df = extractor.extract_json_data(url)
+    second_df = extractor.extract_json_data(url)
+
+    assert extractor.cache.validators(url)['etag']
+    assert first_df['timestamp'].tolist() == ['10:00:00', '11:30:00']
+    assert_same_rows(second_df, first_df)
+
+
+def test_changed_source_is_parsed_again(json_server, extractor):
+    url = f'{json_server.url}/date_details.json'
+    parses = []
+    cached_json(extractor, url, parses)
+    json_server.add('/date_details.json', json.dumps({'month': {'0': '12'}}).encode(), 'application/json')
+    df = cached_json(extractor, url, parses)
+
+    assert len(parses) == 2
+    assert df['month'].tolist() == ['12']
+
+
+def test_same_content_at_another_url_is_not_parsed_again(json_server, extractor):
+    json_server.add('/copy.json', json.dumps(DATES).encode(), 'application/json')
+    parses = []
+    cached_json(extractor, f'{json_server.url}/date_details.json', parses)
+    cached_json(extractor, f'{json_server.url}/copy.json', parses)
+
+    assert len(parses) == 1
+
+
+def test_bypassing_and_invalidating_cache(json_server, extractor):
+    url = f'{json_server.url}/date_details.json'
+    parses = []
+    cached_json(extractor, url, parses)
+    cached_json(extractor, url, parses, use_cache=False)
+    assert len(parses) == 2
+
+    extractor.cache.invalidate(url)
+    assert extractor.cache.validators(url) == {}
+    cached_json(extractor, url, parses)
+    assert len(parses) == 3
+
+
+def test_copy_evicted_after_not_modified_is_downloaded_again(json_server, extractor):
+    url = f'{json_server.url}/date_details.json'
+    parses = []
+    first_df = cached_json(extractor, url, parses)
+
+    def fetch_after_eviction(validators):
+        # The copy is evicted between reading its validators and loading it
+        if validators:
+            os.remove(extractor.cache._parquet_path(extractor.cache._read_index()[url]['content_hash']))
+        return extractor._fetch_http(url, validators)
+
+    df = extractor._cached_source(url, fetch_after_eviction, lambda content: pd.DataFrame(json.loads(content)))
+
+    # The 304, then the full download
+    assert json_server.request_count == 3
+    assert_same_rows(df, first_df)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SourceCache(str(tmp_path / 'cache'))
+    for number in range(3):
+        cache.store(f'http://source/{number}.json', pd.DataFrame({'value': [number]}), f'hash{number}')
+    size = cache._read_index()['http://source/0.json']['size']
+    cache.load('http://source/0.json')
+    cache.max_size_bytes = 2 * size
+    cache.store('http://source/3.json', pd.DataFrame({'value': [3]}), 'hash3')
+
+    # The entries read or stored last are kept
+    assert cache.load('http://source/0.json')['value'].tolist() == [0]
+    assert cache.load('http://source/3.json')['value'].tolist() == [3]
+    assert cache.load('http://source/1.json') is None
+    assert cache.load('http://source/2.json') is None
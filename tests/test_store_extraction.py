@@ -0,0 +1,65 @@
+import time
+import pytest
+from benchmarks.generators import generate_stores
+from benchmarks.stand_ins import SourceServer, serve_stores
+from data_extraction import DataExtractor
+
+STORE_COUNT = 40
+
+
+@pytest.fixture
+def store_api():
+    with SourceServer() as server:
+        serve_stores(server, generate_stores(STORE_COUNT, seed=0))
+        yield server
+
+
+def retrieve_stores(server, **kwargs):
+    return DataExtractor(api_key='test').retrieve_stores_data(f'{server.url}/prod/store_details/{{store_number}}',
+                                                              f'{server.url}/prod/number_stores', **kwargs)
+
+
+def test_concurrent_fetch_matches_serial_fetch(store_api):
+    serial_df = retrieve_stores(store_api, max_workers=1)
+    concurrent_df = retrieve_stores(store_api, max_workers=8)
+
+    assert len(serial_df) == STORE_COUNT
+    assert concurrent_df.equals(serial_df)
+
+
+def test_stores_keep_store_number_order(store_api):
+    # The responses arrive out of order when each one takes a while
+    store_api.latency = 0.01
+    stores_df = retrieve_stores(store_api, max_workers=8)
+
+    assert stores_df['index'].tolist() == list(range(STORE_COUNT))
+
+
+def test_server_errors_are_retried(store_api):
+    store_api.fail('/prod/store_details/3', times=2, status=503)
+    store_api.fail('/prod/store_details/7', times=1, status=429)
+    stores_df = retrieve_stores(store_api, max_workers=4, backoff_factor=0.01)
+
+    assert len(stores_df) == STORE_COUNT
+    # The number of stores, every store once and the three retries
+    assert store_api.request_count == 1 + STORE_COUNT + 3
+
+
+def test_missing_store_is_skipped(store_api):
+    del store_api.routes['/prod/store_details/5']
+    stores_df = retrieve_stores(store_api, max_workers=4)
+
+    assert stores_df['index'].tolist() == [number for number in range(STORE_COUNT) if number != 5]
+
+
+def test_concurrent_fetch_overlaps_round_trips(store_api):
+    store_api.latency = 0.02
+    start = time.perf_counter()
+    retrieve_stores(store_api, max_workers=1)
+    serial_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    retrieve_stores(store_api, max_workers=10)
+    concurrent_seconds = time.perf_counter() - start
+
+    assert serial_seconds > STORE_COUNT * 0.02
+    assert concurrent_seconds < serial_seconds / 3
@@ -0,0 +1,92 @@
+import json
+import pytest
+from benchmarks.generators import generate_stores
+from benchmarks.stand_ins import SourceServer, serve_stores
+from data_extraction import DataExtractor
+from store_snapshot import StoreSnapshot
+
+# As many stores as the real API, which numbers them from 0
+STORE_COUNT = 451
+# A store number the API stops knowing, e.g. a closed store
+MISSING_STORE = 17
+
+
+@pytest.fixture(scope='module')
+def stores_df():
+    return generate_stores(STORE_COUNT, seed=0)
+
+
+@pytest.fixture
+def store_api(stores_df):
+    with SourceServer() as server:
+        serve_stores(server, stores_df)
+        yield server
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return StoreSnapshot(str(tmp_path / 'store_snapshot.json'))
+
+
+def retrieve_stores(server, snapshot):
+    """
+    Fetch the stores through a snapshot and return them with the number of requests the API received.
+    """
+    request_count = server.request_count
+    stores_df = DataExtractor(api_key='test').retrieve_stores_data(f'{server.url}/prod/store_details/{{store_number}}',
+                                                                   f'{server.url}/prod/number_stores', snapshot=snapshot)
+    return stores_df, server.request_count - request_count
+
+
+def test_up_to_date_snapshot_makes_one_request(store_api, snapshot):
+    cold_df, cold_requests = retrieve_stores(store_api, snapshot)
+    warm_df, warm_requests = retrieve_stores(store_api, StoreSnapshot(snapshot.path))
+
+    assert cold_requests == 1 + STORE_COUNT
+    assert len(cold_df) == STORE_COUNT
+    assert snapshot.retries == {}
+    # Only the number of stores is requested
+    assert warm_requests == 1
+    assert warm_df.equals(cold_df)
+
+
+def test_stale_stores_are_requested_again(store_api, snapshot, stores_df):
+    retrieve_stores(store_api, snapshot)
+    for store_number in (5, 6, 7):
+        snapshot.stores[store_number]['fetched_at'] -= snapshot.max_age_seconds
+    store_df = stores_df.iloc[[5]].astype(object)
+    changed_store, = store_df.where(store_df.notna(), None).assign(staff_numbers='99').to_dict('records')
+    store_api.add('/prod/store_details/5', json.dumps(changed_store).encode(), 'application/json')
+    stores_df, requests = retrieve_stores(store_api, snapshot)
+
+    assert requests == 1 + 3
+    assert snapshot.last_refresh == {'stores': STORE_COUNT, 'requested': 3, 'changed': 1, 'failed': 0}
+    assert stores_df.iloc[5]['staff_numbers'] == '99'
+
+
+def test_failed_store_is_retried_after_backoff(store_api, snapshot):
+    del store_api.routes[f'/prod/store_details/{MISSING_STORE}']
+    retrieve_stores(store_api, snapshot)
+    assert list(snapshot.retries) == [MISSING_STORE]
+    assert snapshot.retries[MISSING_STORE]['failures'] == 1
+
+    # Not requested again before its backoff has passed
+    _, requests = retrieve_stores(store_api, snapshot)
+    assert requests == 1
+
+    snapshot.retries[MISSING_STORE]['next_attempt'] -= snapshot.retry_seconds
+    _, requests = retrieve_stores(store_api, snapshot)
+    assert requests == 2
+    assert snapshot.retries[MISSING_STORE]['failures'] == 2
+
+
+def test_backoff_doubles_up_to_its_maximum(tmp_path):
+    snapshot = StoreSnapshot(str(tmp_path / 'store_snapshot.json'), retry_seconds=3600, max_retry_seconds=4 * 3600)
+    waits = []
+    for _ in range(5):
+        snapshot.record_failure(1, now=0)
+        waits.append(snapshot.retries[1]['next_attempt'])
+
+    assert waits == [3600, 2 * 3600, 4 * 3600, 4 * 3600, 4 * 3600]
+    assert snapshot.due([1], now=3599) == []
+    assert snapshot.due([1], now=4 * 3600) == [1]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_cleaning import DataCleaning
+
+OUNCE = 0.028349523125
+
+
+@pytest.mark.parametrize('weight, expected_kg', [
+    ('1kg', 1.0),
+    ('1.5kg', 1.5),
+    ('400g', 0.4),
+    ('400 g', 0.4),
+    ('77g .', 0.077),
+    ('0.45g', 0.00045),
+    ('500ml', 0.5),
+    ('1l', 1.0),
+    ('2.5L', 2.5),
+    ('16oz', 16 * OUNCE),
+    ('12 x 100g', 1.2),
+    ('3x2.5kg', 7.5),
+    ('2 x 0.5l', 1.0),
+    ('1.5', 1.5),
+    ('  250G  ', 0.25),
+    ('9GO5kg', np.nan),
+    ('kg', np.nan),
+    ('12 x', np.nan),
+    ('100lb', np.nan),
+    ('', np.nan),
+    (None, np.nan),
+])
+def test_parse_weights(weight, expected_kg):
+    parsed = DataCleaning().parse_weights(pd.Series([weight], dtype=object))
+
+    assert parsed.iloc[0] == pytest.approx(expected_kg, nan_ok=True)
+
+
+def test_invalid_weights_are_quarantined():
+    products_df = pd.DataFrame({
+        'product_name': ['Tea', 'Soup', 'Nails'],
+        'product_price': ['£1.50', '£2.00', '£3.25'],
+        'weight': ['40 x 2.5g', 'NULL', '500g'],
+        'category': ['food', 'food', 'diy'],
+        'EAN': ['1', '2', '3'],
+        'date_added': ['2018-01-01', '2019-02-02', '2020-03-03'],
+        'uuid': ['83dc0a69-f96f-4c34-bcb7-928acae19a94'] * 3,
+        'removed': ['Still_avaliable'] * 3,
+        'product_code': ['A1-1', 'B2-2', 'C3-3'],
+    })
+    data_cleaning = DataCleaning()
+    cleaned_df = data_cleaning.clean_products_data(products_df)
+
+    assert cleaned_df['product_code'].tolist() == ['A1-1', 'C3-3']
+    assert cleaned_df['weight'].tolist() == pytest.approx([0.1, 0.5])
+    assert data_cleaning.rejection_report['dim_products']['rules']['invalid_weight'] == 1
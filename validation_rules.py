@@ -0,0 +1,163 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Patterns compiled once at import and shared by every cleaning call
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+DIGIT_PATTERN = re.compile(r'\d')
+NON_DIGIT_PATTERN = re.compile(r'\D')
+PRICE_PATTERN = re.compile(r'\d+\.?\d*|\.\d+')
+
+# Date layouts found in the sources, e.g. '1968-10-16', '1971 October 14', 'January 2006 12' and '2005/07/20'.
+# Each format is tried in turn on the values the previous formats could not parse.
+DATE_FORMATS = ['%Y-%m-%d', '%Y %B %d', '%B %Y %d', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S']
+
+# The hour of the day each time period of a sale starts at, from which the timestamp of the sale is rebuilt
+TIME_PERIOD_HOURS = {'Morning': 8, 'Midday': 12, 'Evening': 18, 'Late_Hours': 22}
+
+# Validation rules of every column, declared once:
+# 'pattern' must match, 'forbidden_pattern' must not be found, 'date_formats' are tried in order,
+# 'allowed_values' lists the only values kept and 'strip_characters' are removed before a number is parsed.
+VALIDATION_RULES = {
+    'dim_users': {
+        'first_name': {'forbidden_pattern': DIGIT_PATTERN},
+        'last_name': {'forbidden_pattern': DIGIT_PATTERN},
+        'date_of_birth': {'date_formats': DATE_FORMATS},
+        'join_date': {'date_formats': DATE_FORMATS},
+        'user_uuid': {'pattern': UUID_PATTERN},
+    },
+    'dim_card_details': {
+        'expiry_date': {'date_formats': ['%m/%y']},
+        'date_payment_confirmed': {'date_formats': DATE_FORMATS},
+    },
+    'dim_store_details': {
+        'opening_date': {'date_formats': DATE_FORMATS},
+        'store_type': {'allowed_values': ['Local', 'Super Store', 'Mall Kiosk', 'Outlet', 'Web Portal']},
+    },
+    'dim_products': {
+        'product_price': {'pattern': PRICE_PATTERN, 'strip_characters': '£,'},
+        'date_added': {'date_formats': DATE_FORMATS},
+    },
+    'dim_date_times': {
+        'timestamp': {'date_formats': ['%H:%M:%S']},
+        'time_period': {'allowed_values': list(TIME_PERIOD_HOURS)},
+    },
+}
+
+
+def get_rule(table_name, column):
+    """
+    Get the validation rule declared for a column.
+
+    Parameters:
+    table_name (str): The name of the target table.
+    column (str): The name of the column.
+
+    Returns:
+    dict: The rule of the column.
+    """
+    return VALIDATION_RULES[table_name][column]
+
+
+def matches_pattern(series, table_name, column):
+    """
+    Check which values match the column's pattern.
+
+    Returns:
+    pandas.Series: Boolean mask, False for missing values.
+    """
+    return series.str.match(get_rule(table_name, column)['pattern'], na=False).astype(bool)
+
+
+def contains_forbidden_pattern(series, table_name, column):
+    """
+    Check which values contain the column's forbidden pattern.
+
+    Returns:
+    pandas.Series: Boolean mask, False for missing values.
+    """
+    return series.str.contains(get_rule(table_name, column)['forbidden_pattern'], na=False).astype(bool)
+
+
+def is_allowed_value(series, table_name, column):
+    """
+    Check which values are among the column's allowed values.
+
+    Returns:
+    pandas.Series: Boolean mask.
+    """
+    return series.isin(get_rule(table_name, column)['allowed_values'])
+
+
+def parse_dates(series, table_name, column):
+    """
+    Parse dates with the column's explicit formats, tried in order on the values still unparsed. Explicit formats
+    avoid pandas guessing the format from the first value and then failing every value written differently,
+    or parsing each value on its own with dateutil. A value matching none of the formats is not guessed at,
+    so the rules rejecting unparsed dates, e.g. invalid_opening_date, reject it.
+
+    Parameters:
+    series (pandas.Series): The date strings.
+    table_name (str): The name of the target table.
+    column (str): The name of the column.
+
+    Returns:
+    pandas.Series: The parsed datetimes, NaT where no format matches.
+    """
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    remaining = series.notna().to_numpy()
+    for date_format in get_rule(table_name, column)['date_formats']:
+        if not remaining.any():
+            return parsed
+        parsed[remaining] = pd.to_datetime(series[remaining], format=date_format, errors='coerce')
+        remaining &= parsed.isna().to_numpy()
+    return parsed
+
+
+def build_timestamps(years, months, days, hours):
+    """
+    Build timestamps from their year, month, day and hour with NumPy datetime arithmetic on whole columns,
+    instead of formatting a date string per row and parsing it again.
+
+    Parameters:
+    years, months, days, hours (pandas.Series): The numeric parts, NaN where missing.
+
+    Returns:
+    pandas.Series: The timestamps, NaT where a part is missing or not a whole number, or the date does not exist, e.g. 2021-02-30.
+    """
+    parts = np.column_stack([pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                             for series in (years, months, days, hours)])
+    year, month, day, hour = parts.T
+    # Years outside the range of nanosecond timestamps are rejected too
+    valid = ((parts == np.floor(parts)).all(axis=1) & (year >= 1678) & (year <= 2261) & (month >= 1) & (month <= 12)
+             & (day >= 1) & (day <= 31) & (hour >= 0) & (hour <= 23))
+    year, month, day, hour = parts[valid].astype(np.int64).T
+
+    first_days = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    dates = first_days.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    # A day past the end of its month rolls over into the next month
+    exists = dates.astype('datetime64[M]') == first_days
+
+    timestamps = np.full(len(parts), np.datetime64('NaT'), dtype='datetime64[ns]')
+    timestamps[np.flatnonzero(valid)[exists]] = dates[exists] + hour[exists].astype('timedelta64[h]')
+    return pd.Series(timestamps, index=years.index)
+
+
+def parse_prices(series, table_name, column):
+    """
+    Parse prices such as '£1,299.99' into floats: the column's strip characters are removed and the
+    rest must fully match its pattern, so values like '1e5' or 'inf' are not taken for prices.
+    The strings are handled as Arrow strings, whose vectorized regex kernels avoid a Python call per value.
+
+    Parameters:
+    series (pandas.Series): The price strings.
+    table_name (str): The name of the target table.
+    column (str): The name of the column.
+
+    Returns:
+    pandas.Series: The prices as floats, NaN where the value is not a price.
+    """
+    rule = get_rule(table_name, column)
+    prices = series.astype('string[pyarrow]').str.replace(f"[{re.escape(rule['strip_characters'])}]", '', regex=True).str.strip()
+    valid = prices.str.fullmatch(rule['pattern'].pattern).fillna(False).astype(bool)
+    return prices.where(valid).astype('float64')